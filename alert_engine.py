@@ -0,0 +1,173 @@
+"""Threshold rule engine that turns field readings into alerts.
+
+Every ``ALERT_CHECK_INTERVAL`` ms a background thread walks the fields
+in id-ordered batches, compares each batch's latest readings with the
+thresholds from ``config.py`` as NumPy vectors, drops anything that already
+has an open alert, and bulk-inserts the rest. Readings come straight from
+the in-memory field state when one is given, otherwise from SQLite.
+"""
+import logging
+import threading
+import time
+from datetime import datetime
+
+import numpy as np
+
+from field_state import NameView
+from forecast import latest_npk
+
+logger = logging.getLogger(__name__)
+
+# (alert_type, priority, metric, comparison, threshold key, message, recommendation)
+RULES = [
+    ('Low Soil Moisture', 'High', 'moisture', '<', 'SOIL_MOISTURE_THRESHOLD_LOW',
+     'Low soil moisture in {name}', 'Schedule irrigation to bring moisture above {threshold}%'),
+    ('Waterlogging Risk', 'Medium', 'moisture', '>', 'SOIL_MOISTURE_THRESHOLD_HIGH',
+     'Soil moisture too high in {name}', 'Pause irrigation and check field drainage'),
+    ('Low Temperature', 'Medium', 'temperature', '<', 'TEMPERATURE_MIN',
+     'Low temperature in {name}', 'Protect crops from cold stress'),
+    ('Heat Stress', 'High', 'temperature', '>', 'TEMPERATURE_MAX',
+     'High temperature in {name}', 'Irrigate early in the morning to reduce heat stress'),
+    ('Nutrient Deficiency', 'High', 'nitrogen', '<', 'NPK_NITROGEN_MIN',
+     'Low Nitrogen in {name}', 'Apply nitrogen fertilizer within 3 days'),
+    ('Nutrient Deficiency', 'High', 'phosphorus', '<', 'NPK_PHOSPHORUS_MIN',
+     'Low Phosphorus in {name}', 'Apply phosphate fertilizer within 3 days'),
+    ('Nutrient Deficiency', 'High', 'potassium', '<', 'NPK_POTASSIUM_MIN',
+     'Low Potassium in {name}', 'Apply potash fertilizer within 3 days'),
+]
+
+
+def evaluate_batch(ids, names, metrics, open_alerts, cfg, now):
+    """Return alert rows for one batch of fields.
+
+    ``metrics`` maps metric name to an array aligned with ``ids``; NaN
+    readings never trigger. ``open_alerts`` is a set of
+    (field_id, alert_type, message) already unresolved.
+    """
+    rows = []
+    for alert_type, priority, metric, op, key, message, recommendation in RULES:
+        values = metrics[metric]
+        threshold = cfg[key]
+        hits = np.flatnonzero(values < threshold if op == '<' else values > threshold)
+        for i in hits.tolist():
+            field_id = int(ids[i])
+            text = message.format(name=names[i])
+            if (field_id, alert_type, text) in open_alerts:
+                continue
+            rows.append((field_id, alert_type, text, recommendation.format(threshold=threshold), priority, now))
+    return rows
+
+
+class AlertEngine:
+    def __init__(self, connect, cfg, on_change=None, state=None):
+        self.connect = connect
+        self.state = state
+        self.cfg = cfg
+        self.on_change = on_change
+        self.interval = cfg['ALERT_CHECK_INTERVAL'] / 1000
+        self.batch_size = cfg['ALERT_BATCH_SIZE']
+        self._stop = threading.Event()
+        self._thread = None
+        self._cycle_lock = threading.Lock()
+        self.stats = {
+            'running': False,
+            'cycles': 0,
+            'last_run_at': None,
+            'last_cycle_seconds': None,
+            'max_cycle_seconds': 0.0,
+            'last_fields_evaluated': 0,
+            'last_alerts_created': 0,
+            'total_alerts_created': 0,
+            'last_error': None,
+        }
+
+    def run_cycle(self):
+        with self._cycle_lock:
+            start = time.perf_counter()
+            evaluated = created = 0
+            conn = self.connect()
+            try:
+                batches = self._state_batches() if self.state is not None else self._db_batches(conn)
+                for ids, names, metrics in batches:
+                    lo, hi = int(ids[0]), int(ids[-1])
+                    open_alerts = {tuple(a) for a in conn.execute(
+                        'SELECT field_id, alert_type, message FROM alerts WHERE resolved = 0 AND field_id BETWEEN ? AND ?',
+                        (lo, hi))}
+
+                    rows = evaluate_batch(ids, names, metrics, open_alerts, self.cfg, datetime.now())
+                    if rows:
+                        with conn:
+                            conn.executemany('INSERT INTO alerts (field_id, alert_type, message, recommendation, priority, created_at) VALUES (?, ?, ?, ?, ?, ?)',
+                                             rows)
+                    evaluated += len(ids)
+                    created += len(rows)
+            finally:
+                conn.close()
+
+            elapsed = time.perf_counter() - start
+            self.stats.update({
+                'cycles': self.stats['cycles'] + 1,
+                'last_run_at': datetime.now().isoformat(),
+                'last_cycle_seconds': round(elapsed, 4),
+                'max_cycle_seconds': round(max(self.stats['max_cycle_seconds'], elapsed), 4),
+                'last_fields_evaluated': evaluated,
+                'last_alerts_created': created,
+                'total_alerts_created': self.stats['total_alerts_created'] + created,
+            })
+            if created and self.on_change:
+                self.on_change('alerts')
+            return created
+
+    def _db_batches(self, conn):
+        last_id = -1
+        while True:
+            batch = conn.execute('SELECT id, name, soil_moisture, temperature FROM fields WHERE id > ? ORDER BY id LIMIT ?',
+                                 (last_id, self.batch_size)).fetchall()
+            if not batch:
+                return
+            ids = np.array([r[0] for r in batch], dtype=np.int64)
+            lo, hi = int(ids[0]), int(ids[-1])
+            last_id = hi
+
+            npk = latest_npk(conn, ids, 'WHERE field_id BETWEEN ? AND ?', (lo, hi))
+            yield ids, [r[1] for r in batch], {
+                'moisture': np.array([r[2] for r in batch], dtype=np.float64),
+                'temperature': np.array([r[3] for r in batch], dtype=np.float64),
+                'nitrogen': npk[:, 0],
+                'phosphorus': npk[:, 1],
+                'potassium': npk[:, 2],
+            }
+
+    def _state_batches(self):
+        self.state.maybe_resync(self.connect)
+        cols = self.state.snapshot()
+        for start in range(0, len(cols.ids), self.batch_size):
+            window = slice(start, start + self.batch_size)
+            yield cols.ids[window], NameView(cols, start), {
+                metric: cols.numeric[metric][window]
+                for metric in ('moisture', 'temperature', 'nitrogen', 'phosphorus', 'potassium')
+            }
+
+    def _loop(self):
+        while not self._stop.is_set():
+            try:
+                self.run_cycle()
+                self.stats['last_error'] = None
+            except Exception as e:
+                logger.exception('Alert evaluation cycle failed')
+                self.stats['last_error'] = str(e)
+            self._stop.wait(self.interval)
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name='alert-engine', daemon=True)
+        self._thread.start()
+        self.stats['running'] = True
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        self.stats['running'] = False
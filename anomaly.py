@@ -0,0 +1,315 @@
+"""Streaming anomaly detection on incoming sensor readings.
+
+Each (field, metric) pair keeps five numbers, however many readings
+arrive:
+
+* the reading count;
+* an EWMA mean and variance;
+* an EWMA of the absolute deviation;
+* the current run of anomalous readings.
+
+A reading is scored with a robust z-score: its deviation from the mean over
+``MAD_TO_SIGMA x`` the mean absolute deviation, which is floored at
+``MIN_SCALE`` so a very steady sensor does not flag every small change. Once
+``ANOMALY_WARMUP`` readings have been seen, a reading is flagged if its
+|z| exceeds ``ANOMALY_Z_THRESHOLD``. The statistics are updated with the
+deviation clipped to ``ANOMALY_Z_CLIP`` scales, so one bad probe value
+barely moves the baseline. The baseline still follows a genuine level
+shift over time.
+
+Flags are returned inline to the ingesting request. When a metric stays
+anomalous for ``ANOMALY_SUSTAIN`` readings in a row, one 'Sensor Anomaly'
+alert is raised. State is held column-wise in NumPy arrays and
+checkpointed to ``anomaly_state`` every ``ANOMALY_CHECKPOINT_INTERVAL``
+ms (dirty rows only) and on stop. A restart reloads the checkpoint instead
+of replaying history.
+
+Under serve.py each worker sees only the readings it serves, so its
+detector's state covers that share.
+"""
+import logging
+import threading
+import time
+from datetime import datetime
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Detector metric -> key in POST bodies and ingest readings.
+METRICS = ('moisture', 'temperature', 'nitrogen', 'phosphorus', 'potassium')
+READING_KEYS = ('soil_moisture', 'temperature', 'nitrogen', 'phosphorus', 'potassium')
+LABELS = ('soil moisture', 'temperature', 'nitrogen', 'phosphorus', 'potassium')
+
+# Smallest deviation scale per metric (% moisture, degrees C, NPK units).
+MIN_SCALE = np.array([2.0, 1.0, 3.0, 3.0, 3.0])
+# Mean absolute deviation to standard deviation for normal data.
+MAD_TO_SIGMA = 1.2533
+
+SCHEMA = [
+    '''CREATE TABLE IF NOT EXISTS anomaly_state
+       (field_id INTEGER NOT NULL, metric TEXT NOT NULL, n INTEGER NOT NULL, mean REAL, var REAL, mad REAL,
+        streak INTEGER NOT NULL DEFAULT 0, PRIMARY KEY (field_id, metric)) WITHOUT ROWID''',
+]
+
+
+def reading_values(readings):
+    """(len(readings), len(METRICS)) array of the metrics in each reading, NaN where absent or not a number."""
+    return np.array([[float(v) if isinstance(v, (int, float)) and not isinstance(v, bool) else np.nan
+                      for v in map(r.get, READING_KEYS)] for r in readings],
+                    dtype=np.float64).reshape(len(readings), len(METRICS))
+
+
+class AnomalyDetector:
+    def __init__(self, connect, cfg):
+        self.connect = connect
+        self.alpha = cfg['ANOMALY_ALPHA']
+        self.z_threshold = cfg['ANOMALY_Z_THRESHOLD']
+        self.z_clip = cfg['ANOMALY_Z_CLIP']
+        self.warmup = cfg['ANOMALY_WARMUP']
+        self.sustain = cfg['ANOMALY_SUSTAIN']
+        self.interval = cfg['ANOMALY_CHECKPOINT_INTERVAL'] / 1000
+        self._lock = threading.Lock()
+        self._checkpoint_lock = threading.Lock()
+        self._loaded = False
+        self._index = {}   # field_id -> row; the arrays below have spare rows past len(_index)
+        self._ids = np.empty(0, dtype=np.int64)
+        self._n = np.empty((0, len(METRICS)), dtype=np.int64)
+        self._mean = np.empty((0, len(METRICS)))
+        self._var = np.empty((0, len(METRICS)))
+        self._mad = np.empty((0, len(METRICS)))
+        self._streak = np.empty((0, len(METRICS)), dtype=np.int64)
+        self._dirty = set()
+        self._stop = threading.Event()
+        self._thread = None
+        self.stats = {
+            'running': False,
+            'fields': 0,
+            'readings': 0,
+            'flagged': 0,
+            'sustained': 0,
+            'checkpoints': 0,
+            'last_checkpoint_rows': 0,
+            'last_checkpoint_seconds': None,
+            'last_error': None,
+        }
+
+    def _ensure_loaded(self):
+        if self._loaded:
+            return
+        conn = self.connect()
+        try:
+            rows = conn.execute('SELECT field_id, metric, n, mean, var, mad, streak FROM anomaly_state').fetchall()
+        finally:
+            conn.close()
+        column = {metric: j for j, metric in enumerate(METRICS)}
+        rows = [r for r in rows if r[1] in column]
+        if rows:
+            i = self._rows([r[0] for r in rows])
+            j = np.array([column[r[1]] for r in rows])
+            self._n[i, j] = [r[2] for r in rows]
+            self._mean[i, j] = [r[3] or 0.0 for r in rows]
+            self._var[i, j] = [r[4] or 0.0 for r in rows]
+            self._mad[i, j] = [r[5] or 0.0 for r in rows]
+            self._streak[i, j] = [r[6] for r in rows]
+        self._loaded = True
+
+    def _rows(self, field_ids):
+        """Row of each field id, adding rows for fields not seen before."""
+        rows = np.empty(len(field_ids), dtype=np.int64)
+        new = {}
+        for k, field_id in enumerate(field_ids):
+            # Checked before any state changes, so a bad id cannot leave
+            # the index and the arrays out of step.
+            if not isinstance(field_id, (int, np.integer)) or isinstance(field_id, bool):
+                raise TypeError(f'field_id must be an integer, not {field_id!r}')
+            row = self._index.get(field_id)
+            if row is None:
+                row = new.setdefault(int(field_id), len(self._index) + len(new))
+            rows[k] = row
+        if new:
+            size = len(self._index)
+            self._grow(size + len(new))
+            self._ids[size:size + len(new)] = list(new)
+            self._index.update(new)
+            self.stats['fields'] = len(self._index)
+        return rows
+
+    def _grow(self, size):
+        # Capacity doubles, so adding fields one at a time is amortised O(1).
+        capacity = len(self._ids)
+        if size <= capacity:
+            return
+        capacity = max(size, 2 * capacity, 64)
+        grown = {}
+        for name in ('_ids', '_n', '_mean', '_var', '_mad', '_streak'):
+            old = getattr(self, name)
+            grown[name] = np.zeros((capacity,) + old.shape[1:], dtype=old.dtype)
+            grown[name][:len(old)] = old
+        for name, array in grown.items():
+            setattr(self, name, array)
+
+    def observe(self, field_ids, values):
+        """Score and absorb readings in arrival order.
+
+        ``values`` is (len(field_ids), len(METRICS)) with NaN for metrics a
+        reading does not carry. Returns ``(flags, sustained)``, two lists of
+        (position, metric index, value, z, expected). ``sustained`` holds
+        the flags whose run just reached ANOMALY_SUSTAIN.
+        """
+        flags, sustained = [], []
+        if not len(field_ids):
+            return flags, sustained
+        with self._lock:
+            self._ensure_loaded()
+            # Started on first use, so every pre-fork worker checkpoints its own state.
+            self.start()
+            rows = self._rows(field_ids)
+            # Repeated readings for one field are applied in turns, in order.
+            if len(rows) == 1:
+                self._update([0], rows, values, flags, sustained)
+            else:
+                turn = self._turns(rows)
+                for t in range(int(turn.max()) + 1):
+                    positions = np.flatnonzero(turn == t)
+                    self._update(positions, rows[positions], values[positions], flags, sustained)
+            self._dirty.update(rows.tolist())
+            self.stats['readings'] += len(field_ids)
+            self.stats['flagged'] += len(flags)
+            self.stats['sustained'] += len(sustained)
+        return flags, sustained
+
+    @staticmethod
+    def _turns(rows):
+        """How many earlier readings in the batch share each reading's row."""
+        counts = {}
+        turns = np.empty(len(rows), dtype=np.int64)
+        for k, row in enumerate(rows.tolist()):
+            turns[k] = counts.get(row, 0)
+            counts[row] = turns[k] + 1
+        return turns
+
+    def _update(self, positions, rows, x, flags, sustained):
+        n, mean, var, mad = self._n[rows], self._mean[rows], self._var[rows], self._mad[rows]
+        present = ~np.isnan(x)
+        scale = np.maximum(MAD_TO_SIGMA * mad, MIN_SCALE)
+        d = np.where(present, x - mean, 0.0)
+        z = d / scale
+        warm = n >= self.warmup
+        anomalous = present & warm & (np.abs(z) > self.z_threshold)
+
+        # First reading sets the mean; later ones move it by a weight that
+        # starts at 1/n (a plain average) and settles at alpha. Absent
+        # metrics get weight 0 and keep their statistics.
+        a = np.where(present, np.maximum(self.alpha, 1.0 / (n + 1)), 0.0)
+        limit = np.where(warm, self.z_clip * scale, np.inf)
+        dc = np.minimum(np.maximum(d, -limit), limit)
+        self._mean[rows] = mean + a * dc
+        self._var[rows] = (1 - a) * (var + a * dc ** 2)
+        self._mad[rows] = mad + a * (np.abs(dc) * (n > 0) - mad)
+        self._n[rows] = n + present
+        streak = np.where(present, np.where(anomalous, self._streak[rows] + 1, 0), self._streak[rows])
+        self._streak[rows] = streak
+
+        for k, j in zip(*np.nonzero(anomalous)):
+            flag = (int(positions[k]), int(j), float(x[k, j]), round(float(z[k, j]), 2), round(float(mean[k, j]), 1))
+            flags.append(flag)
+            if streak[k, j] == self.sustain:
+                sustained.append(flag)
+
+    def baseline(self, field_id):
+        """{metric: {n, mean, std, mad, streak}} for one field, or None if never seen."""
+        with self._lock:
+            self._ensure_loaded()
+            row = self._index.get(field_id)
+            if row is None:
+                return None
+            return {metric: {'n': int(self._n[row, j]), 'mean': round(float(self._mean[row, j]), 2),
+                             'std': round(float(np.sqrt(self._var[row, j])), 2),
+                             'mad': round(float(self._mad[row, j]), 2), 'streak': int(self._streak[row, j])}
+                    for j, metric in enumerate(METRICS) if self._n[row, j]}
+
+    def record_alerts(self, conn, field_ids, sustained, now=None):
+        """Insert one 'Sensor Anomaly' alert per sustained flag unless one is already open; returns the count."""
+        now = now or datetime.now()
+        candidates = {}
+        for position, j, value, z, expected in sustained:
+            field_id = field_ids[position]
+            candidates[(field_id, j)] = (value, z, expected)
+        ids = sorted({field_id for field_id, _ in candidates})
+        placeholders = ','.join('?' * len(ids))
+        names = dict(conn.execute(f'SELECT id, name FROM fields WHERE id IN ({placeholders})', ids).fetchall())
+        open_alerts = {tuple(a) for a in conn.execute(
+            f"SELECT field_id, message FROM alerts WHERE resolved = 0 AND alert_type = 'Sensor Anomaly' AND field_id IN ({placeholders})",
+            ids)}
+        rows = []
+        for (field_id, j), (value, z, expected) in candidates.items():
+            message = f'Anomalous {LABELS[j]} readings in {names.get(field_id, f"field {field_id}")}'
+            if (field_id, message) in open_alerts:
+                continue
+            rows.append((field_id, 'Sensor Anomaly', message,
+                         f'Check the {LABELS[j]} sensor: last reading {value:g} against an expected {expected:g} (z={z:g})',
+                         'Medium', now))
+        if rows:
+            with conn:
+                conn.executemany('INSERT INTO alerts (field_id, alert_type, message, recommendation, priority, created_at) VALUES (?, ?, ?, ?, ?, ?)',
+                                 rows)
+        return len(rows)
+
+    def checkpoint(self):
+        """Write the state of every field that changed since the last checkpoint; returns the row count."""
+        with self._checkpoint_lock:
+            start = time.perf_counter()
+            with self._lock:
+                if not self._dirty:
+                    return 0
+                rows = np.array(sorted(self._dirty), dtype=np.int64)
+                self._dirty = set()
+                snapshot = (self._ids[rows], self._n[rows], self._mean[rows], self._var[rows],
+                            self._mad[rows], self._streak[rows])
+            ids, n, mean, var, mad, streak = (a.tolist() for a in snapshot)
+            params = [(field_id, metric, n[i][j], mean[i][j], var[i][j], mad[i][j], streak[i][j])
+                      for i, field_id in enumerate(ids) for j, metric in enumerate(METRICS) if n[i][j]]
+            conn = self.connect()
+            try:
+                with conn:
+                    conn.executemany('INSERT OR REPLACE INTO anomaly_state (field_id, metric, n, mean, var, mad, streak) '
+                                     'VALUES (?, ?, ?, ?, ?, ?, ?)', params)
+            except Exception:
+                with self._lock:
+                    self._dirty.update(rows.tolist())
+                raise
+            finally:
+                conn.close()
+            self.stats.update({
+                'checkpoints': self.stats['checkpoints'] + 1,
+                'last_checkpoint_rows': len(params),
+                'last_checkpoint_seconds': round(time.perf_counter() - start, 4),
+            })
+            return len(params)
+
+    def _loop(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.checkpoint()
+                self.stats['last_error'] = None
+            except Exception as e:
+                logger.exception('Anomaly checkpoint failed')
+                self.stats['last_error'] = str(e)
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name='anomaly-checkpoint', daemon=True)
+        self._thread.start()
+        self.stats['running'] = True
+
+    def stop(self, timeout=None):
+        """Stop the checkpoint thread and write whatever changed since the last checkpoint."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        if self._loaded:
+            self.checkpoint()
+        self.stats['running'] = False
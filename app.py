@@ -1,19 +1,41 @@
-from flask import Flask, render_template, request, jsonify
+from flask import Flask, Response, render_template, request, jsonify, g, has_app_context, stream_with_context
 from flask_cors import CORS
 from datetime import datetime, timedelta
 import sqlite3
 import json
-from functools import wraps
+from functools import partial, wraps
 import os
+import time
+import atexit
 
 # Import the configuration settings
 from config import config
+from database import PRIORITY_RANKS, pool_from_config, migrate
+import pagination
+from cache import TTLCache
+import conditional
+from ingest import IngestError, parse_field_update, parse_irrigation_start, parse_readings, ingest_readings
+import export
+import history
+from forecast import ForecastRefresher, load_features, precompute_forecasts
+from scenarios import ScenarioSimulator, inputs_key
+from alert_engine import AlertEngine
+from events import EventBroker
+import metrics
+import rollups
+from irrigation_scheduler import IrrigationScheduler
+import water_budget
+import weather
+from field_state import FieldState
+from write_behind import BufferFull, FieldUpdateBuffer
+import anomaly
+from sharding import ALL_FARMS, FarmLocal, ShardMap, UnknownFarm, current_farm, in_farm, use_farm
 
 app = Flask(__name__)
 
 # Load configuration (defaults to 'development')
-# You can change this to 'production' in config.py or via env vars later
-app.config.from_object(config['development'])
+# Set FLASK_CONFIG=production (or testing) to pick another class from config.py
+app.config.from_object(config[os.environ.get('FLASK_CONFIG', 'development')])
 
 CORS(app)
 
@@ -21,11 +43,99 @@ CORS(app)
 # We replace 'sqlite:///' to get the actual file path for sqlite3 module
 DB_PATH = app.config.get('SQLALCHEMY_DATABASE_URI', 'sqlite:///agriculture.db').replace('sqlite:///', '')
 
-def get_db():
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
+# Each farm's database file; DB_PATH is the 'default' farm.
+shards = ShardMap(DB_PATH, app.config['FARM_SHARDS'], app.config['FARM_SHARD_DIR'], app.config['FARM_FANOUT_WORKERS'])
+db_pool = FarmLocal(lambda farm: pool_from_config(shards.path(farm), app.config))
+metrics_registry = metrics.MetricsRegistry(app.config['METRICS_MODE'], app.config['SLOW_QUERY_THRESHOLD_MS'])
+
+def get_db(farm=None):
+    conn = checkout_db(farm)
+    if metrics_registry.sql_enabled:
+        return metrics.InstrumentedConnection(conn, metrics_registry)
     return conn
 
+def checkout_db(farm=None):
+    farm = farm or current_farm.get()
+    if not app.config['DB_POOL_ENABLED']:
+        conn = sqlite3.connect(shards.path(farm))
+        conn.row_factory = sqlite3.Row
+        return conn
+    
+    # Inside a request the connection is bound to the app context and handed
+    # back to the pool on teardown; conn.close() in a route releases it early.
+    if has_app_context():
+        dbs = g.setdefault('dbs', {})
+        conn = dbs.get(farm)
+        if conn is None or conn.closed:
+            conn = dbs[farm] = db_pool.farm_instance(farm).acquire()
+        return conn
+    return db_pool.farm_instance(farm).acquire()
+
+def each_farm(fn, *args):
+    """``{farm: fn(*args)}``, run for every farm in turn with that farm current."""
+    results = {}
+    for farm in shards.farms():
+        with use_farm(farm):
+            results[farm] = fn(*args)
+    return results
+
+@app.before_request
+def select_farm():
+    requested = request.headers.get('X-Farm') or request.args.get('farm')
+    if requested == ALL_FARMS and request.endpoint in CROSS_FARM_ENDPOINTS:
+        g.all_farms = True
+        return None
+    try:
+        farm = shards.resolve(requested)
+    except UnknownFarm as e:
+        return jsonify({'error': str(e)}), 404
+    g.farm_token = current_farm.set(farm)
+
+@app.before_request
+def start_request_metrics():
+    if metrics_registry.enabled:
+        g.request_started = time.perf_counter()
+        metrics.begin_request()
+
+@app.after_request
+def record_request_metrics(response):
+    started = g.pop('request_started', None)
+    if started is not None:
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        # Streamed bodies (exports, SSE) must not be buffered just to size them.
+        size = None if response.is_streamed else response.calculate_content_length()
+        metrics_registry.observe_request(route, request.method, response.status_code,
+                                         time.perf_counter() - started, size, metrics.end_request())
+    return response
+
+@app.teardown_appcontext
+def release_db(exc):
+    for conn in g.pop('dbs', {}).values():
+        conn.close()
+    token = g.pop('farm_token', None)
+    if token is not None:
+        current_farm.reset(token)
+
+# Everything derived from one database is kept per farm.
+response_cache = FarmLocal(lambda farm: TTLCache(app.config['RESPONSE_CACHE_TTL']))
+broker = FarmLocal(lambda farm: EventBroker(app.config['SSE_CLIENT_QUEUE_SIZE'], app.config['SSE_MAX_CLIENTS']))
+field_state = FarmLocal(lambda farm: FieldState(app.config['FIELD_STATE_RESYNC_SECONDS']))
+
+def tables_changed(*tables):
+    # Called by write routes after commit so cached aggregates built from
+    # these tables are recomputed on the next read, ETags built from them
+    # change, and streaming clients get the new dashboard pushed instead of
+    # polling for it.
+    response_cache.invalidate(*tables)
+    forecast_refresher.tables_changed(tables)
+    conn = checkout_db()
+    try:
+        conditional.bump_versions(conn, tables)
+    finally:
+        conn.close()
+    if broker.client_count and {'fields', 'npk_levels'} & set(tables):
+        broker.publish('dashboard', dashboard_snapshot())
+
 def init_db():
     conn = get_db()
     c = conn.cursor()
@@ -57,6 +167,10 @@ def init_db():
                   humidity REAL, precipitation REAL, created_at TIMESTAMP)''')
     
     conn.commit()
+    migrate(conn)
+    # Fields created before the farm column (or copied in from elsewhere).
+    with conn:
+        conn.execute('UPDATE fields SET farm = ? WHERE farm IS NOT ?', (current_farm.get(), current_farm.get()))
     conn.close()
 
 def seed_initial_data():
@@ -73,8 +187,8 @@ def seed_initial_data():
         
         for field in fields_data:
             try:
-                c.execute('INSERT INTO fields (name, crop, area_hectares, soil_moisture, temperature, health_status, created_at) VALUES (?, ?, ?, ?, ?, ?, ?)',
-                         (*field, datetime.now()))
+                c.execute('INSERT INTO fields (name, crop, area_hectares, soil_moisture, temperature, health_status, created_at, farm) VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                         (*field, datetime.now(), current_farm.get()))
             except sqlite3.IntegrityError:
                 pass
         
@@ -109,6 +223,8 @@ def seed_initial_data():
             except:
                 pass
         
+        # Only fills days with no forecast yet: restarts must not duplicate
+        # days or overwrite an imported forecast.
         weather_data = [
             (datetime.now().date(), 'Clear', 20, 28, 65, 0),
             ((datetime.now() + timedelta(days=1)).date(), 'Partly Cloudy', 19, 27, 70, 5),
@@ -116,13 +232,9 @@ def seed_initial_data():
             ((datetime.now() + timedelta(days=3)).date(), 'Clear', 20, 28, 65, 0),
             ((datetime.now() + timedelta(days=4)).date(), 'Clear', 22, 30, 55, 0)
         ]
-        
-        for weather in weather_data:
-            try:
-                c.execute('INSERT INTO weather (forecast_date, condition, min_temp, max_temp, humidity, precipitation, created_at) VALUES (?, ?, ?, ?, ?, ?, ?)',
-                         (*weather, datetime.now()))
-            except:
-                pass
+        c.executemany('INSERT INTO weather (station, forecast_date, condition, min_temp, max_temp, humidity, precipitation, created_at) '
+                      'VALUES (?, ?, ?, ?, ?, ?, ?, ?) ON CONFLICT (station, forecast_date) DO NOTHING',
+                      [(weather.DEFAULT_STATION, *day, datetime.now()) for day in weather_data])
         
         conn.commit()
     except Exception as e:
@@ -130,104 +242,267 @@ def seed_initial_data():
     finally:
         conn.close()
 
-# Initialize DB on startup
-init_db()
+def refresh_field_state():
+    # Full-table read: skip per-query instrumentation.
+    conn = checkout_db()
+    count = field_state.load(conn)
+    conn.close()
+    return count
+
+def refresh_forecasts():
+    conn = get_db()
+    count = precompute_forecasts(conn, app.config)
+    conn.close()
+    tables_changed('crop_yield_forecast')
+    return count
+
+# Recomputes stored forecasts when their inputs change or the day turns.
+forecast_refresher = FarmLocal(lambda farm: ForecastRefresher(in_farm(farm, refresh_forecasts), app.config))
+
+def reload_state():
+    # serve.py reload: drop cached payloads and re-read every farm's fields.
+    for cache in response_cache.farm_instances():
+        cache.clear()
+    return each_farm(refresh_field_state)
+
+# Initialize every farm's DB on startup; only the default farm gets demo data
+each_farm(init_db)
 seed_initial_data()
+each_farm(refresh_forecasts)
+each_farm(refresh_field_state)
+
+def alerts_generated(*tables):
+    tables_changed(*tables)
+    broker.publish('alert', {'action': 'generated'})
+
+# Background jobs: one per farm, each bound to its farm's database and state.
+alert_engine = FarmLocal(lambda farm: AlertEngine(partial(get_db, farm), app.config,
+                                                  on_change=in_farm(farm, alerts_generated),
+                                                  state=field_state.farm_instance(farm)))
+
+def irrigation_progressed(started, completed):
+    if completed:
+        # Completion raised soil_moisture in SQL; re-read just those fields.
+        conn = get_db()
+        rows = conn.execute(f'SELECT field_id FROM irrigation_records WHERE id IN ({",".join("?" * len(completed))})',
+                            completed).fetchall()
+        field_state.reload_rows(conn, [r[0] for r in rows])
+        conn.close()
+    tables_changed('irrigation_records', 'fields')
+    broker.publish('irrigation', {'started': started, 'completed': completed})
+
+irrigation_scheduler = FarmLocal(lambda farm: IrrigationScheduler(partial(get_db, farm), app.config,
+                                                                  on_change=in_farm(farm, irrigation_progressed)))
+
+history_compactor = FarmLocal(lambda farm: history.HistoryCompactor(partial(get_db, farm), app.config))
+
+def field_updates_flushed(field_ids):
+    tables_changed('fields')
+
+# Writer thread starts on first use; stop() flushes what is still pending.
+field_update_buffer = FarmLocal(lambda farm: FieldUpdateBuffer(partial(get_db, farm), app.config,
+                                                               on_flush=in_farm(farm, field_updates_flushed)))
+
+# Checkpoint thread starts on first reading; stop() writes a final checkpoint.
+anomaly_detector = FarmLocal(lambda farm: anomaly.AnomalyDetector(partial(get_db, farm), app.config))
+
+def detect_anomalies(readings):
+    """Score stored readings (dicts with field_id and metric keys) against each field's baseline.
+
+    Returns {reading position: [flag, ...]}; sustained anomalies become alerts.
+    """
+    if not app.config['ANOMALY_DETECTION_ENABLED'] or not readings:
+        return {}
+    # Only existing fields get a baseline, so unknown ids cannot grow the state.
+    field_state.maybe_resync(checkout_db)
+    known = [k for k, r in enumerate(readings)
+             if isinstance(r.get('field_id'), int) and field_state.has(r['field_id'])]
+    if not known:
+        return {}
+    field_ids = [readings[k]['field_id'] for k in known]
+    flags, sustained = anomaly_detector.observe(field_ids, anomaly.reading_values([readings[k] for k in known]))
+    if sustained:
+        conn = get_db()
+        created = anomaly_detector.record_alerts(conn, field_ids, sustained)
+        conn.close()
+        if created:
+            alerts_generated('alerts')
+    by_reading = {}
+    for position, j, value, z, expected in flags:
+        by_reading.setdefault(known[position], []).append({'metric': anomaly.READING_KEYS[j], 'value': value,
+                                                           'z': z, 'expected': expected})
+    return by_reading
+
+def start_background_jobs():
+    for farm in shards.farms():
+        if app.config['ALERT_ENGINE_ENABLED']:
+            alert_engine.farm_instance(farm).start()
+        if app.config['IRRIGATION_SCHEDULER_ENABLED']:
+            irrigation_scheduler.farm_instance(farm).start()
+        if app.config['HISTORY_COMPACT_ENABLED']:
+            history_compactor.farm_instance(farm).start()
+        if app.config['FORECAST_REFRESH_ENABLED']:
+            forecast_refresher.farm_instance(farm).start()
+
+def stop_background_jobs(timeout=5):
+    for jobs in (alert_engine, irrigation_scheduler, history_compactor, forecast_refresher, field_update_buffer,
+                 anomaly_detector):
+        for job in jobs.farm_instances():
+            job.stop(timeout=timeout)
+    scenario_simulator.stop()
+
+atexit.register(stop_background_jobs)
+
+# The debug reloader imports this module in a watcher process as well;
+# only the process that actually serves requests runs background jobs.
+# Under serve.py the pre-fork master imports it, and one worker starts them.
+if os.environ.get('AGRI_PREFORK') != '1' and (not app.config['DEBUG'] or os.environ.get('WERKZEUG_RUN_MAIN') == 'true'):
+    start_background_jobs()
+
+def versions_etag(*tables):
+    conn = checkout_db()
+    try:
+        return conditional.table_etag(conditional.read_versions(conn), tables)
+    finally:
+        conn.close()
+
+def conditional_json(*tables, etag_for=None):
+    """ETag / If-None-Match and compression for a JSON read route built from ``tables``.
+
+    The ETag is checked before the view runs, so a 304 costs no payload
+    query. Encoded bodies are cached per (URL, ETag, coding) until one of
+    ``tables`` changes, so clients polling without a matching ETag also
+    skip the query, JSON encoding and compression. ``etag_for`` overrides
+    the table-version ETag for payloads that are not read from SQLite.
+    """
+    etag_for = etag_for or (lambda: versions_etag(*tables))
+
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            etag = etag_for()
+            headers = {'ETag': etag, 'Vary': 'Accept-Encoding', 'Cache-Control': 'no-cache'}
+            if conditional.etag_matches(request.headers.get('If-None-Match'), etag):
+                return Response(status=304, headers=headers)
+            
+            encoding = conditional.negotiate(request.headers.get('Accept-Encoding'))
+            key = ('encoded', request.full_path, etag, encoding)
+            cached = response_cache.get(key)
+            if cached is None:
+                # The view may see writes newer than etag; that only makes
+                # the client's next revalidation a 200.
+                response = app.make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+                cached = conditional.encode(response.get_data(), encoding,
+                                            app.config['COMPRESS_MIN_SIZE'], app.config['COMPRESS_LEVEL'])
+                response_cache.set(key, cached, depends_on=tables)
+            body, content_encoding = cached
+            if content_encoding:
+                headers['Content-Encoding'] = content_encoding
+            return Response(body, mimetype='application/json', headers=headers)
+        return wrapper
+    return decorator
+
+# CLI commands run for every farm.
+@app.cli.command('rebuild-rollups')
+def rebuild_rollups_command():
+    def rebuild():
+        conn = get_db()
+        with conn:
+            rollups.rebuild_rollups(conn)
+        conn.close()
+    for farm in each_farm(rebuild):
+        print(f'{farm}: rollups rebuilt from raw data')
+
+@app.cli.command('compact-history')
+def compact_history_command():
+    for farm, result in each_farm(lambda: history_compactor.run_cycle()).items():
+        print(f"{farm}: archived {result['archived']} rows, downsampled {result['downsampled']} months, "
+              f"dropped {result['dropped']} months")
+
+@app.cli.command('precompute-forecasts')
+def precompute_forecasts_command():
+    for farm, count in each_farm(refresh_forecasts).items():
+        print(f'{farm}: stored {count} forecast rows')
 
 @app.route('/')
 def index():
     return render_template('new.html')
 
-@app.route('/api/dashboard', methods=['GET'])
-def get_dashboard():
-    conn = get_db()
-    c = conn.cursor()
-    
-    c.execute('SELECT AVG(soil_moisture) as avg_moisture FROM fields')
-    avg_moisture = c.fetchone()[0] or 72
-    
-    c.execute('SELECT AVG(temperature) as avg_temp FROM fields')
-    avg_temp = c.fetchone()[0] or 24
-    
-    c.execute('SELECT nitrogen, phosphorus, potassium FROM npk_levels ORDER BY recorded_at DESC LIMIT 1')
-    npk_row = c.fetchone()
-    npk = {'n': npk_row[0], 'p': npk_row[1], 'k': npk_row[2]} if npk_row else {'n': 68, 'p': 45, 'k': 72}
-    
-    c.execute('SELECT COUNT(*) as healthy FROM fields WHERE health_status IN ("Healthy", "Excellent", "Optimal")')
-    healthy_count = c.fetchone()[0]
-    c.execute('SELECT COUNT(*) FROM fields')
-    total_fields = c.fetchone()[0]
-    crop_health = (healthy_count / total_fields * 100) if total_fields > 0 else 85
-    
-    conn.close()
-    
-    return jsonify({
+def dashboard_snapshot():
+    # Aggregates are kept current by the in-memory field state: no SQL
+    field_state.maybe_resync(checkout_db)
+    summary = field_state.summary()
+    latest = summary['latest_npk']
+    
+    avg_moisture = summary['avg_moisture'] or 72
+    avg_temp = summary['avg_temperature'] or 24
+    npk = {'n': latest[0], 'p': latest[1], 'k': latest[2]} if latest and latest[0] is not None else {'n': 68, 'p': 45, 'k': 72}
+    crop_health = (summary['healthy'] / summary['total'] * 100) if summary['total'] > 0 else 85
+    
+    return {
         'soil_moisture': round(avg_moisture, 1),
         'temperature': round(avg_temp, 1),
         'npk_levels': npk,
         'crop_health': round(crop_health, 1)
-    })
+    }
+
+@app.route('/api/dashboard', methods=['GET'])
+def get_dashboard():
+    return jsonify(dashboard_snapshot())
+
+@app.route('/api/stream', methods=['GET'])
+def stream_events():
+    sub = broker.subscribe()
+    if sub is None:
+        return jsonify({'error': 'Too many streaming clients'}), 503
+    
+    initial = [('dashboard', dashboard_snapshot())]
+    return Response(broker.stream(sub, initial, app.config['SSE_HEARTBEAT_SECONDS']),
+                    mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+def load_fields(args):
+    """One keyset page of /api/fields; PaginationError for bad query arguments."""
+    limit = pagination.page_limit(args, app.config['PAGE_SIZE_DEFAULT'], app.config['PAGE_SIZE_MAX'])
+    cursor = args.get('cursor')
+    after = pagination.decode_cursor(cursor, 1)[0] if cursor else None
+    if after is not None and not isinstance(after, int):
+        raise pagination.PaginationError('Invalid cursor')
+    field_state.maybe_resync(checkout_db)
+    rows, more = field_state.page(after, limit, crop=args.get('crop') or None,
+                                  status=args.get('health_status') or None)
+    return {'farm': current_farm.get(), **pagination.page(rows, [rows[-1]['id']] if more else None)}
+
+def fields_etag():
+    field_state.maybe_resync(checkout_db)
+    return field_state.etag
 
 @app.route('/api/fields', methods=['GET'])
+@conditional_json('fields', 'npk_levels', etag_for=fields_etag)
 def get_fields():
-    conn = get_db()
-    c = conn.cursor()
-    
-    c.execute('SELECT id, name, area_hectares, soil_moisture, temperature, health_status FROM fields ORDER BY id')
-    fields = c.fetchall()
-    
-    fields_list = []
-    for field in fields:
-        fields_list.append({
-            'id': field['id'],
-            'name': field['name'],
-            'area': field['area_hectares'],
-            'moisture': field['soil_moisture'],
-            'temperature': field['temperature'],
-            'status': field['health_status']
-        })
-    
-    conn.close()
-    return jsonify(fields_list)
+    try:
+        return jsonify(load_fields(request.args))
+    except pagination.PaginationError as e:
+        return jsonify({'error': str(e)}), 400
 
 @app.route('/api/field/<int:field_id>', methods=['GET'])
 def get_field_detail(field_id):
-    conn = get_db()
-    c = conn.cursor()
-    
-    c.execute('SELECT id, name, crop, area_hectares, soil_moisture, temperature, health_status FROM fields WHERE id = ?', (field_id,))
-    field = c.fetchone()
-    
-    if not field:
-        conn.close()
+    field_state.maybe_resync(checkout_db)
+    field = field_state.get(field_id)
+    if field is None:
         return jsonify({'error': 'Field not found'}), 404
-    
-    c.execute('SELECT nitrogen, phosphorus, potassium, recorded_at FROM npk_levels WHERE field_id = ? ORDER BY recorded_at DESC LIMIT 1', (field_id,))
-    npk = c.fetchone()
-    
-    conn.close()
-    
-    return jsonify({
-        'id': field['id'],
-        'name': field['name'],
-        'crop': field['crop'],
-        'area': field['area_hectares'],
-        'moisture': field['soil_moisture'],
-        'temperature': field['temperature'],
-        'status': field['health_status'],
-        'npk': {
-            'nitrogen': npk[0],
-            'phosphorus': npk[1],
-            'potassium': npk[2]
-        } if npk else None
-    })
+    return jsonify(field)
 
 @app.route('/api/irrigation/start', methods=['POST'])
 def start_irrigation():
-    data = request.json
-    field_id = data.get('field_id')
-    duration = data.get('duration', 30)
-    water_volume = data.get('water_volume', 500)
+    # Checked before the INSERT: the scheduler needs a number of minutes,
+    # and a bad value must not leave a committed record behind a 500.
+    try:
+        field_id, duration, water_volume = parse_irrigation_start(request.json)
+    except IngestError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
     
     conn = get_db()
     c = conn.cursor()
@@ -236,11 +511,15 @@ def start_irrigation():
     
     c.execute('INSERT INTO irrigation_records (field_id, duration_minutes, water_volume_liters, scheduled_time, status, created_at) VALUES (?, ?, ?, ?, ?, ?)',
              (field_id, duration, water_volume, scheduled_time, 'Scheduled', datetime.now()))
-    
-    c.execute('UPDATE fields SET soil_moisture = soil_moisture + ? WHERE id = ?', (min(water_volume / 100, 15), field_id))
+    record_id = c.lastrowid
     
     conn.commit()
     conn.close()
+    # Soil moisture is raised by the scheduler when the irrigation completes
+    irrigation_scheduler.schedule(record_id, scheduled_time, duration)
+    tables_changed('irrigation_records')
+    broker.publish('irrigation', {'field_id': field_id, 'scheduled_time': scheduled_time.isoformat(),
+                                  'duration': duration, 'water_volume': water_volume})
     
     return jsonify({
         'status': 'success',
@@ -253,17 +532,14 @@ def start_irrigation():
 @app.route('/api/irrigation/history/<int:field_id>', methods=['GET'])
 def get_irrigation_history(field_id):
     conn = get_db()
-    c = conn.cursor()
-    
-    c.execute('SELECT id, duration_minutes, water_volume_liters, scheduled_time, status, created_at FROM irrigation_records WHERE field_id = ? ORDER BY created_at DESC LIMIT 10',
-             (field_id,))
-    records = c.fetchall()
-    
+    records = history.latest_rows(conn, 'irrigation_records',
+                                  'id, duration_minutes, water_volume_liters, scheduled_time, status, created_at',
+                                  field_id, 10)
     conn.close()
     
-    history = []
+    entries = []
     for record in records:
-        history.append({
+        entries.append({
             'id': record['id'],
             'duration': record['duration_minutes'],
             'water_volume': record['water_volume_liters'],
@@ -272,39 +548,61 @@ def get_irrigation_history(field_id):
             'created_at': record['created_at']
         })
     
-    return jsonify(history)
+    return jsonify(entries)
+
+@app.route('/api/irrigation/optimize', methods=['POST'])
+def optimize_irrigation():
+    data = request.json or {}
+    start_in = data.get('start_in_minutes', 2)
+    try:
+        if isinstance(start_in, bool) or not start_in >= 0:
+            raise TypeError
+        start_time = datetime.now() + timedelta(minutes=start_in)
+    except (TypeError, OverflowError):
+        return jsonify({'status': 'error', 'message': 'start_in_minutes must be a non-negative number'}), 400
+
+    conn = get_db()
+    try:
+        result = water_budget.plan_irrigation(conn, app.config, data.get('water_cap_liters'),
+                                              target=data.get('target_moisture'),
+                                              horizon_days=data.get('horizon_days'))
+    except (water_budget.PlanError, TypeError) as e:
+        conn.close()
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+    
+    if data.get('apply'):
+        result['scheduled'] = water_budget.write_plan(conn, result['plan'], start_time)
+        result['scheduled_time'] = start_time.isoformat()
+    conn.close()
+    
+    if result.get('scheduled'):
+        irrigation_scheduler.sync()
+        tables_changed('irrigation_records')
+        broker.publish('irrigation', {'planned': result['scheduled'], 'scheduled_time': result['scheduled_time']})
+    
+    return jsonify(result)
+
+@app.route('/api/irrigation/scheduler', methods=['GET'])
+def get_irrigation_scheduler_stats():
+    return jsonify(irrigation_scheduler.stats)
 
+# Only fields.name is joined in, and no route renames fields, so sensor
+# updates to fields do not change this ETag.
 @app.route('/api/crop-yield-forecast', methods=['GET'])
+@conditional_json('crop_yield_forecast')
 def get_crop_yield_forecast():
     conn = get_db()
     c = conn.cursor()
     
+    # Only the current window (precompute_forecasts rewrites today onwards),
+    # read as a range seek rather than a walk of the whole date index.
     c.execute('''SELECT f.name, cyf.forecast_date, cyf.predicted_yield 
                  FROM crop_yield_forecast cyf 
                  JOIN fields f ON cyf.field_id = f.id 
-                 ORDER BY cyf.forecast_date DESC LIMIT 28''')
+                 WHERE cyf.forecast_date >= ?
+                 ORDER BY cyf.forecast_date DESC LIMIT 28''', (datetime.now().date(),))
     forecasts = c.fetchall()
     
-    if not forecasts:
-        c.execute('SELECT id, name FROM fields')
-        fields = c.fetchall()
-        
-        for field in fields:
-            for i in range(7):
-                forecast_date = datetime.now().date() + timedelta(days=i)
-                # Note: This is a simulated prediction formula
-                predicted_yield = 500 + (i * 20) + (field['id'] * 50)
-                c.execute('INSERT INTO crop_yield_forecast (field_id, forecast_date, predicted_yield, created_at) VALUES (?, ?, ?, ?)',
-                         (field['id'], forecast_date, predicted_yield, datetime.now()))
-        
-        conn.commit()
-        
-        c.execute('''SELECT f.name, cyf.forecast_date, cyf.predicted_yield 
-                     FROM crop_yield_forecast cyf 
-                     JOIN fields f ON cyf.field_id = f.id 
-                     ORDER BY cyf.forecast_date DESC LIMIT 28''')
-        forecasts = c.fetchall()
-    
     conn.close()
     
     forecast_data = {}
@@ -321,22 +619,110 @@ def get_crop_yield_forecast():
     
     return jsonify(forecast_data)
 
-@app.route('/api/alerts', methods=['GET'])
-def get_alerts():
+@app.route('/api/crop-yield-forecast/refresh', methods=['POST'])
+def refresh_crop_yield_forecast():
+    count = forecast_refresher.run_cycle(force=True)
+    return jsonify({'status': 'success', 'message': 'Forecasts recomputed', 'rows': count})
+
+@app.route('/api/crop-yield-forecast/refresher', methods=['GET'])
+def get_forecast_refresher_stats():
+    return jsonify(forecast_refresher.stats)
+
+# Process pool started on first use. The cache is keyed by a digest of the
+# simulation inputs, so entries never go stale: any change to fields, NPK or
+# weather gives a new key.
+scenario_simulator = ScenarioSimulator(app.config)
+scenario_cache = FarmLocal(lambda farm: TTLCache(app.config['SCENARIO_CACHE_TTL'], app.config['SCENARIO_CACHE_SIZE']))
+
+def simulate_yield_scenarios(scenarios, days):
     conn = get_db()
-    c = conn.cursor()
-    
-    c.execute('''SELECT a.id, a.field_id, f.name, a.alert_type, a.message, a.recommendation, a.priority, a.created_at 
-                 FROM alerts a 
-                 JOIN fields f ON a.field_id = f.id 
-                 WHERE a.resolved = 0 
-                 ORDER BY a.priority DESC, a.created_at DESC''')
-    alerts = c.fetchall()
-    
+    features = load_features(conn, days, (68, 45, 72))
+    names = dict(conn.execute('SELECT id, name FROM fields').fetchall())
     conn.close()
     
+    today = datetime.now().date()
+    seed = app.config['SCENARIO_SEED']
+    key = (inputs_key(features, today, seed, scenario_simulator.cfg), scenarios)
+    
+    def run():
+        bands, farm = scenario_simulator.run(features, scenarios, seed)
+        bands, farm = bands.tolist(), farm.tolist()
+        return {
+            'scenarios': scenarios,
+            'dates': [(today + timedelta(days=i)).isoformat() for i in range(days)],
+            'farm_average': dict(zip(('p10', 'p50', 'p90'), farm)),
+            'fields': [{'id': field_id, 'name': names.get(field_id),
+                        'p10': bands[0][i], 'p50': bands[1][i], 'p90': bands[2][i]}
+                       for i, field_id in enumerate(features.field_ids.tolist())],
+        }
+    return scenario_cache.get_or_load(key, run)
+
+@app.route('/api/crop-yield-forecast/scenarios', methods=['GET'])
+def get_yield_scenarios():
+    scenarios = request.args.get('scenarios', app.config['SCENARIO_DEFAULT_COUNT'], type=int)
+    days = request.args.get('days', app.config['CROP_YIELD_FORECAST_DAYS'], type=int)
+    if not 1 <= scenarios <= app.config['SCENARIO_MAX_COUNT']:
+        return jsonify({'error': f"scenarios must be between 1 and {app.config['SCENARIO_MAX_COUNT']}"}), 400
+    if not 1 <= days <= app.config['SCENARIO_MAX_DAYS']:
+        return jsonify({'error': f"days must be between 1 and {app.config['SCENARIO_MAX_DAYS']}"}), 400
+    return jsonify(simulate_yield_scenarios(scenarios, days))
+
+@app.route('/api/crop-yield-forecast/scenarios/stats', methods=['GET'])
+def get_yield_scenario_stats():
+    return jsonify({**scenario_simulator.stats, 'cache_hits': scenario_cache.hits, 'cache_misses': scenario_cache.misses})
+
+def load_alerts(conn, args):
+    """One keyset page of open alerts, highest priority first, then newest.
+
+    Each priority rank is one range seek on a partial index over open
+    alerts, so a page costs at most one short query per rank regardless of
+    table size or cursor depth. PaginationError for bad query arguments.
+    """
+    limit = pagination.page_limit(args, app.config['PAGE_SIZE_DEFAULT'], app.config['PAGE_SIZE_MAX'])
+    ranks = sorted(set(PRIORITY_RANKS.values()) | {0}, reverse=True)
+    priority = args.get('priority')
+    if priority:
+        if priority.lower() not in PRIORITY_RANKS:
+            raise pagination.PaginationError('priority must be one of ' + ', '.join(p.title() for p in PRIORITY_RANKS))
+        ranks = [PRIORITY_RANKS[priority.lower()]]
+    
+    filters, params = [], []
+    field_id = pagination.int_arg(args, 'field_id')
+    if field_id is not None:
+        filters.append('a.field_id = ?')
+        params.append(field_id)
+    for name, op in (('start', '>='), ('end', '<')):
+        value = pagination.timestamp_arg(args, name)
+        if value is not None:
+            filters.append(f'a.created_at {op} ?')
+            params.append(value)
+    
+    after = None
+    if args.get('cursor'):
+        after = pagination.decode_cursor(args['cursor'], 3)
+        if not (isinstance(after[0], int) and isinstance(after[2], int)):
+            raise pagination.PaginationError('Invalid cursor')
+        ranks = [r for r in ranks if r <= after[0]]
+    
+    rows = []
+    for rank in ranks:
+        where, where_params = list(filters), list(params)
+        if after is not None and rank == after[0]:
+            where.append('(a.created_at, a.id) < (?, ?)')
+            where_params += after[1:]
+        c = conn.execute(f'''SELECT a.id, a.field_id, f.name, a.alert_type, a.message, a.recommendation, a.priority,
+                                      a.priority_rank, a.created_at
+                               FROM alerts a
+                               JOIN fields f ON a.field_id = f.id
+                               WHERE a.resolved = 0 AND a.priority_rank = ? {''.join(' AND ' + w for w in where)}
+                               ORDER BY a.created_at DESC, a.id DESC LIMIT ?''',
+                         [rank] + where_params + [limit + 1 - len(rows)])
+        rows.extend(c.fetchall())
+        if len(rows) > limit:
+            break
+    
     alerts_list = []
-    for alert in alerts:
+    for alert in rows[:limit]:
         alerts_list.append({
             'id': alert['id'],
             'field_id': alert['field_id'],
@@ -347,9 +733,63 @@ def get_alerts():
             'priority': alert['priority'],
             'created_at': alert['created_at']
         })
-    
+    last = rows[limit - 1] if len(rows) > limit else None
+    return pagination.page(alerts_list, [last['priority_rank'], last['created_at'], last['id']] if last else None)
+
+# Joins only fields.name (see get_crop_yield_forecast).
+@app.route('/api/alerts', methods=['GET'])
+@conditional_json('alerts')
+def get_alerts():
+    conn = get_db()
+    try:
+        alerts_list = load_alerts(conn, request.args)
+    except pagination.PaginationError as e:
+        return jsonify({'error': str(e)}), 400
+    finally:
+        conn.close()
     return jsonify(alerts_list)
 
+@app.route('/api/alerts/engine', methods=['GET'])
+def get_alert_engine_stats():
+    return jsonify(alert_engine.stats)
+
+@app.route('/api/alerts/engine/run', methods=['POST'])
+def run_alert_engine():
+    created = alert_engine.run_cycle()
+    return jsonify({'status': 'success', 'alerts_created': created, 'stats': alert_engine.stats})
+
+@app.route('/api/history/compaction', methods=['GET'])
+def get_history_compaction():
+    conn = get_db()
+    rows = conn.execute('SELECT series, month, kind, row_count FROM history_partitions ORDER BY series, month').fetchall()
+    conn.close()
+    return jsonify({'stats': history_compactor.stats, 'partitions': [dict(r) for r in rows]})
+
+@app.route('/api/history/compaction/run', methods=['POST'])
+def run_history_compaction():
+    result = history_compactor.run_cycle()
+    return jsonify({'status': 'success', **result, 'stats': history_compactor.stats})
+
+@app.route('/api/field-update/buffer', methods=['GET'])
+def get_field_update_buffer_stats():
+    return jsonify(field_update_buffer.stats)
+
+@app.route('/api/anomalies/detector', methods=['GET'])
+def get_anomaly_detector_stats():
+    return jsonify(anomaly_detector.stats)
+
+@app.route('/api/anomalies/detector/checkpoint', methods=['POST'])
+def checkpoint_anomaly_detector():
+    rows = anomaly_detector.checkpoint()
+    return jsonify({'status': 'success', 'rows': rows, 'stats': anomaly_detector.stats})
+
+@app.route('/api/field/<int:field_id>/baseline', methods=['GET'])
+def get_field_baseline(field_id):
+    baseline = anomaly_detector.baseline(field_id)
+    if baseline is None:
+        return jsonify({'error': 'No readings seen for this field'}), 404
+    return jsonify(baseline)
+
 @app.route('/api/alerts/<int:alert_id>/resolve', methods=['PUT'])
 def resolve_alert(alert_id):
     conn = get_db()
@@ -358,6 +798,8 @@ def resolve_alert(alert_id):
     c.execute('UPDATE alerts SET resolved = 1 WHERE id = ?', (alert_id,))
     conn.commit()
     conn.close()
+    tables_changed('alerts')
+    broker.publish('alert', {'action': 'resolved', 'id': alert_id})
     
     return jsonify({'status': 'success', 'message': 'Alert resolved'})
 
@@ -375,21 +817,19 @@ def create_alert():
     
     c.execute('INSERT INTO alerts (field_id, alert_type, message, recommendation, priority, created_at) VALUES (?, ?, ?, ?, ?, ?)',
              (field_id, alert_type, message, recommendation, priority, datetime.now()))
+    alert_id = c.lastrowid
     
     conn.commit()
     conn.close()
+    tables_changed('alerts')
+    broker.publish('alert', {'action': 'created', 'id': alert_id, 'field_id': field_id, 'type': alert_type,
+                             'message': message, 'recommendation': recommendation, 'priority': priority})
     
     return jsonify({'status': 'success', 'message': 'Alert created'}), 201
 
-@app.route('/api/weather', methods=['GET'])
-def get_weather():
-    conn = get_db()
-    c = conn.cursor()
-    
-    c.execute('SELECT forecast_date, condition, min_temp, max_temp, humidity, precipitation FROM weather ORDER BY forecast_date LIMIT 5')
-    weather_data = c.fetchall()
-    
-    conn.close()
+def load_weather(conn, args=None):
+    station = (args or {}).get('station') or weather.DEFAULT_STATION
+    weather_data = weather.read_forecast(conn, station, app.config['WEATHER_FORECAST_DAYS'])
     
     forecast = []
     for day in weather_data:
@@ -401,43 +841,64 @@ def get_weather():
             'humidity': day['humidity'],
             'precipitation': day['precipitation']
         })
-    
+    return forecast
+
+def weather_etag():
+    # Reads start at today, so the same table version serves a different
+    # window after midnight.
+    return versions_etag('weather')[:-1] + datetime.now().strftime('.%Y%m%d"')
+
+@app.route('/api/weather', methods=['GET'])
+@conditional_json('weather', etag_for=weather_etag)
+def get_weather():
+    conn = get_db()
+    forecast = load_weather(conn, request.args)
+    conn.close()
     return jsonify(forecast)
 
 @app.route('/api/weather/update', methods=['POST'])
 def update_weather():
     data = request.json
-    forecast_date = data.get('forecast_date')
-    condition = data.get('condition')
-    min_temp = data.get('min_temp')
-    max_temp = data.get('max_temp')
-    humidity = data.get('humidity')
-    precipitation = data.get('precipitation', 0)
+    try:
+        row = weather.forecast_row(data, datetime.now())
+    except weather.ForecastError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
     
     conn = get_db()
-    c = conn.cursor()
-    
-    c.execute('UPDATE weather SET condition = ?, min_temp = ?, max_temp = ?, humidity = ?, precipitation = ? WHERE forecast_date = ?',
-             (condition, min_temp, max_temp, humidity, precipitation, forecast_date))
+    weather.upsert_forecast(conn, [row])
+    conn.close()
+    tables_changed('weather')
     
-    if c.rowcount == 0:
-        c.execute('INSERT INTO weather (forecast_date, condition, min_temp, max_temp, humidity, precipitation, created_at) VALUES (?, ?, ?, ?, ?, ?, ?)',
-                 (forecast_date, condition, min_temp, max_temp, humidity, precipitation, datetime.now()))
+    return jsonify({'status': 'success', 'message': 'Weather updated'})
+
+@app.route('/api/weather/import', methods=['POST'])
+def import_weather():
+    try:
+        days = weather.parse_forecast(request.get_data(), request.content_type)
+        if len(days) > app.config['WEATHER_IMPORT_MAX_ROWS']:
+            return jsonify({'status': 'error', 'message': f"Forecast exceeds {app.config['WEATHER_IMPORT_MAX_ROWS']} rows"}), 413
+        rows = weather.validate_forecast(days)
+    except weather.ForecastError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
     
-    conn.commit()
+    conn = get_db()
+    upserted, pruned = weather.upsert_forecast(conn, rows, prune_before=datetime.now().date())
     conn.close()
+    tables_changed('weather')
     
-    return jsonify({'status': 'success', 'message': 'Weather updated'})
+    return jsonify({
+        'status': 'success',
+        'stations': len({r[0] for r in rows}),
+        'upserted': upserted,
+        'skipped_past_days': len(rows) - upserted,
+        'pruned': pruned
+    })
 
 @app.route('/api/npk-levels/<int:field_id>', methods=['GET'])
 def get_npk_levels(field_id):
     conn = get_db()
-    c = conn.cursor()
-    
-    c.execute('SELECT nitrogen, phosphorus, potassium, recorded_at FROM npk_levels WHERE field_id = ? ORDER BY recorded_at DESC LIMIT 10',
-             (field_id,))
-    npk_records = c.fetchall()
-    
+    # Newest first across the hot table and, if needed, monthly partitions.
+    npk_records = history.latest_rows(conn, 'npk_levels', 'nitrogen, phosphorus, potassium, recorded_at', field_id, 10)
     conn.close()
     
     records = []
@@ -461,21 +922,78 @@ def update_npk_levels(field_id):
     conn = get_db()
     c = conn.cursor()
     
+    recorded_at = datetime.now()
     c.execute('INSERT INTO npk_levels (field_id, nitrogen, phosphorus, potassium, recorded_at) VALUES (?, ?, ?, ?, ?)',
-             (field_id, nitrogen, phosphorus, potassium, datetime.now()))
+             (field_id, nitrogen, phosphorus, potassium, recorded_at))
     
     conn.commit()
     conn.close()
+    field_state.record_npk(field_id, nitrogen, phosphorus, potassium, recorded_at)
+    tables_changed('npk_levels')
+    broker.publish('npk', {'field_id': field_id, 'nitrogen': nitrogen, 'phosphorus': phosphorus, 'potassium': potassium})
+    anomalies = detect_anomalies([{'field_id': field_id, 'nitrogen': nitrogen, 'phosphorus': phosphorus, 'potassium': potassium}])
+    
+    return jsonify({'status': 'success', 'message': 'NPK levels updated', 'anomalies': anomalies.get(0, [])}), 201
+
+@app.route('/api/ingest', methods=['POST'])
+def ingest_sensor_readings():
+    try:
+        readings = parse_readings(request.get_data(), request.content_type)
+    except IngestError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+    
+    if len(readings) > app.config['INGEST_MAX_BATCH']:
+        return jsonify({'status': 'error', 'message': f"Batch exceeds {app.config['INGEST_MAX_BATCH']} readings"}), 413
+    
+    conn = get_db()
+    results, tables = ingest_readings(conn, readings)
+    if tables:
+        field_state.reload_rows(conn, {readings[r['index']]['field_id'] for r in results if r['status'] == 'accepted'})
+    conn.close()
+    
+    accepted = sum(1 for r in results if r['status'] == 'accepted')
+    if tables:
+        tables_changed(*tables)
+        broker.publish('field', {'bulk': True, 'accepted': accepted})
+        stored = [r for r in results if r['status'] == 'accepted']
+        for position, flags in detect_anomalies([readings[r['index']] for r in stored]).items():
+            stored[position]['anomalies'] = flags
     
-    return jsonify({'status': 'success', 'message': 'NPK levels updated'}), 201
+    return jsonify({
+        'status': 'success' if accepted == len(results) else 'partial',
+        'accepted': accepted,
+        'rejected': len(results) - accepted,
+        'results': results
+    }), 207 if accepted < len(results) else 201
 
 @app.route('/api/field-update', methods=['POST'])
 def update_field():
-    data = request.json
-    field_id = data.get('field_id')
-    soil_moisture = data.get('soil_moisture')
-    temperature = data.get('temperature')
-    health_status = data.get('health_status')
+    # Validate before the write (or the queue): a value the column state
+    # cannot take must not reach SQLite first, and "1" and 1 must coalesce
+    # as the same field.
+    try:
+        field_id, soil_moisture, temperature, health_status = parse_field_update(request.json)
+    except IngestError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+    reading = {'field_id': field_id, 'soil_moisture': soil_moisture, 'temperature': temperature}
+    
+    if app.config['FIELD_UPDATE_WRITE_BEHIND']:
+        if soil_moisture is None and temperature is None and health_status is None:
+            return jsonify({'status': 'success', 'message': 'Field updated'})
+        # A queued update for a missing field would be dropped silently at flush.
+        field_state.maybe_resync(checkout_db)
+        if not field_state.has(field_id):
+            return jsonify({'status': 'error', 'message': f'unknown field_id {field_id}'}), 400
+        try:
+            field_update_buffer.submit(field_id, soil_moisture, temperature, health_status)
+        except BufferFull:
+            return jsonify({'error': 'Too many pending field updates, retry shortly'}), 503, {'Retry-After': '1'}
+        # Memory state and streams see the update now; SQLite on the next flush.
+        field_state.update(field_id, soil_moisture, temperature, health_status)
+        broker.publish('field', {'field_id': field_id, 'soil_moisture': soil_moisture,
+                                 'temperature': temperature, 'health_status': health_status})
+        anomalies = detect_anomalies([reading]).get(0, [])
+        return jsonify({'status': 'success', 'message': 'Field update queued', 'anomalies': anomalies}), 202
     
     conn = get_db()
     c = conn.cursor()
@@ -500,49 +1018,102 @@ def update_field():
         query = f'UPDATE fields SET {", ".join(update_fields)} WHERE id = ?'
         c.execute(query, update_values)
         conn.commit()
+        field_state.update(field_id, soil_moisture, temperature, health_status)
+        tables_changed('fields')
+        broker.publish('field', {'field_id': field_id, 'soil_moisture': soil_moisture,
+                                 'temperature': temperature, 'health_status': health_status})
     
     conn.close()
+    anomalies = detect_anomalies([reading]).get(0, []) if update_fields and c.rowcount else []
     
-    return jsonify({'status': 'success', 'message': 'Field updated'})
+    return jsonify({'status': 'success', 'message': 'Field updated', 'anomalies': anomalies})
+
+@app.route('/api/export/<dataset>', methods=['GET'])
+def export_history(dataset):
+    fmt = request.args.get('format', 'ndjson')
+    if fmt not in export.FORMATS:
+        return jsonify({'error': f'Unsupported format {fmt!r}'}), 400
+    
+    try:
+        options = dict(
+            field_ids=export.parse_field_ids(request.args.getlist('field_id')),
+            start=export.parse_timestamp(request.args.get('start'), 'start'),
+            end=export.parse_timestamp(request.args.get('end'), 'end'),
+            after=export.parse_cursor(request.args.get('after')),
+            limit=export.parse_limit(request.args.get('limit'))
+        )
+        sql, params, columns = export.build_query(dataset, **options)
+    except export.ExportError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    formatter, mimetype = export.FORMATS[fmt]
+    table, time_col, _ = export.DATASETS[dataset]
+    
+    def generate():
+        conn = get_db()
+        try:
+            # Raw rows only: months already downsampled to hourly sums are
+            # left out. Partitions outside start/after..end are not read.
+            since = max((str(v) for v in (options['start'], options['after'] and options['after'][0]) if v), default=None)
+            queries = [(sql, params)] + [
+                export.build_query(dataset, **options, table=partition)[:2]
+                for _, _, partition in history.partitions(conn, table, since, options['end'], kinds=('raw',))]
+            batches = export.iter_merged(conn, queries, time_col, app.config['EXPORT_FETCH_SIZE'], options['limit'])
+            yield from formatter(batches, columns)
+        finally:
+            conn.close()
+    
+    return Response(stream_with_context(generate()), mimetype=mimetype,
+                    headers={'Content-Disposition': f'attachment; filename={dataset}.{fmt}'})
 
 @app.route('/api/analytics', methods=['GET'])
 def get_analytics():
-    conn = get_db()
-    c = conn.cursor()
-    
-    c.execute('SELECT COUNT(*) as total FROM fields')
-    total_fields = c.fetchone()[0]
-    
-    c.execute('SELECT AVG(soil_moisture) FROM fields')
-    avg_moisture = c.fetchone()[0] or 0
-    
-    c.execute('SELECT COUNT(*) FROM irrigation_records WHERE status = "Scheduled"')
-    scheduled_irrigations = c.fetchone()[0]
-    
-    c.execute('SELECT COUNT(*) FROM alerts WHERE resolved = 0')
-    active_alerts = c.fetchone()[0]
+    if g.get('all_farms'):
+        # farm=*: every shard's summary row, read in parallel and summed.
+        summaries = shards.fan_out(read_farm_summary)
+        return jsonify({**rollups.format_analytics(rollups.merge_summaries(summaries.values())),
+                        'farms': len(summaries)})
     
-    c.execute('SELECT SUM(area_hectares) FROM fields')
-    total_area = c.fetchone()[0] or 0
+    conn = get_db()
+    analytics = rollups.read_analytics(conn)
+    conn.close()
     
-    c.execute('SELECT COUNT(DISTINCT alert_type) FROM alerts')
-    alert_types = c.fetchone()[0]
+    return jsonify(analytics)
+
+def read_farm_summary():
+    conn = checkout_db()
+    try:
+        return rollups.read_summary(conn)
+    finally:
+        conn.close()
+
+@app.route('/api/farms', methods=['GET'])
+def list_farms():
+    summaries = shards.fan_out(read_farm_summary)
+    return jsonify([{'farm': farm, **rollups.format_analytics(summary)} for farm, summary in summaries.items()])
+
+# Endpoints that accept farm=* and fan out over every shard themselves.
+CROSS_FARM_ENDPOINTS = {'get_analytics'}
+
+@app.route('/api/field/<int:field_id>/trends', methods=['GET'])
+def get_field_trends(field_id):
+    days = request.args.get('days', 30, type=int)
+    since = datetime.now().date() - timedelta(days=days)
     
+    conn = get_db()
+    trends = rollups.read_field_trends(conn, field_id, since)
     conn.close()
     
-    return jsonify({
-        'total_fields': total_fields,
-        'average_moisture': round(avg_moisture, 2),
-        'scheduled_irrigations': scheduled_irrigations,
-        'active_alerts': active_alerts,
-        'total_area_hectares': round(total_area, 2),
-        'alert_types': alert_types
-    })
+    return jsonify(trends)
 
 @app.route('/api/health-check', methods=['GET'])
 def health_check():
     return jsonify({'status': 'healthy', 'timestamp': datetime.now().isoformat()})
 
+@app.route('/api/metrics', methods=['GET'])
+def get_metrics():
+    return Response(metrics_registry.render(), mimetype='text/plain; version=0.0.4')
+
 if __name__ == '__main__':
     # Use configuration settings for host, port and debug mode
     app.run(
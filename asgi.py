@@ -0,0 +1,321 @@
+"""ASGI entry point: ``uvicorn asgi:app --host 0.0.0.0 --port 5000``.
+
+The read-heavy routes (dashboard, fields, alerts, weather) and the event
+stream are served by coroutines. Their SQLite work is handed to a small,
+bounded thread pool, so the event loop never blocks on a query and an open
+connection costs a coroutine instead of a worker thread. That lets one
+process hold thousands of polling and EventSource clients. Every other path
+goes to the unchanged Flask app through a WSGI bridge with its own executor.
+Fields, alerts and weather honour If-None-Match and Accept-Encoding exactly
+like the Flask routes (see conditional.py).
+"""
+import asyncio
+import contextvars
+import io
+import logging
+import sys
+import time
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+
+import app as flask_module
+import conditional
+import pagination
+from app import (app as flask_app, broker, dashboard_snapshot, fields_etag, get_db, load_alerts, load_fields,
+                 load_weather, metrics_registry, response_cache, shards, versions_etag, weather_etag)
+from sharding import UnknownFarm, use_farm
+
+logger = logging.getLogger(__name__)
+
+JSON_HEADERS = [(b'content-type', b'application/json'), (b'access-control-allow-origin', b'*')]
+STREAM_HEADERS = [(b'content-type', b'text/event-stream'), (b'cache-control', b'no-cache'),
+                  (b'x-accel-buffering', b'no'), (b'access-control-allow-origin', b'*')]
+
+
+class DatabaseBusy(Exception):
+    pass
+
+
+class AsyncDatabase:
+    """Runs blocking sqlite3 work on a bounded thread pool."""
+
+    def __init__(self, connect, workers, max_pending):
+        self.connect = connect
+        self.max_pending = max_pending
+        self.pending = 0
+        self._executor = ThreadPoolExecutor(workers, thread_name_prefix='async-db')
+
+    async def run(self, fn, *args):
+        # pending is only touched from the event loop thread, so no lock.
+        if self.pending >= self.max_pending:
+            raise DatabaseBusy()
+        self.pending += 1
+        try:
+            # Carry the request's farm (a ContextVar) into the worker thread.
+            return await asyncio.get_running_loop().run_in_executor(
+                self._executor, contextvars.copy_context().run, fn, *args)
+        finally:
+            self.pending -= 1
+
+    async def query(self, fn, *args):
+        """``fn(conn, *args)`` with a pooled connection checked out for the call."""
+        return await self.run(self._with_connection, fn, args)
+
+    def _with_connection(self, fn, args):
+        conn = self.connect()
+        try:
+            return fn(conn, *args)
+        finally:
+            conn.close()
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
+
+
+db = AsyncDatabase(get_db, flask_app.config['ASYNC_DB_WORKERS'], flask_app.config['ASYNC_DB_MAX_PENDING'])
+wsgi_executor = ThreadPoolExecutor(flask_app.config['ASYNC_WSGI_WORKERS'], thread_name_prefix='asgi-wsgi')
+
+
+async def dashboard(args):
+    return await db.run(dashboard_snapshot)
+
+
+async def fields(args):
+    return await db.run(load_fields, args)
+
+
+async def alerts(args):
+    return await db.query(load_alerts, args)
+
+
+async def weather(args):
+    return await db.query(load_weather, args)
+
+
+JSON_ROUTES = {
+    '/api/dashboard': dashboard,
+    '/api/fields': fields,
+    '/api/alerts': alerts,
+    '/api/weather': weather,
+}
+
+# Routes answering If-None-Match and compressing like app.conditional_json:
+# path -> (tables the payload is built from, ETag function).
+CONDITIONAL_ROUTES = {
+    '/api/fields': (('fields', 'npk_levels'), fields_etag),
+    '/api/alerts': (('alerts',), lambda: versions_etag('alerts')),
+    '/api/weather': (('weather',), weather_etag),
+}
+
+
+async def send_json(send, status, data):
+    body = flask_app.json.dumps(data).encode()
+    await send_body(send, status, body, JSON_HEADERS)
+    return len(body)
+
+
+async def send_body(send, status, body, headers):
+    await send({'type': 'http.response.start', 'status': status,
+                'headers': headers + [(b'content-length', str(len(body)).encode())]})
+    await send({'type': 'http.response.body', 'body': body})
+
+
+async def send_conditional(scope, send, handler, args, tables, etag_for):
+    """Same contract as app.conditional_json; shares its encoded-body cache."""
+    request_headers = dict(scope['headers'])
+    etag = await db.run(etag_for)
+    headers = [(b'etag', etag.encode()), (b'vary', b'Accept-Encoding'), (b'cache-control', b'no-cache')]
+    if conditional.etag_matches(request_headers.get(b'if-none-match', b'').decode('latin-1'), etag):
+        await send_body(send, 304, b'', [(b'access-control-allow-origin', b'*')] + headers)
+        return 304, 0
+
+    encoding = conditional.negotiate(request_headers.get(b'accept-encoding', b'').decode('latin-1'))
+    key = ('encoded', scope['path'] + '?' + scope['query_string'].decode('latin-1'), etag, encoding)
+    cached = response_cache.get(key)
+    if cached is None:
+        body = flask_app.json.dumps(await handler(args)).encode()
+        cached = await db.run(conditional.encode, body, encoding,
+                              flask_app.config['COMPRESS_MIN_SIZE'], flask_app.config['COMPRESS_LEVEL'])
+        response_cache.set(key, cached, depends_on=tables)
+    body, content_encoding = cached
+    if content_encoding:
+        headers.append((b'content-encoding', content_encoding.encode()))
+    await send_body(send, 200, body, JSON_HEADERS + headers)
+    return 200, len(body)
+
+
+async def serve_json(route, handler, scope, send):
+    started = time.perf_counter()
+    args = dict(urllib.parse.parse_qsl(scope['query_string'].decode('latin-1')))
+    try:
+        if route in CONDITIONAL_ROUTES:
+            status, size = await send_conditional(scope, send, handler, args, *CONDITIONAL_ROUTES[route])
+        else:
+            status, data = 200, await handler(args)
+            size = await send_json(send, status, data)
+    except pagination.PaginationError as e:
+        status = 400
+        size = await send_json(send, status, {'error': str(e)})
+    except DatabaseBusy:
+        status = 503
+        size = await send_json(send, status, {'error': 'Database busy, retry shortly'})
+    except Exception:
+        logger.exception('Unhandled error in %s', route)
+        status = 500
+        size = await send_json(send, status, {'error': 'Internal server error'})
+    if metrics_registry.enabled:
+        metrics_registry.observe_request(route, 'GET', status, time.perf_counter() - started, size, None)
+
+
+async def serve_stream(receive, send):
+    sub = broker.subscribe(asyncio.get_running_loop())
+    if sub is None:
+        await send_json(send, 503, {'error': 'Too many streaming clients'})
+        return
+    try:
+        initial = [('dashboard', await dashboard({}))]
+    except Exception:
+        broker.unsubscribe(sub)
+        raise
+
+    async def watch_disconnect():
+        while (await receive())['type'] != 'http.disconnect':
+            pass
+        sub.dropped = True
+        sub.close()
+
+    watcher = asyncio.ensure_future(watch_disconnect())
+    frames = broker.stream_async(sub, initial, flask_app.config['SSE_HEARTBEAT_SECONDS'])
+    try:
+        await send({'type': 'http.response.start', 'status': 200, 'headers': STREAM_HEADERS})
+        async for frame in frames:
+            await send({'type': 'http.response.body', 'body': frame.encode(), 'more_body': True})
+        if not watcher.done():
+            await send({'type': 'http.response.body', 'body': b''})
+    finally:
+        watcher.cancel()
+        await frames.aclose()
+
+
+def request_farm(scope):
+    # Same precedence as app.select_farm: X-Farm header, then ?farm=.
+    for name, value in scope['headers']:
+        if name == b'x-farm' and value:
+            return value.decode('latin-1')
+    return dict(urllib.parse.parse_qsl(scope['query_string'].decode('latin-1'))).get('farm')
+
+
+def build_environ(scope, body):
+    server = scope.get('server') or ('localhost', 80)
+    client = scope.get('client') or ('', 0)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': '',
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope['query_string'].decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': 'HTTP/' + scope.get('http_version', '1.1'),
+        'REMOTE_ADDR': client[0],
+        'CONTENT_LENGTH': str(len(body)),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': False,
+        'wsgi.run_once': False,
+    }
+    for name, value in scope['headers']:
+        name, value = name.decode('latin-1'), value.decode('latin-1')
+        if name == 'content-type':
+            environ['CONTENT_TYPE'] = value
+        elif name != 'content-length':
+            key = 'HTTP_' + name.upper().replace('-', '_')
+            environ[key] = f'{environ[key]},{value}' if key in environ else value
+    return environ
+
+
+def next_block(chunks, limit=64 * 1024):
+    # Pull several small chunks per executor hop; b'' means the body is done.
+    block, size = [], 0
+    for chunk in chunks:
+        block.append(chunk)
+        size += len(chunk)
+        if size >= limit:
+            break
+    return b''.join(block)
+
+
+async def call_wsgi(scope, receive, send):
+    body = bytearray()
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            return
+        body += message.get('body', b'')
+        if not message.get('more_body'):
+            break
+
+    loop = asyncio.get_running_loop()
+    environ = build_environ(scope, bytes(body))
+    response = {}
+    # stream_with_context resets ContextVars on exit, so every step of one
+    # response must run in the same Context even if on different threads.
+    context = contextvars.copy_context()
+
+    def start_response(status, headers, exc_info=None):
+        response['status'] = int(status.split(' ', 1)[0])
+        response['headers'] = [(k.lower().encode('latin-1'), v.encode('latin-1')) for k, v in headers]
+
+    def run():
+        result = flask_app(environ, start_response)
+        return result, iter(result)
+
+    result, chunks = await loop.run_in_executor(wsgi_executor, context.run, run)
+    try:
+        await send({'type': 'http.response.start', 'status': response['status'], 'headers': response['headers']})
+        while True:
+            block = await loop.run_in_executor(wsgi_executor, context.run, next_block, chunks)
+            if not block:
+                break
+            await send({'type': 'http.response.body', 'body': block, 'more_body': True})
+        await send({'type': 'http.response.body', 'body': b''})
+    finally:
+        if hasattr(result, 'close'):
+            await loop.run_in_executor(wsgi_executor, context.run, result.close)
+
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            flask_module.start_background_jobs()
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            flask_module.stop_background_jobs(timeout=5)
+            db.shutdown()
+            wsgi_executor.shutdown(wait=False)
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def app(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        await lifespan(receive, send)
+        return
+    if scope['type'] != 'http':
+        return
+    if scope['method'] == 'GET' and (scope['path'] in JSON_ROUTES or scope['path'] == '/api/stream'):
+        try:
+            farm = shards.resolve(request_farm(scope))
+        except UnknownFarm as e:
+            await send_json(send, 404, {'error': str(e)})
+            return
+        with use_farm(farm):
+            if scope['path'] == '/api/stream':
+                await serve_stream(receive, send)
+            else:
+                await serve_json(scope['path'], JSON_ROUTES[scope['path']], scope, send)
+        return
+    await call_wsgi(scope, receive, send)
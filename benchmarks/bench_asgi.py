@@ -0,0 +1,191 @@
+"""Compare the ASGI entry point with the threaded WSGI server under many
+concurrent connections.
+
+Usage:
+    python benchmarks/bench_asgi.py [--fields 500] [--connections 1000]
+                                    [--requests 20000] [--streams 1000]
+
+Both servers run the same app over the same seeded database. An asyncio
+load generator opens ``--connections`` keep-alive sockets that poll the
+read routes (dashboard, fields, alerts, weather) while ``--streams``
+EventSource clients hold /api/stream open, which is the mix a farm
+dashboard produces. Per server it reports requests/sec, p50/p95/p99
+latency, errors, how many streams were held, and peak thread count.
+Requires uvicorn for the ASGI side.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from run_suite import percentile, seed_farm, start_server  # noqa: E402
+
+POLL_PATHS = ['/api/dashboard', '/api/fields', '/api/alerts', '/api/weather']
+
+
+async def http_get(reader, writer, path):
+    writer.write(f'GET {path} HTTP/1.1\r\nHost: bench\r\n\r\n'.encode())
+    status_line = await reader.readline()
+    if not status_line:
+        raise ConnectionError('closed')
+    status = int(status_line.split()[1])
+    length, keep_alive = None, True
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        name = name.lower()
+        if name == 'content-length':
+            length = int(value)
+        elif name == 'connection':
+            keep_alive = value.strip().lower() != 'close'
+    if length is None:
+        raise ConnectionError('response without content-length')
+    await reader.readexactly(length)
+    return status, keep_alive
+
+
+async def poller(port, jobs, latencies, errors):
+    reader = writer = None
+    while jobs:
+        path = jobs.pop()
+        try:
+            if writer is None:
+                reader, writer = await asyncio.open_connection('127.0.0.1', port)
+            t = time.perf_counter()
+            status, keep_alive = await http_get(reader, writer, path)
+            latencies.append(time.perf_counter() - t)
+            errors[0] += status >= 500
+            # The werkzeug dev server closes every connection after one response.
+            if not keep_alive:
+                writer.close()
+                reader = writer = None
+        except (OSError, ConnectionError, asyncio.IncompleteReadError, ValueError):
+            errors[0] += 1
+            if writer is not None:
+                writer.close()
+            reader = writer = None
+    if writer is not None:
+        writer.close()
+
+
+async def stream_client(port, opened, stop):
+    try:
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        writer.write(b'GET /api/stream HTTP/1.1\r\nHost: bench\r\nAccept: text/event-stream\r\n\r\n')
+        status_line = await reader.readline()
+        if b' 200 ' not in status_line:
+            return
+        opened[0] += 1
+        await stop.wait()
+        writer.close()
+    except OSError:
+        pass
+
+
+async def load(port, connections, total, streams, rng):
+    stop = asyncio.Event()
+    opened = [0]
+    stream_tasks = [asyncio.ensure_future(stream_client(port, opened, stop)) for _ in range(streams)]
+    # Let the streams connect before polling starts.
+    for _ in range(100):
+        if opened[0] >= streams:
+            break
+        await asyncio.sleep(0.05)
+
+    jobs = [rng.choice(POLL_PATHS) for _ in range(total)]
+    latencies, errors = [], [0]
+    peak_threads = threading.active_count()
+    start = time.perf_counter()
+    pollers = asyncio.gather(*(poller(port, jobs, latencies, errors) for _ in range(connections)))
+    while not pollers.done():
+        peak_threads = max(peak_threads, threading.active_count())
+        await asyncio.sleep(0.05)
+    await pollers
+    elapsed = time.perf_counter() - start
+
+    stop.set()
+    await asyncio.gather(*stream_tasks, return_exceptions=True)
+    values = sorted(latencies)
+    return {
+        'requests': len(values),
+        'errors': errors[0],
+        'requests_per_sec': round(len(values) / elapsed, 1),
+        'p50_ms': round(percentile(values, 50) * 1000, 2) if values else None,
+        'p95_ms': round(percentile(values, 95) * 1000, 2) if values else None,
+        'p99_ms': round(percentile(values, 99) * 1000, 2) if values else None,
+        'streams_held': opened[0],
+        'peak_threads': peak_threads,
+    }
+
+
+def start_uvicorn(asgi_app):
+    import uvicorn
+
+    config = uvicorn.Config(asgi_app, host='127.0.0.1', port=0, log_level='warning', lifespan='off', backlog=4096)
+    server = uvicorn.Server(config)
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    return server, server.servers[0].sockets[0].getsockname()[1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--fields', type=int, default=500)
+    parser.add_argument('--connections', type=int, default=1000)
+    parser.add_argument('--requests', type=int, default=20000)
+    parser.add_argument('--streams', type=int, default=1000)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    db_path = os.path.join(tempfile.mkdtemp(prefix='agri-asgi-'), 'bench.db')
+    os.environ['DATABASE_URL'] = 'sqlite:///' + db_path
+    os.environ['METRICS_MODE'] = 'off'
+    os.environ.setdefault('SSE_MAX_CLIENTS', str(args.streams * 2))
+    sys.path.insert(0, ROOT)
+
+    import app as app_module
+    seed_farm(db_path, args.fields, 1, 24, 2, 5, rng)
+    app_module.refresh_forecasts()
+    app_module.refresh_field_state()
+
+    report = {'parameters': vars(args)}
+    wsgi_server = start_server(app_module.app)
+    try:
+        report['wsgi'] = asyncio.run(load(wsgi_server.server_port, args.connections, args.requests,
+                                          args.streams, random.Random(args.seed)))
+    finally:
+        # Threaded werkzeug keeps per-connection threads; close streams first.
+        app_module.broker.publish('shutdown', {})
+        wsgi_server.shutdown()
+
+    try:
+        import asgi
+    except ImportError as e:
+        report['asgi'] = {'skipped': str(e)}
+    else:
+        try:
+            server, port = start_uvicorn(asgi.app)
+        except ImportError:
+            report['asgi'] = {'skipped': 'uvicorn is not installed (pip install uvicorn)'}
+        else:
+            report['asgi'] = asyncio.run(load(port, args.connections, args.requests,
+                                              args.streams, random.Random(args.seed)))
+            server.should_exit = True
+
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,111 @@
+"""Bandwidth and server CPU of the polled JSON routes with and without
+conditional GET.
+
+Usage:
+    python benchmarks/bench_conditional.py [--fields 1000] [--tabs 50]
+                                           [--polls 20] [--write-every 5]
+
+``--tabs`` dashboard tabs each poll /api/fields, /api/alerts, /api/weather
+and /api/crop-yield-forecast ``--polls`` times; every ``--write-every``
+rounds one field update and one new alert land. Three client behaviours
+are measured through Flask's test client, reporting bytes sent and server
+CPU seconds:
+
+* ``uncached``     - the route body run on every request, uncompressed
+  (what every poll cost before conditional GET);
+* ``plain``        - clients that send neither If-None-Match nor
+  Accept-Encoding (served from the encoded-body cache);
+* ``revalidating`` - browsers: ``Accept-Encoding: gzip, br`` and the last
+  ETag in If-None-Match.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from run_suite import seed_farm  # noqa: E402
+
+PATHS = ['/api/fields', '/api/alerts', '/api/weather', '/api/crop-yield-forecast']
+
+
+def run(app_module, mode, args, rng):
+    client = app_module.app.test_client()
+    views = {path: app_module.app.view_functions[app_module.app.url_map.bind('').match(path)[0]].__wrapped__
+             for path in PATHS}
+    etags = {}
+    sent = requests = not_modified = 0
+    cpu = 0.0
+    for round_no in range(args.polls):
+        if round_no and round_no % args.write_every == 0:
+            client.post('/api/field-update', json={'field_id': rng.randint(1, args.fields), 'soil_moisture': 50})
+            client.post('/api/alerts', json={'field_id': 1, 'alert_type': 'Heat Stress', 'message': 'bench',
+                                             'recommendation': 'bench', 'priority': 'High'})
+        for tab in range(args.tabs):
+            for path in PATHS:
+                started = time.process_time()
+                if mode == 'uncached':
+                    with app_module.app.test_request_context(path):
+                        body = views[path]().get_data()
+                    status = 200
+                else:
+                    headers = {}
+                    if mode == 'revalidating':
+                        headers['Accept-Encoding'] = 'gzip, br'
+                        if (tab, path) in etags:
+                            headers['If-None-Match'] = etags[tab, path]
+                    response = client.get(path, headers=headers)
+                    body, status = response.get_data(), response.status_code
+                    etags[tab, path] = response.headers.get('ETag')
+                cpu += time.process_time() - started
+                requests += 1
+                sent += len(body)
+                not_modified += status == 304
+    return {
+        'requests': requests,
+        'not_modified': not_modified,
+        'bytes_sent': sent,
+        'cpu_seconds': round(cpu, 3),
+        'cpu_us_per_request': round(cpu / requests * 1e6, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--fields', type=int, default=1000)
+    parser.add_argument('--tabs', type=int, default=50)
+    parser.add_argument('--polls', type=int, default=20)
+    parser.add_argument('--write-every', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    db_path = os.path.join(tempfile.mkdtemp(prefix='agri-etag-'), 'bench.db')
+    os.environ['DATABASE_URL'] = 'sqlite:///' + db_path
+    os.environ['METRICS_MODE'] = 'off'
+    os.environ['FLASK_CONFIG'] = 'production'
+    sys.path.insert(0, ROOT)
+
+    import app as app_module
+    # Keep the alert engine from growing /api/alerts between modes.
+    app_module.stop_background_jobs()
+    seed_farm(db_path, args.fields, 1, 24, 2, 5, random.Random(args.seed))
+    app_module.refresh_forecasts()
+    app_module.refresh_field_state()
+
+    report = {'parameters': vars(args)}
+    for mode in ('uncached', 'plain', 'revalidating'):
+        report[mode] = run(app_module, mode, args, random.Random(args.seed))
+    base = report['uncached']
+    for mode in ('plain', 'revalidating'):
+        report[mode]['bytes_reduction'] = round(base['bytes_sent'] / max(report[mode]['bytes_sent'], 1), 1)
+        report[mode]['cpu_reduction'] = round(base['cpu_seconds'] / max(report[mode]['cpu_seconds'], 1e-9), 1)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
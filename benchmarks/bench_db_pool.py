@@ -0,0 +1,64 @@
+"""Compare requests/sec for read routes with and without the connection pool.
+
+Usage:
+    python benchmarks/bench_db_pool.py [--requests 2000] [--threads 4]
+
+Runs against a throwaway SQLite file so the real agriculture.db is untouched.
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+
+ROUTES = ['/api/dashboard', '/api/fields', '/api/alerts', '/api/weather', '/api/analytics']
+
+
+def run(client_factory, total, threads):
+    per_thread = total // threads
+    barrier = threading.Barrier(threads + 1)
+
+    def worker():
+        client = client_factory()
+        barrier.wait()
+        for i in range(per_thread):
+            resp = client.get(ROUTES[i % len(ROUTES)])
+            assert resp.status_code == 200, resp.status_code
+
+    workers = [threading.Thread(target=worker) for _ in range(threads)]
+    for w in workers:
+        w.start()
+    barrier.wait()
+    start = time.perf_counter()
+    for w in workers:
+        w.join()
+    elapsed = time.perf_counter() - start
+    return per_thread * threads / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--threads', type=int, default=4)
+    args = parser.parse_args()
+
+    tmpdir = tempfile.mkdtemp(prefix='agri-bench-')
+    os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tmpdir, 'bench.db')
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from app import app
+
+    results = {}
+    for label, enabled in (('connect_per_request', False), ('pooled', True)):
+        app.config['DB_POOL_ENABLED'] = enabled
+        run(app.test_client, min(200, args.requests), args.threads)  # warm-up
+        results[label] = round(run(app.test_client, args.requests, args.threads), 1)
+
+    results['speedup'] = round(results['pooled'] / results['connect_per_request'], 2)
+    print(json.dumps({'requests_per_sec': results, 'threads': args.threads,
+                      'requests': args.requests}, indent=2))
+
+
+if __name__ == '__main__':
+    main()
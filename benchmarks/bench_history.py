@@ -0,0 +1,128 @@
+"""Hot-path latency with years of NPK telemetry, before and after history
+compaction.
+
+Usage:
+    python benchmarks/bench_history.py [--fields 300] [--months 24]
+                                       [--interval 30] [--samples 500]
+
+Seeds ``--fields`` fields with one NPK reading every ``--interval`` minutes
+for ``--months`` months, all in npk_levels (the old single unbounded
+table), and measures:
+
+* ``npk_route``   - GET /api/npk-levels/<id> for random fields;
+* ``latest_scan`` - the per-field latest reading as it used to be read
+  (GROUP BY over npk_levels), against ``latest_npk`` on npk_latest;
+* ``ingest``      - one bulk-ingest batch of a reading per field;
+* the npk_levels row count and the live database size.
+
+It then runs one compaction cycle with the ``config.py`` retention and
+measures again.
+"""
+import argparse
+import json
+import os
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def seed(db_path, fields, months, interval, rng):
+    conn = sqlite3.connect(db_path)
+    now = datetime.now().replace(microsecond=0)
+    start = now - timedelta(days=30 * months)
+    with conn:
+        conn.executemany('INSERT INTO fields (id, name, crop, area_hectares, soil_moisture, temperature, health_status, created_at) '
+                         'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                         [(i, f'Bench {i}', 'Wheat', 10, 60, 24, 'Good', start) for i in range(1000, 1000 + fields)])
+    steps = int((now - start).total_seconds() // (interval * 60))
+    for chunk in range(0, steps, 500):
+        rows = [(f, rng.uniform(20, 90), rng.uniform(20, 90), rng.uniform(20, 90),
+                 (start + timedelta(minutes=interval * s)).strftime('%Y-%m-%d %H:%M:%S'))
+                for s in range(chunk, min(chunk + 500, steps)) for f in range(1000, 1000 + fields)]
+        with conn:
+            conn.executemany('INSERT INTO npk_levels (field_id, nitrogen, phosphorus, potassium, recorded_at) '
+                             'VALUES (?, ?, ?, ?, ?)', rows)
+    conn.close()
+    return steps * fields
+
+
+def measure(app_module, args, rng):
+    import numpy as np
+    from forecast import latest_npk
+    from ingest import ingest_readings
+
+    client = app_module.app.test_client()
+    route = []
+    for _ in range(args.samples):
+        started = time.perf_counter()
+        assert client.get(f'/api/npk-levels/{rng.randrange(1000, 1000 + args.fields)}').status_code == 200
+        route.append((time.perf_counter() - started) * 1000)
+    route.sort()
+
+    conn = app_module.get_db()
+    ids = np.arange(1000, 1000 + args.fields, dtype=np.int64)
+    started = time.perf_counter()
+    conn.execute('SELECT field_id, nitrogen, phosphorus, potassium, MAX(recorded_at) FROM npk_levels GROUP BY field_id').fetchall()
+    scan = time.perf_counter() - started
+    started = time.perf_counter()
+    latest_npk(conn, ids)
+    latest = time.perf_counter() - started
+
+    readings = [{'field_id': int(f), 'nitrogen': 60, 'phosphorus': 40, 'potassium': 60} for f in ids]
+    started = time.perf_counter()
+    for _ in range(5):
+        ingest_readings(conn, readings)
+    ingest = (time.perf_counter() - started) / 5
+
+    hot_rows = conn.execute('SELECT COUNT(*) FROM npk_levels').fetchone()[0]
+    pages, free, size = (conn.execute(f'PRAGMA {p}').fetchone()[0] for p in ('page_count', 'freelist_count', 'page_size'))
+    conn.close()
+    return {
+        'npk_route_ms_p50': round(statistics.median(route), 3),
+        'npk_route_ms_p99': round(route[int(len(route) * 0.99) - 1], 3),
+        'latest_scan_ms': round(scan * 1000, 1),
+        'latest_npk_ms': round(latest * 1000, 1),
+        'ingest_batch_ms': round(ingest * 1000, 1),
+        'npk_levels_rows': hot_rows,
+        'live_mb': round((pages - free) * size / 2 ** 20, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--fields', type=int, default=300)
+    parser.add_argument('--months', type=int, default=24)
+    parser.add_argument('--interval', type=int, default=30, help='minutes between readings')
+    parser.add_argument('--samples', type=int, default=500)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    db_path = os.path.join(tempfile.mkdtemp(prefix='agri-history-'), 'bench.db')
+    os.environ['DATABASE_URL'] = 'sqlite:///' + db_path
+    os.environ['METRICS_MODE'] = 'off'
+    sys.path.insert(0, ROOT)
+
+    import app as app_module
+    app_module.stop_background_jobs()
+
+    rng = random.Random(args.seed)
+    started = time.perf_counter()
+    readings = seed(db_path, args.fields, args.months, args.interval, rng)
+    report = {'parameters': vars(args), 'readings': readings, 'seed_seconds': round(time.perf_counter() - started, 1)}
+
+    report['single_table'] = measure(app_module, args, random.Random(args.seed))
+    started = time.perf_counter()
+    report['compaction'] = app_module.history_compactor.run_cycle()
+    report['compaction']['seconds'] = round(time.perf_counter() - started, 1)
+    report['partitioned'] = measure(app_module, args, random.Random(args.seed))
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
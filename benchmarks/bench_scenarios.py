@@ -0,0 +1,70 @@
+"""Wall time of the Monte Carlo yield simulation by worker count.
+
+Usage:
+    python benchmarks/bench_scenarios.py [--fields 1000] [--scenarios 10000]
+                                         [--days 7] [--workers 1,2,4,8]
+
+Builds ``--fields`` synthetic fields with a ``--days`` weather forecast and
+runs ``scenarios.ScenarioSimulator`` on them once per worker count (the
+pool is started before timing). It checks that every worker count gives
+the same bands, and reports seconds and scenario-field-days per second.
+With ``--workers 1`` the simulation runs in-process.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from config import Config  # noqa: E402
+from forecast import FieldFeatures  # noqa: E402
+from scenarios import ScenarioSimulator  # noqa: E402
+
+
+def synthetic_features(fields, days, rng):
+    weather = np.stack([np.where(rng.random(days) < 0.4, rng.uniform(1, 15, days), 0.0),
+                        rng.uniform(15, 32, days)], axis=1)
+    return FieldFeatures(np.arange(1, fields + 1, dtype=np.int64),
+                         list(rng.choice(['Wheat', 'Corn', 'Soybeans', 'Rice'], fields)),
+                         rng.uniform(30, 90, fields), rng.uniform(12, 38, fields),
+                         rng.uniform(20, 90, (fields, 3)), weather)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--fields', type=int, default=1000)
+    parser.add_argument('--scenarios', type=int, default=10000)
+    parser.add_argument('--days', type=int, default=7)
+    parser.add_argument('--workers', default=f'1,{os.cpu_count() or 1}')
+    args = parser.parse_args()
+
+    features = synthetic_features(args.fields, args.days, np.random.default_rng(1))
+    cfg = {k: getattr(Config, k) for k in dir(Config) if k.isupper()}
+    cells = args.scenarios * args.fields * args.days
+    report = {'parameters': vars(args), 'cpus': os.cpu_count(), 'cells': cells, 'runs': {}}
+    reference = None
+    for workers in sorted({int(w) for w in args.workers.split(',')}):
+        simulator = ScenarioSimulator({**cfg, 'SCENARIO_WORKERS': workers, 'SCENARIO_PARALLEL_MIN_CELLS': 0})
+        if simulator.workers > 1:
+            simulator._pool().submit(int).result()
+        started = time.perf_counter()
+        bands, farm = simulator.run(features, args.scenarios, Config.SCENARIO_SEED)
+        elapsed = time.perf_counter() - started
+        simulator.stop()
+        if reference is None:
+            reference = bands
+        report['runs'][workers] = {
+            'seconds': round(elapsed, 2),
+            'cells_per_sec': round(cells / elapsed),
+            'matches_serial': bool(np.array_equal(bands, reference)),
+        }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
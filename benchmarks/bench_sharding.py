@@ -0,0 +1,109 @@
+"""Write throughput of concurrent farms, one shared database file versus one
+file per farm.
+
+Usage:
+    python benchmarks/bench_sharding.py [--farms 1,2,4,8] [--batches 300]
+                                        [--fields 50]
+
+For each farm count N, N writer processes (one per farm) each commit
+``--batches`` bulk-ingest batches of one NPK reading per field, the write
+path sensor gateways use. In ``shared`` mode every writer's farm lives in the
+same file, as before sharding, so all commits queue on one write lock. In
+``sharded`` mode each farm has its own file. The script reports committed
+batches per second and the per-batch p99 latency. Scaling is bounded by the
+CPU cores and disk available: on a single core the writers also compete for
+the CPU, so the file lock is only part of the cost.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def writer(farm, field_ids, batches, start_at, out):
+    import app as app_module
+    from ingest import ingest_readings
+
+    readings = [{'field_id': f, 'nitrogen': 60, 'phosphorus': 40, 'potassium': 60, 'soil_moisture': 55} for f in field_ids]
+    conn = app_module.get_db(farm)
+    latencies = []
+    while time.time() < start_at:
+        time.sleep(0.001)
+    for _ in range(batches):
+        started = time.perf_counter()
+        ingest_readings(conn, readings)
+        latencies.append((time.perf_counter() - started) * 1000)
+    conn.close()
+    out.put((time.time(), latencies))
+
+
+def seed_fields(app_module, farm, prefix, count):
+    conn = app_module.get_db(farm)
+    with conn:
+        conn.executemany('INSERT INTO fields (name, crop, area_hectares, soil_moisture, temperature, health_status, created_at, farm) '
+                         "VALUES (?, 'Wheat', 10, 60, 24, 'Good', CURRENT_TIMESTAMP, ?)",
+                         [(f'{prefix} {i}', farm) for i in range(count)])
+    ids = [r[0] for r in conn.execute('SELECT id FROM fields WHERE name LIKE ?', (prefix + ' %',))]
+    conn.close()
+    return ids
+
+
+def run(app_module, targets, args):
+    """``targets`` is one (farm, field_ids) per writer process."""
+    ctx = multiprocessing.get_context('fork')
+    out = ctx.Queue()
+    start_at = time.time() + 0.5
+    procs = [ctx.Process(target=writer, args=(farm, ids, args.batches, start_at, out)) for farm, ids in targets]
+    for p in procs:
+        p.start()
+    results = [out.get() for _ in procs]
+    for p in procs:
+        p.join()
+    elapsed = max(end for end, _ in results) - start_at
+    latencies = sorted(ms for _, per_writer in results for ms in per_writer)
+    return {
+        'batches_per_sec': round(len(latencies) / elapsed, 1),
+        'batch_ms_p50': round(statistics.median(latencies), 2),
+        'batch_ms_p99': round(latencies[int(len(latencies) * 0.99) - 1], 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--farms', default='1,2,4,8', help='comma-separated writer counts')
+    parser.add_argument('--batches', type=int, default=300, help='ingest batches per writer')
+    parser.add_argument('--fields', type=int, default=50, help='fields (readings) per batch')
+    args = parser.parse_args()
+    counts = [int(n) for n in args.farms.split(',')]
+
+    root = tempfile.mkdtemp(prefix='agri-shards-')
+    os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(root, 'default.db')
+    os.environ['FARM_SHARDS'] = ','.join(f'farm{i}={os.path.join(root, f"farm{i}.db")}' for i in range(max(counts)))
+    os.environ['METRICS_MODE'] = 'off'
+    os.environ['FLASK_CONFIG'] = 'production'
+    sys.path.insert(0, ROOT)
+
+    import app as app_module
+    app_module.stop_background_jobs()
+    shared = [seed_fields(app_module, 'default', f'Shared {i}', args.fields) for i in range(max(counts))]
+    sharded = [seed_fields(app_module, f'farm{i}', f'Sharded {i}', args.fields) for i in range(max(counts))]
+    for pool in app_module.db_pool.farm_instances():
+        pool.close_all()
+
+    report = {'parameters': vars(args), 'cpus': os.cpu_count(), 'results': {}}
+    for n in counts:
+        report['results'][n] = {
+            'shared': run(app_module, [('default', shared[i]) for i in range(n)], args),
+            'sharded': run(app_module, [(f'farm{i}', sharded[i]) for i in range(n)], args),
+        }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+"""Loading a multi-station weather forecast: one call per day versus one bulk
+import, and the cost of reading it back.
+
+Usage:
+    python benchmarks/bench_weather.py [--stations 1000] [--days 16]
+                                       [--per-day-sample 2000] [--reads 500]
+
+Builds a ``--days``-day forecast for ``--stations`` stations and loads it:
+
+* ``per_day``     - POST /api/weather/update for the first
+  ``--per-day-sample`` station-days (one round trip and commit each), with
+  the time for the whole forecast projected from that rate;
+* ``bulk_json``   - the whole forecast in one POST /api/weather/import;
+* ``bulk_csv``    - the same as text/csv;
+* ``read``        - GET /api/weather?station=... latency with the full
+  forecast loaded (ETag cache bypassed).
+"""
+import argparse
+import csv
+import io
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def build_forecast(stations, days, rng):
+    today = date.today()
+    return [{'station': f'station-{s}', 'forecast_date': (today + timedelta(days=d)).isoformat(),
+             'condition': rng.choice(['Clear', 'Partly Cloudy', 'Rain']),
+             'min_temp': round(rng.uniform(8, 18), 1), 'max_temp': round(rng.uniform(20, 34), 1),
+             'humidity': round(rng.uniform(30, 95)), 'precipitation': round(rng.choice([0, 0, rng.uniform(0, 20)]), 1)}
+            for s in range(stations) for d in range(days)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--stations', type=int, default=1000)
+    parser.add_argument('--days', type=int, default=16)
+    parser.add_argument('--per-day-sample', type=int, default=2000)
+    parser.add_argument('--reads', type=int, default=500)
+    args = parser.parse_args()
+
+    db_path = os.path.join(tempfile.mkdtemp(prefix='agri-weather-'), 'bench.db')
+    os.environ['DATABASE_URL'] = 'sqlite:///' + db_path
+    os.environ['METRICS_MODE'] = 'off'
+    os.environ['FLASK_CONFIG'] = 'production'
+    sys.path.insert(0, ROOT)
+
+    import app as app_module
+    app_module.stop_background_jobs()
+    client = app_module.app.test_client()
+    rng = random.Random(1)
+    forecast = build_forecast(args.stations, args.days, rng)
+    report = {'parameters': vars(args), 'station_days': len(forecast)}
+
+    sample = forecast[:args.per_day_sample]
+    started = time.perf_counter()
+    for day in sample:
+        assert client.post('/api/weather/update', json=day).status_code == 200
+    elapsed = time.perf_counter() - started
+    report['per_day'] = {
+        'requests': len(sample),
+        'seconds': round(elapsed, 2),
+        'projected_seconds': round(elapsed / len(sample) * len(forecast), 1),
+    }
+
+    body = json.dumps(forecast)
+    started = time.perf_counter()
+    response = client.post('/api/weather/import', data=body, content_type='application/json')
+    report['bulk_json'] = {'requests': 1, 'seconds': round(time.perf_counter() - started, 3), 'result': response.get_json()}
+
+    out = io.StringIO()
+    writer = csv.DictWriter(out, fieldnames=list(forecast[0]))
+    writer.writeheader()
+    writer.writerows(forecast)
+    started = time.perf_counter()
+    response = client.post('/api/weather/import', data=out.getvalue(), content_type='text/csv')
+    report['bulk_csv'] = {'requests': 1, 'seconds': round(time.perf_counter() - started, 3), 'result': response.get_json()}
+
+    conn = app_module.get_db()
+    report['weather_rows'] = conn.execute('SELECT COUNT(*) FROM weather').fetchone()[0]
+    conn.close()
+
+    latencies = []
+    for _ in range(args.reads):
+        station = f'station-{rng.randrange(args.stations)}'
+        started = time.perf_counter()
+        conn = app_module.get_db()
+        app_module.load_weather(conn, {'station': station})
+        conn.close()
+        latencies.append((time.perf_counter() - started) * 1000)
+    latencies.sort()
+    report['read'] = {
+        'ms_p50': round(statistics.median(latencies), 3),
+        'ms_p99': round(latencies[int(len(latencies) * 0.99) - 1], 3),
+    }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,113 @@
+"""Latency and commit count of POST /api/field-update, synchronous versus
+write-behind.
+
+Usage:
+    python benchmarks/bench_write_behind.py [--fields 1000] [--threads 16]
+                                            [--updates 500]
+
+``--threads`` sensor gateways each post ``--updates`` soil-moisture ticks
+for their own share of ``--fields`` fields through Flask's test client.
+The script reports per-request latency, throughput and the number of
+SQLite commits in both modes. After the write-behind run it stops the
+buffer (final flush) and checks that every field holds its last posted
+value.
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def run(app_module, args, commits):
+    latencies = [[] for _ in range(args.threads)]
+    expected = {}
+    barrier = threading.Barrier(args.threads + 1)
+    field_ids = [r[0] for r in app_module.get_db().execute('SELECT id FROM fields ORDER BY id LIMIT ?', (args.fields,))]
+
+    def gateway(index):
+        client = app_module.app.test_client()
+        rng = random.Random(index)
+        mine = field_ids[index::args.threads]
+        barrier.wait()
+        for _ in range(args.updates):
+            field_id, value = rng.choice(mine), round(rng.uniform(30, 90), 1)
+            started = time.perf_counter()
+            status = client.post('/api/field-update', json={'field_id': field_id, 'soil_moisture': value}).status_code
+            latencies[index].append((time.perf_counter() - started) * 1000)
+            assert status in (200, 202), status
+            expected[field_id] = value
+
+    threads = [threading.Thread(target=gateway, args=(i,)) for i in range(args.threads)]
+    for t in threads:
+        t.start()
+    commits[0] = 0
+    barrier.wait()
+    started = time.perf_counter()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - started
+    app_module.field_update_buffer.stop()
+
+    all_ms = sorted(ms for per_thread in latencies for ms in per_thread)
+    conn = app_module.get_db()
+    stored = dict(conn.execute('SELECT id, soil_moisture FROM fields').fetchall())
+    conn.close()
+    return {
+        'requests': len(all_ms),
+        'requests_per_sec': round(len(all_ms) / elapsed, 1),
+        'latency_ms_p50': round(statistics.median(all_ms), 3),
+        'latency_ms_p99': round(all_ms[int(len(all_ms) * 0.99) - 1], 3),
+        'commits': commits[0],
+        'last_write_wins': all(stored[f] == v for f, v in expected.items()),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--fields', type=int, default=1000)
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--updates', type=int, default=500, help='posts per thread')
+    args = parser.parse_args()
+
+    db_path = os.path.join(tempfile.mkdtemp(prefix='agri-write-behind-'), 'bench.db')
+    os.environ['DATABASE_URL'] = 'sqlite:///' + db_path
+    os.environ['METRICS_MODE'] = 'off'
+    os.environ['FLASK_CONFIG'] = 'production'
+    sys.path.insert(0, ROOT)
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+    import app as app_module
+    from run_suite import seed_farm
+    app_module.stop_background_jobs()
+    seed_farm(db_path, args.fields, 0, 24, 0, 0, random.Random(1))
+    app_module.refresh_field_state()
+
+    # Count COMMITs on every pooled connection.
+    commits = [0]
+    pool = app_module.db_pool.farm_instance('default')
+    connect = pool._connect
+
+    def counting_connect():
+        conn = connect()
+        conn.set_trace_callback(lambda sql: sql.startswith('COMMIT') and commits.__setitem__(0, commits[0] + 1))
+        return conn
+    pool.close_all()
+    pool._connect = counting_connect
+
+    report = {'parameters': vars(args)}
+    for mode, enabled in (('synchronous', False), ('write_behind', True)):
+        app_module.app.config['FIELD_UPDATE_WRITE_BEHIND'] = enabled
+        report[mode] = run(app_module, args, commits)
+    report['write_behind']['buffer'] = app_module.field_update_buffer.stats
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
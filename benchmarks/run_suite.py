@@ -0,0 +1,265 @@
+"""Reproducible load test and micro-benchmark for every API route.
+
+Usage:
+    python benchmarks/run_suite.py [--fields 500] [--years 1] [--iterations 200]
+                                   [--concurrency 8] [--http-requests 2000]
+                                   [--seed 42] [--output results.json]
+
+Seeds a synthetic farm into a throwaway SQLite file (schema from the app's
+own init_db()), then measures every route twice:
+
+* ``test_client`` - sequential calls through Flask's test client, which
+  isolates handler + database cost from the network stack;
+* ``http``        - a concurrent keep-alive load generator against a local
+  threaded server, for end-to-end latency and throughput.
+
+Results (p50/p95/p99 latency in ms and requests/sec per route) are printed
+as JSON so runs can be diffed or gated in CI.
+"""
+import argparse
+import http.client
+import json
+import os
+import platform
+import random
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CROPS = ['Wheat', 'Corn', 'Soybeans', 'Rice']
+HEALTH = ['Healthy', 'Needs Water', 'Excellent', 'Optimal', 'Poor']
+ALERT_TYPES = ['Nutrient Deficiency', 'Low Soil Moisture', 'Heat Stress', 'Irrigation Scheduled']
+PRIORITIES = ['High', 'Medium', 'Low']
+
+# Routes that never finish (streams) or are not part of the API.
+SKIP_RULES = {'/', '/api/stream', '/static/<path:filename>'}
+
+
+def seed_farm(db_path, fields, years, npk_interval_hours, irrigations_per_week, alerts_per_field, rng):
+    """Bulk-load a synthetic farm history on top of the app's schema."""
+    conn = sqlite3.connect(db_path)
+    now = datetime.now()
+    start = now - timedelta(days=365 * years)
+
+    conn.executemany('INSERT OR IGNORE INTO fields (name, crop, area_hectares, soil_moisture, temperature, health_status, created_at) VALUES (?, ?, ?, ?, ?, ?, ?)',
+                     [(f'Bench Field {i}', rng.choice(CROPS), round(rng.uniform(5, 40), 1), round(rng.uniform(35, 90), 1),
+                       round(rng.uniform(12, 38), 1), rng.choice(HEALTH), start) for i in range(fields)])
+    field_ids = [r[0] for r in conn.execute('SELECT id FROM fields')]
+
+    step = timedelta(hours=npk_interval_hours)
+    readings = int((now - start) / step)
+
+    def npk_rows():
+        for field_id in field_ids:
+            for i in range(readings):
+                yield (field_id, rng.uniform(30, 90), rng.uniform(20, 60), rng.uniform(40, 90), start + i * step)
+
+    conn.executemany('INSERT INTO npk_levels (field_id, nitrogen, phosphorus, potassium, recorded_at) VALUES (?, ?, ?, ?, ?)', npk_rows())
+
+    weeks = 52 * years
+
+    def irrigation_rows():
+        for field_id in field_ids:
+            for w in range(weeks * irrigations_per_week):
+                at = start + timedelta(days=7 * w / irrigations_per_week)
+                yield (field_id, rng.randint(10, 90), rng.uniform(200, 2000), at, 'Completed', at)
+
+    conn.executemany('INSERT INTO irrigation_records (field_id, duration_minutes, water_volume_liters, scheduled_time, status, created_at) VALUES (?, ?, ?, ?, ?, ?)',
+                     irrigation_rows())
+
+    conn.executemany('INSERT INTO alerts (field_id, alert_type, message, recommendation, priority, created_at, resolved) VALUES (?, ?, ?, ?, ?, ?, ?)',
+                     [(field_id, rng.choice(ALERT_TYPES), f'Synthetic alert {n} for field {field_id}', 'Inspect field',
+                       rng.choice(PRIORITIES), start + timedelta(days=rng.uniform(0, 365 * years)), int(rng.random() < 0.8))
+                      for field_id in field_ids for n in range(alerts_per_field)])
+    conn.commit()
+
+    counts = {t: conn.execute(f'SELECT COUNT(*) FROM {t}').fetchone()[0]
+              for t in ('fields', 'npk_levels', 'irrigation_records', 'alerts', 'weather')}
+    conn.close()
+    return field_ids, counts
+
+
+def build_plan(app, field_ids, rng):
+    """One (name, method, path, json body factory) entry per API route."""
+    def field():
+        return rng.choice(field_ids)
+
+    bodies = {
+        ('/api/irrigation/start', 'POST'): lambda: {'field_id': field(), 'duration': 30, 'water_volume': 500},
+        ('/api/alerts', 'POST'): lambda: {'field_id': field(), 'alert_type': 'Benchmark', 'message': 'bench',
+                                          'recommendation': 'none', 'priority': 'Low'},
+        ('/api/weather/update', 'POST'): lambda: {'forecast_date': str(datetime.now().date()), 'condition': 'Clear',
+                                                  'min_temp': 18, 'max_temp': 29, 'humidity': 60, 'precipitation': 0},
+        ('/api/npk-levels/<int:field_id>', 'POST'): lambda: {'nitrogen': 60, 'phosphorus': 40, 'potassium': 70},
+        ('/api/field-update', 'POST'): lambda: {'field_id': field(), 'soil_moisture': round(rng.uniform(40, 90), 1)},
+        ('/api/ingest', 'POST'): lambda: [{'field_id': field(), 'nitrogen': 60, 'phosphorus': 40, 'potassium': 70,
+                                           'soil_moisture': 70.0} for _ in range(100)],
+    }
+    args = {
+        'field_id': field,
+        'alert_id': lambda: rng.randint(1, 1000),
+        'dataset': lambda: 'npk-levels',
+    }
+
+    plan = []
+    for rule in app.url_map.iter_rules():
+        if rule.rule in SKIP_RULES:
+            continue
+        for method in sorted(rule.methods - {'HEAD', 'OPTIONS'}):
+            body = bodies.get((rule.rule, method), (lambda: {}) if method != 'GET' else None)
+
+            def path(rule=rule):
+                values = {name: args[name]() for name in rule.arguments}
+                url = rule.build(values, append_unknown=False)[1]
+                if rule.rule == '/api/export/<dataset>':
+                    url += f'?field_id={field()}&limit=1000'
+                return url
+
+            plan.append((f'{method} {rule.rule}', method, path, body))
+    return sorted(plan, key=lambda p: p[0])
+
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return None
+    k = min(len(sorted_values) - 1, max(0, int(round(q / 100 * (len(sorted_values) - 1)))))
+    return sorted_values[k]
+
+
+def summarize(latencies, elapsed, errors):
+    values = sorted(latencies)
+    return {
+        'requests': len(values),
+        'errors': errors,
+        'p50_ms': round(percentile(values, 50) * 1000, 3) if values else None,
+        'p95_ms': round(percentile(values, 95) * 1000, 3) if values else None,
+        'p99_ms': round(percentile(values, 99) * 1000, 3) if values else None,
+        'mean_ms': round(sum(values) / len(values) * 1000, 3) if values else None,
+        'requests_per_sec': round(len(values) / elapsed, 1) if elapsed else None,
+    }
+
+
+def bench_test_client(app, plan, iterations):
+    client = app.test_client()
+    results = {}
+    for name, method, path, body in plan:
+        latencies, errors = [], 0
+        start = time.perf_counter()
+        for _ in range(iterations):
+            t = time.perf_counter()
+            resp = client.open(path(), method=method, json=body() if body else None)
+            resp.get_data()
+            latencies.append(time.perf_counter() - t)
+            errors += resp.status_code >= 500
+        results[name] = summarize(latencies, time.perf_counter() - start, errors)
+    return results
+
+
+def start_server(app):
+    from werkzeug.serving import WSGIRequestHandler, make_server
+
+    class KeepAliveHandler(WSGIRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def log_request(self, *args, **kwargs):
+            pass
+
+    server = make_server('127.0.0.1', 0, app, threaded=True, request_handler=KeepAliveHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def bench_http(port, plan, total_requests, concurrency):
+    results = {}
+    local = threading.local()
+
+    def call(method, url, payload):
+        conn = getattr(local, 'conn', None)
+        if conn is None:
+            conn = local.conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+        data = json.dumps(payload).encode() if payload is not None else None
+        headers = {'Content-Type': 'application/json'} if data is not None else {}
+        t = time.perf_counter()
+        try:
+            conn.request(method, url, body=data, headers=headers)
+            resp = conn.getresponse()
+            resp.read()
+            status = resp.status
+        except (http.client.HTTPException, OSError):
+            local.conn = None
+            status = 599
+        return time.perf_counter() - t, status
+
+    with ThreadPoolExecutor(concurrency) as pool:
+        for name, method, path, body in plan:
+            jobs = [(method, path(), body() if body else None) for _ in range(total_requests)]
+            start = time.perf_counter()
+            outcomes = list(pool.map(lambda job: call(*job), jobs))
+            elapsed = time.perf_counter() - start
+            results[name] = summarize([o[0] for o in outcomes], elapsed, sum(o[1] >= 500 for o in outcomes))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--fields', type=int, default=500)
+    parser.add_argument('--years', type=int, default=1)
+    parser.add_argument('--npk-interval-hours', type=int, default=24)
+    parser.add_argument('--irrigations-per-week', type=int, default=2)
+    parser.add_argument('--alerts-per-field', type=int, default=5)
+    parser.add_argument('--iterations', type=int, default=200, help='test-client calls per route')
+    parser.add_argument('--http-requests', type=int, default=1000, help='HTTP calls per route (0 to skip)')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--metrics-mode', default='off', choices=['off', 'basic', 'full'])
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', help='write JSON results to this file as well as stdout')
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    tmpdir = tempfile.mkdtemp(prefix='agri-suite-')
+    db_path = os.path.join(tmpdir, 'suite.db')
+    os.environ['DATABASE_URL'] = 'sqlite:///' + db_path
+    os.environ['METRICS_MODE'] = args.metrics_mode
+    sys.path.insert(0, ROOT)
+
+    import app as app_module
+    app = app_module.app
+
+    seed_start = time.perf_counter()
+    field_ids, counts = seed_farm(db_path, args.fields, args.years, args.npk_interval_hours,
+                                  args.irrigations_per_week, args.alerts_per_field, rng)
+    app_module.refresh_forecasts()
+    app_module.refresh_field_state()
+    seed_seconds = time.perf_counter() - seed_start
+
+    plan = build_plan(app, field_ids, rng)
+    report = {
+        'timestamp': datetime.now().isoformat(),
+        'python': platform.python_version(),
+        'sqlite': sqlite3.sqlite_version,
+        'parameters': vars(args),
+        'dataset': {'rows': counts, 'seed_seconds': round(seed_seconds, 2), 'db_path': db_path},
+        'test_client': bench_test_client(app, plan, args.iterations),
+    }
+    if args.http_requests:
+        server = start_server(app)
+        try:
+            report['http'] = bench_http(server.server_port, plan, args.http_requests, args.concurrency)
+        finally:
+            server.shutdown()
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text)
+    print(text)
+
+
+if __name__ == '__main__':
+    main()
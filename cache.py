@@ -0,0 +1,69 @@
+import threading
+import time
+
+
+class TTLCache:
+    """Small in-process cache for computed API payloads.
+
+    Entries expire after ``ttl`` seconds and can also be dropped early by
+    naming the tables they were computed from, so write routes can
+    invalidate exactly the aggregates they made stale. Loads are
+    single-flight per key: concurrent misses wait for one loader instead of
+    all hitting the database.
+    """
+
+    def __init__(self, ttl, maxsize=256):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._entries = {}
+        self._lock = threading.Lock()
+        self._key_locks = {}
+        self._generation = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        entry = self._entries.get(key)
+        if entry is None or entry[0] < time.monotonic():
+            return None
+        return entry[1]
+
+    def set(self, key, value, depends_on=()):
+        with self._lock:
+            if len(self._entries) >= self.maxsize and key not in self._entries:
+                self._entries.pop(min(self._entries, key=lambda k: self._entries[k][0]))
+            self._entries[key] = (time.monotonic() + self.ttl, value, frozenset(depends_on))
+
+    def get_or_load(self, key, loader, depends_on=()):
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] >= time.monotonic():
+            self.hits += 1
+            return entry[1]
+
+        with self._lock:
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+        with key_lock:
+            # Another thread may have filled the entry while we waited.
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] >= time.monotonic():
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+            generation = self._generation
+            value = loader()
+            # Skip storing a result that raced with an invalidating write.
+            if generation == self._generation:
+                self.set(key, value, depends_on)
+            return value
+
+    def invalidate(self, *tables):
+        tables = set(tables)
+        with self._lock:
+            self._generation += 1
+            for key in [k for k, e in self._entries.items() if e[2] & tables]:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
@@ -0,0 +1,87 @@
+"""Conditional GET and compression for the polled JSON read routes.
+
+Every write already reports the tables it touched (``tables_changed``);
+those calls also bump a per-table counter in ``table_versions``. A read
+route's ETag is just the counters of the tables its payload is built from,
+so answering ``If-None-Match`` costs one tiny primary-key read and no
+payload query. The counters live in SQLite rather than in process memory so
+that every pre-fork worker sees writes handled by the others.
+
+Bodies above ``COMPRESS_MIN_SIZE`` are brotli- (when the optional
+``brotli`` package is installed) or gzip-encoded according to the client's
+``Accept-Encoding``. ETags are weak, since one version is served in several
+encodings.
+"""
+import gzip
+
+try:
+    import brotli
+except ImportError:  # optional; gzip only
+    brotli = None
+
+SCHEMA = [
+    'CREATE TABLE IF NOT EXISTS table_versions (name TEXT PRIMARY KEY, version INTEGER NOT NULL)',
+    # Random per-database epoch so ETags from a recreated database never match.
+    "INSERT OR IGNORE INTO table_versions (name, version) VALUES ('_epoch', abs(random()) % 1000000000)",
+]
+
+
+def bump_versions(conn, tables):
+    conn.executemany('''INSERT INTO table_versions (name, version) VALUES (?, 1)
+                        ON CONFLICT(name) DO UPDATE SET version = version + 1''', [(t,) for t in tables])
+    conn.commit()
+
+
+def read_versions(conn):
+    return {row[0]: row[1] for row in conn.execute('SELECT name, version FROM table_versions')}
+
+
+def table_etag(versions, tables):
+    return 'W/"%s"' % '.'.join(str(versions.get(t, 0)) for t in ('_epoch',) + tuple(tables))
+
+
+def etag_matches(if_none_match, etag):
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == '*':
+        return True
+    # Weak comparison: W/"x" and "x" name the same version.
+    opaque = etag[2:] if etag.startswith('W/') else etag
+    for candidate in if_none_match.split(','):
+        candidate = candidate.strip()
+        if candidate.startswith('W/'):
+            candidate = candidate[2:]
+        if candidate == opaque:
+            return True
+    return False
+
+
+def negotiate(accept_encoding):
+    """Preferred supported content coding for an Accept-Encoding header, or None."""
+    if not accept_encoding:
+        return None
+    accepted = set()
+    for item in accept_encoding.lower().split(','):
+        coding, _, params = item.strip().partition(';')
+        params = params.replace(' ', '')
+        if params.startswith('q='):
+            try:
+                if float(params[2:]) <= 0:
+                    continue
+            except ValueError:
+                continue
+        accepted.add(coding.strip())
+    if brotli is not None and 'br' in accepted:
+        return 'br'
+    if 'gzip' in accepted or '*' in accepted:
+        return 'gzip'
+    return None
+
+
+def encode(body, encoding, min_size, level):
+    """``(body, content_encoding)``; small bodies are sent as they are."""
+    if encoding is None or len(body) < min_size:
+        return body, None
+    if encoding == 'br':
+        return brotli.compress(body, quality=min(level, 11)), 'br'
+    return gzip.compress(body, compresslevel=level, mtime=0), 'gzip'
@@ -7,6 +7,50 @@ class Config:
     SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL') or 'sqlite:///agriculture.db'
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     
+    # Multi-farm sharding (sharding.py): each farm has its own SQLite file.
+    # 'default' is SQLALCHEMY_DATABASE_URI; FARM_SHARDS ("north=/data/north.db,...")
+    # and every <farm>.db in FARM_SHARD_DIR add more. Requests pick one with
+    # the X-Farm header or ?farm= (farm=* for cross-farm analytics).
+    FARM_SHARDS = dict(item.split('=', 1) for item in os.environ.get('FARM_SHARDS', '').split(',') if '=' in item)
+    FARM_SHARD_DIR = os.environ.get('FARM_SHARD_DIR')
+    FARM_FANOUT_WORKERS = 8
+    
+    DB_POOL_ENABLED = os.environ.get('DB_POOL_ENABLED', '1') != '0'
+    DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 8))
+    DB_POOL_TIMEOUT = 5.0
+    SQLITE_JOURNAL_MODE = 'WAL'
+    SQLITE_SYNCHRONOUS = 'NORMAL'
+    SQLITE_CACHE_SIZE = -20000
+    SQLITE_MMAP_SIZE = 256 * 1024 * 1024
+    SQLITE_BUSY_TIMEOUT = 5000
+    
+    RESPONSE_CACHE_TTL = 30
+    # JSON bodies at least this large are gzip/brotli-encoded when accepted.
+    COMPRESS_MIN_SIZE = 1024
+    COMPRESS_LEVEL = 6
+    # Full reload of the in-memory field state; only needed when several
+    # processes write (serve.py workers), a single process keeps it exact.
+    FIELD_STATE_RESYNC_SECONDS = 0
+    
+    # 'full' also counts and times every SQL statement; 'basic' records only
+    # per-route latency and response size; 'off' disables instrumentation.
+    METRICS_MODE = os.environ.get('METRICS_MODE', 'full')
+    SLOW_QUERY_THRESHOLD_MS = 100
+    
+    SSE_CLIENT_QUEUE_SIZE = 100
+    SSE_MAX_CLIENTS = int(os.environ.get('SSE_MAX_CLIENTS', 1000))
+    SSE_HEARTBEAT_SECONDS = 15
+    
+    # asgi.py: threads running SQLite work for async handlers, and how many
+    # queries may wait for one before new requests get 503.
+    ASYNC_DB_WORKERS = int(os.environ.get('ASYNC_DB_WORKERS', 8))
+    ASYNC_DB_MAX_PENDING = 1000
+    ASYNC_WSGI_WORKERS = 16
+    
+    # Keyset pages of /api/fields and /api/alerts (?limit= is capped at the max).
+    PAGE_SIZE_DEFAULT = 100
+    PAGE_SIZE_MAX = 1000
+    
     JSON_SORT_KEYS = False
     
     CORS_ORIGINS = os.environ.get('CORS_ORIGINS', '*').split(',')
@@ -16,10 +60,58 @@ class Config:
     SESSION_COOKIE_SAMESITE = 'Lax'
     PERMANENT_SESSION_LIFETIME = timedelta(days=7)
     
+    # serve.py: pre-forked worker processes and how long each may drain
+    # in-flight requests on reload/shutdown before it is killed.
+    WORKERS = int(os.environ.get('WORKERS', 1))
+    WORKER_GRACEFUL_TIMEOUT = 30
+    
     MAX_CONTENT_LENGTH = 16 * 1024 * 1024
+    INGEST_MAX_BATCH = 50000
+    EXPORT_FETCH_SIZE = 1000
+    # Write-behind for POST /api/field-update (write_behind.py): updates are
+    # coalesced per field in memory and flushed in one transaction every
+    # FIELD_UPDATE_FLUSH_INTERVAL ms or FIELD_UPDATE_FLUSH_BATCH fields. With
+    # FIELD_UPDATE_MAX_PENDING fields waiting, requests block up to
+    # FIELD_UPDATE_BLOCK_TIMEOUT ms and then get 503.
+    FIELD_UPDATE_WRITE_BEHIND = os.environ.get('FIELD_UPDATE_WRITE_BEHIND', '0') == '1'
+    FIELD_UPDATE_FLUSH_INTERVAL = 200
+    FIELD_UPDATE_FLUSH_BATCH = 5000
+    FIELD_UPDATE_MAX_PENDING = 100000
+    FIELD_UPDATE_BLOCK_TIMEOUT = 1000
+    
+    # Streaming anomaly detection on incoming readings (anomaly.py): EWMA
+    # statistics per field and metric with weight ANOMALY_ALPHA. After
+    # ANOMALY_WARMUP readings, a robust |z| above ANOMALY_Z_THRESHOLD is
+    # flagged; ANOMALY_SUSTAIN flags in a row raise a 'Sensor Anomaly' alert.
+    # The state is checkpointed every ANOMALY_CHECKPOINT_INTERVAL ms.
+    ANOMALY_DETECTION_ENABLED = True
+    ANOMALY_ALPHA = 0.05
+    ANOMALY_WARMUP = 20
+    ANOMALY_Z_THRESHOLD = 4.0
+    ANOMALY_Z_CLIP = 3.0
+    ANOMALY_SUSTAIN = 3
+    ANOMALY_CHECKPOINT_INTERVAL = 60000
     
     IRRIGATION_UPDATE_INTERVAL = 30000
+    IRRIGATION_SCHEDULER_ENABLED = True
+    IRRIGATION_DISPATCH_BATCH = 1000
+    IRRIGATION_FLOW_RATE_LPM = 20
     ALERT_CHECK_INTERVAL = 30000
+    ALERT_ENGINE_ENABLED = True
+    ALERT_BATCH_SIZE = 10000
+    
+    # Sensor history (history.py). Months older than HISTORY_HOT_MONTHS (not
+    # counting the current one) leave npk_levels / irrigation_records for
+    # monthly partitions; raw NPK becomes hourly sums after
+    # NPK_RAW_RETENTION_MONTHS and is dropped after NPK_HOURLY_RETENTION_MONTHS.
+    # Daily rollups are kept forever. None keeps a stage forever.
+    HISTORY_COMPACT_ENABLED = True
+    HISTORY_COMPACT_INTERVAL = 3600000
+    HISTORY_COMPACT_BATCH = 20000
+    HISTORY_HOT_MONTHS = 1
+    NPK_RAW_RETENTION_MONTHS = 6
+    NPK_HOURLY_RETENTION_MONTHS = 24
+    IRRIGATION_RETENTION_MONTHS = 36
     
     SOIL_MOISTURE_THRESHOLD_LOW = 40
     SOIL_MOISTURE_THRESHOLD_HIGH = 85
@@ -34,7 +126,34 @@ class Config:
     NPK_POTASSIUM_MIN = 50
     
     CROP_YIELD_FORECAST_DAYS = 7
+    # Stored forecasts are recomputed in the background when fields, NPK or
+    # weather changed since the last run, or the date rolled over.
+    FORECAST_REFRESH_ENABLED = True
+    FORECAST_REFRESH_INTERVAL = 60000
+    # Days from today served by GET /api/weather; POST /api/weather/import
+    # accepts at most WEATHER_IMPORT_MAX_ROWS station-days per request.
     WEATHER_FORECAST_DAYS = 5
+    WEATHER_IMPORT_MAX_ROWS = 100000
+    
+    # What-if yield bands (scenarios.py): weather trajectories sampled around
+    # the stored forecast. Temperature random-walk step (degrees C per day),
+    # log-normal sigma on forecast rain, daily chance of a shower on dry days.
+    SCENARIO_DEFAULT_COUNT = 1000
+    SCENARIO_MAX_COUNT = 20000
+    SCENARIO_MAX_DAYS = 30
+    SCENARIO_SEED = 42
+    SCENARIO_TEMP_SIGMA = 1.0
+    SCENARIO_RAIN_SIGMA = 0.6
+    SCENARIO_RAIN_CHANCE = 0.1
+    # Runs of at least SCENARIO_PARALLEL_MIN_CELLS (scenario x field x day)
+    # are split over SCENARIO_WORKERS processes; each evaluates at most
+    # SCENARIO_BATCH_CELLS cells at a time. Results are cached per input
+    # digest and scenario count.
+    SCENARIO_WORKERS = int(os.environ.get('SCENARIO_WORKERS', os.cpu_count() or 1))
+    SCENARIO_PARALLEL_MIN_CELLS = 2000000
+    SCENARIO_BATCH_CELLS = 1000000
+    SCENARIO_CACHE_TTL = 3600
+    SCENARIO_CACHE_SIZE = 32
     
     DEBUG = os.environ.get('DEBUG', False)
     TESTING = False
@@ -50,12 +169,20 @@ class TestingConfig(Config):
     TESTING = True
     SQLALCHEMY_DATABASE_URI = 'sqlite:///:memory:'
     WTF_CSRF_ENABLED = False
+    ALERT_ENGINE_ENABLED = False
+    IRRIGATION_SCHEDULER_ENABLED = False
+    HISTORY_COMPACT_ENABLED = False
+    FORECAST_REFRESH_ENABLED = False
 
 
 class ProductionConfig(Config):
     DEBUG = False
     TESTING = False
     SESSION_COOKIE_SECURE = True
+    DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 16))
+    WORKERS = int(os.environ.get('WORKERS', os.cpu_count() or 2))
+    FIELD_STATE_RESYNC_SECONDS = 30
+    METRICS_MODE = os.environ.get('METRICS_MODE', 'basic')
 
 
 config = {
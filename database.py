@@ -0,0 +1,214 @@
+import os
+import queue
+import sqlite3
+import threading
+
+import anomaly
+import conditional
+import history
+import rollups
+import weather
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+class PooledConnection:
+    """Thin proxy around a pooled sqlite3 connection.
+
+    Routes keep calling ``conn.close()`` as they always have; for a pooled
+    connection that hands it back to the pool instead of closing the file.
+    """
+
+    def __init__(self, pool, conn):
+        self._pool = pool
+        self._conn = conn
+
+    @property
+    def closed(self):
+        return self._conn is None
+
+    def close(self):
+        if self._conn is not None:
+            conn, self._conn = self._conn, None
+            self._pool.release(conn)
+
+    def __getattr__(self, name):
+        if self._conn is None:
+            raise sqlite3.ProgrammingError('Cannot operate on a released connection.')
+        return getattr(self._conn, name)
+
+    def __enter__(self):
+        return self._conn.__enter__()
+
+    def __exit__(self, *exc):
+        return self._conn.__exit__(*exc)
+
+
+class ConnectionPool:
+    """Bounded pool of long-lived SQLite connections.
+
+    Connections are opened lazily up to ``size`` and configured once with
+    the pragmas from ``Config`` (WAL journal, synchronous, cache/mmap size,
+    busy timeout), so requests no longer pay connect + schema parse on
+    every hit and readers do not block behind writers.
+    """
+
+    def __init__(self, path, size=8, timeout=5.0, pragmas=None):
+        self.path = path
+        # Every connection to ':memory:' is a separate database, so an
+        # in-memory store can only ever be served by a single connection.
+        self.size = 1 if path == ':memory:' else max(1, int(size))
+        self.timeout = timeout
+        self.pragmas = dict(pragmas or {})
+        self._idle = queue.LifoQueue()
+        self._opened = 0
+        self._lock = threading.Lock()
+        # SQLite handles must never cross a fork; a forked worker starts empty.
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self._reset)
+
+    def _reset(self):
+        self._idle = queue.LifoQueue()
+        self._opened = 0
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, check_same_thread=False,
+                               timeout=(self.pragmas.get('busy_timeout') or 5000) / 1000)
+        conn.row_factory = sqlite3.Row
+        for name, value in self.pragmas.items():
+            if value is not None:
+                conn.execute(f'PRAGMA {name} = {value}')
+        return conn
+
+    def acquire(self):
+        try:
+            return PooledConnection(self, self._idle.get_nowait())
+        except queue.Empty:
+            pass
+
+        with self._lock:
+            if self._opened < self.size:
+                self._opened += 1
+                try:
+                    return PooledConnection(self, self._connect())
+                except Exception:
+                    self._opened -= 1
+                    raise
+
+        try:
+            return PooledConnection(self, self._idle.get(timeout=self.timeout))
+        except queue.Empty:
+            raise PoolTimeout(f'No database connection available after {self.timeout}s')
+
+    def release(self, conn):
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            conn.close()
+            with self._lock:
+                self._opened -= 1
+            return
+        self._idle.put(conn)
+
+    def close_all(self):
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            conn.close()
+            with self._lock:
+                self._opened -= 1
+
+
+def pool_from_config(path, cfg):
+    pragmas = {
+        'journal_mode': cfg.get('SQLITE_JOURNAL_MODE'),
+        'synchronous': cfg.get('SQLITE_SYNCHRONOUS'),
+        'cache_size': cfg.get('SQLITE_CACHE_SIZE'),
+        'mmap_size': cfg.get('SQLITE_MMAP_SIZE'),
+        'busy_timeout': cfg.get('SQLITE_BUSY_TIMEOUT', 5000),
+    }
+    return ConnectionPool(path,
+                          size=cfg.get('DB_POOL_SIZE', 8),
+                          timeout=cfg.get('DB_POOL_TIMEOUT', 5.0),
+                          pragmas=pragmas)
+
+
+# Sort order of alerts.priority (case-insensitive); see migration 4.
+PRIORITY_RANKS = {'critical': 4, 'high': 3, 'medium': 2, 'low': 1}
+
+
+# Ordered schema migrations applied on top of the tables created by
+# init_db(). Each entry runs once, inside its own transaction, and is
+# recorded in schema_migrations; append new versions, never edit old ones.
+MIGRATIONS = [
+    (1, 'Indexes for time-series lookups and alert listing', [
+        'CREATE INDEX IF NOT EXISTS idx_npk_levels_field_recorded ON npk_levels (field_id, recorded_at DESC)',
+        'CREATE INDEX IF NOT EXISTS idx_npk_levels_recorded ON npk_levels (recorded_at DESC)',
+        'CREATE INDEX IF NOT EXISTS idx_irrigation_field_created ON irrigation_records (field_id, created_at DESC)',
+        'CREATE INDEX IF NOT EXISTS idx_irrigation_status ON irrigation_records (status, scheduled_time)',
+        'CREATE INDEX IF NOT EXISTS idx_forecast_date_field ON crop_yield_forecast (forecast_date DESC, field_id)',
+        'CREATE INDEX IF NOT EXISTS idx_forecast_field_date ON crop_yield_forecast (field_id, forecast_date)',
+        'CREATE INDEX IF NOT EXISTS idx_alerts_open ON alerts (resolved, priority, created_at)',
+        'CREATE INDEX IF NOT EXISTS idx_alerts_field_created ON alerts (field_id, created_at DESC)',
+        'CREATE INDEX IF NOT EXISTS idx_weather_forecast_date ON weather (forecast_date)',
+    ]),
+    (2, 'Trigger-maintained analytics and per-field daily rollups',
+     rollups.SCHEMA + [rollups.rebuild_rollups]),
+    (3, 'Per-table change counters for ETags', conditional.SCHEMA),
+    (4, 'Ordinal alert priority and keyset indexes for open alerts', [
+        # Virtual generated column: every writer gets it for free, and the
+        # partial indexes below store it. Unknown priorities rank 0.
+        '''ALTER TABLE alerts ADD COLUMN priority_rank INTEGER GENERATED ALWAYS AS
+           (CASE lower(priority) WHEN 'critical' THEN 4 WHEN 'high' THEN 3 WHEN 'medium' THEN 2
+                                 WHEN 'low' THEN 1 ELSE 0 END) VIRTUAL''',
+        'DROP INDEX IF EXISTS idx_alerts_open',
+        'CREATE INDEX IF NOT EXISTS idx_alerts_open_rank ON alerts (priority_rank, created_at) WHERE resolved = 0',
+        'CREATE INDEX IF NOT EXISTS idx_alerts_open_field_rank ON alerts (field_id, priority_rank, created_at) WHERE resolved = 0',
+    ]),
+    (5, 'Monthly sensor history partitions and latest NPK per field', history.SCHEMA),
+    (6, 'Farm key on fields for multi-farm sharding', [
+        'ALTER TABLE fields ADD COLUMN farm TEXT',
+    ]),
+    (7, 'Checkpointed state of the streaming anomaly detector', anomaly.SCHEMA),
+    (8, 'Weather stations and one forecast row per station and day', weather.SCHEMA),
+]
+
+
+def schema_version(conn):
+    conn.execute('''CREATE TABLE IF NOT EXISTS schema_migrations
+                    (version INTEGER PRIMARY KEY, description TEXT, applied_at TIMESTAMP)''')
+    return conn.execute('SELECT COALESCE(MAX(version), 0) FROM schema_migrations').fetchone()[0]
+
+
+def migrate(conn, migrations=MIGRATIONS):
+    """Apply any migrations newer than the recorded schema version."""
+    current = schema_version(conn)
+    conn.commit()
+    for version, description, statements in migrations:
+        if version <= current:
+            continue
+        # BEGIN IMMEDIATE takes the write lock up front so two processes
+        # starting at once cannot both apply the same version.
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            if conn.execute('SELECT 1 FROM schema_migrations WHERE version = ?', (version,)).fetchone():
+                conn.rollback()
+                continue
+            for statement in statements:
+                if callable(statement):
+                    statement(conn)
+                else:
+                    conn.execute(statement)
+            conn.execute("INSERT INTO schema_migrations (version, description, applied_at) VALUES (?, ?, datetime('now'))",
+                         (version, description))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+    return schema_version(conn)
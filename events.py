@@ -0,0 +1,167 @@
+"""In-process fan-out of change events to Server-Sent Events clients.
+
+Write routes publish an event once; the broker serialises it once and
+pushes the ready-to-send frame onto every subscriber's bounded queue. A
+client whose queue is full is too slow to keep up, so it is dropped and
+its stream ends; the browser's EventSource reconnects and receives a fresh
+snapshot instead of an ever-growing backlog.
+
+Subscribers are either thread-backed (the WSGI generator blocks on a
+``queue.Queue``) or loop-backed (the ASGI server awaits an
+``asyncio.Queue`` fed through ``call_soon_threadsafe``), so one publish from
+any thread reaches both kinds.
+"""
+import asyncio
+import json
+import queue
+import threading
+
+CLOSED = object()
+
+
+def format_event(event, data):
+    return f'event: {event}\ndata: {json.dumps(data, default=str)}\n\n'
+
+
+class Subscription:
+    def __init__(self, maxsize):
+        self.queue = queue.Queue(maxsize)
+        self.dropped = False
+
+    def offer(self, frame):
+        try:
+            self.queue.put_nowait(frame)
+            return True
+        except queue.Full:
+            return False
+
+    def close(self):
+        # Make room for the sentinel so the stream generator exits promptly.
+        try:
+            self.queue.get_nowait()
+        except queue.Empty:
+            pass
+        try:
+            self.queue.put_nowait(CLOSED)
+        except queue.Full:
+            pass
+
+    def get(self, timeout):
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+
+class AsyncSubscription:
+    def __init__(self, maxsize, loop):
+        self.queue = asyncio.Queue()
+        self.maxsize = maxsize
+        self.loop = loop
+        self.dropped = False
+
+    def _put(self, item):
+        try:
+            self.loop.call_soon_threadsafe(self.queue.put_nowait, item)
+            return True
+        except RuntimeError:  # loop already closed
+            return False
+
+    def offer(self, frame):
+        # qsize() lags frames still in flight to the loop; close enough for a bound.
+        if self.queue.qsize() >= self.maxsize:
+            return False
+        return self._put(frame)
+
+    def close(self):
+        self._put(CLOSED)
+
+    async def get(self, timeout):
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+
+class EventBroker:
+    def __init__(self, client_queue_size=100, max_clients=1000):
+        self.client_queue_size = client_queue_size
+        self.max_clients = max_clients
+        self._subscribers = set()
+        self._lock = threading.Lock()
+        self.published = 0
+        self.dropped_clients = 0
+
+    @property
+    def client_count(self):
+        return len(self._subscribers)
+
+    def subscribe(self, loop=None):
+        with self._lock:
+            if len(self._subscribers) >= self.max_clients:
+                return None
+            if loop is not None:
+                sub = AsyncSubscription(self.client_queue_size, loop)
+            else:
+                sub = Subscription(self.client_queue_size)
+            self._subscribers.add(sub)
+            return sub
+
+    def unsubscribe(self, sub):
+        with self._lock:
+            self._subscribers.discard(sub)
+
+    def publish(self, event, data):
+        if not self._subscribers:
+            return
+        frame = format_event(event, data)
+        self.published += 1
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for sub in subscribers:
+            if not sub.offer(frame):
+                self._drop(sub)
+
+    def disconnect_all(self):
+        """End every open stream, e.g. before a worker shuts down."""
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for sub in subscribers:
+            self._drop(sub)
+
+    def _drop(self, sub):
+        with self._lock:
+            if sub not in self._subscribers:
+                return
+            self._subscribers.discard(sub)
+            self.dropped_clients += 1
+        sub.dropped = True
+        sub.close()
+
+    def stream(self, sub, initial=(), heartbeat=15):
+        """Generator of SSE frames for one subscriber."""
+        try:
+            yield 'retry: 3000\n\n'
+            for event, data in initial:
+                yield format_event(event, data)
+            while not sub.dropped:
+                frame = sub.get(heartbeat)
+                if frame is CLOSED:
+                    break
+                yield frame if frame is not None else ': keep-alive\n\n'
+        finally:
+            self.unsubscribe(sub)
+
+    async def stream_async(self, sub, initial=(), heartbeat=15):
+        """Async generator of SSE frames for a loop-backed subscriber."""
+        try:
+            yield 'retry: 3000\n\n'
+            for event, data in initial:
+                yield format_event(event, data)
+            while not sub.dropped:
+                frame = await sub.get(heartbeat)
+                if frame is CLOSED:
+                    break
+                yield frame if frame is not None else ': keep-alive\n\n'
+        finally:
+            self.unsubscribe(sub)
@@ -0,0 +1,144 @@
+import csv
+import heapq
+import io
+import itertools
+import json
+from datetime import datetime
+
+# dataset name -> (table, time column, exported columns)
+DATASETS = {
+    'npk-levels': ('npk_levels', 'recorded_at',
+                   ('id', 'field_id', 'nitrogen', 'phosphorus', 'potassium', 'recorded_at')),
+    'irrigation': ('irrigation_records', 'created_at',
+                   ('id', 'field_id', 'duration_minutes', 'water_volume_liters', 'scheduled_time', 'status', 'created_at')),
+}
+
+
+class ExportError(ValueError):
+    pass
+
+
+def parse_timestamp(value, name):
+    if value is None:
+        return None
+    try:
+        return datetime.fromisoformat(value.replace('Z', '+00:00')).replace(tzinfo=None)
+    except ValueError:
+        raise ExportError(f'{name} must be an ISO-8601 timestamp')
+
+
+def parse_field_ids(values):
+    try:
+        return [int(value) for value in values]
+    except ValueError:
+        raise ExportError('field_id must be an integer')
+
+
+def parse_limit(value):
+    if value is None:
+        return None
+    try:
+        limit = int(value)
+    except ValueError:
+        raise ExportError('limit must be an integer')
+    if limit < 0:
+        raise ExportError('limit must not be negative')
+    return limit
+
+
+def parse_cursor(value):
+    """Keyset cursor ``<time>,<id>`` taken from the last exported row."""
+    if not value:
+        return None
+    stamp, _, row_id = value.rpartition(',')
+    if not stamp or not row_id.isdigit():
+        raise ExportError('after must look like "<timestamp>,<id>"')
+    return stamp, int(row_id)
+
+
+def build_query(dataset, field_ids=(), start=None, end=None, after=None, limit=None, table=None):
+    """``table`` reads one history partition of the dataset instead of its hot table."""
+    if dataset not in DATASETS:
+        raise ExportError(f'Unknown dataset {dataset!r}')
+    hot_table, time_col, columns = DATASETS[dataset]
+    table = table or hot_table
+
+    where, params = [], []
+    if field_ids:
+        where.append(f'field_id IN ({",".join("?" * len(field_ids))})')
+        params.extend(field_ids)
+    if start is not None:
+        where.append(f'{time_col} >= ?')
+        params.append(start)
+    if end is not None:
+        where.append(f'{time_col} < ?')
+        params.append(end)
+    if after is not None:
+        where.append(f'({time_col}, id) > (?, ?)')
+        params.extend(after)
+
+    sql = f'SELECT {", ".join(columns)} FROM {table}'
+    if where:
+        sql += ' WHERE ' + ' AND '.join(where)
+    sql += f' ORDER BY {time_col}, id'
+    if limit is not None:
+        sql += ' LIMIT ?'
+        params.append(limit)
+    return sql, params, columns
+
+
+def iter_rows(conn, sql, params, fetch_size=1000):
+    """Yield rows from a server-side cursor, ``fetch_size`` at a time."""
+    cursor = conn.execute(sql, params)
+    try:
+        while True:
+            batch = cursor.fetchmany(fetch_size)
+            if not batch:
+                break
+            yield batch
+    finally:
+        cursor.close()
+
+
+def iter_merged(conn, queries, time_col, fetch_size=1000, limit=None):
+    """Batches of several ``build_query`` results merged on (time, id).
+
+    Each query is already ordered, so a heap merge keeps the export
+    streaming across partitions.
+    """
+    if len(queries) == 1:
+        yield from iter_rows(conn, *queries[0], fetch_size)
+        return
+    streams = [itertools.chain.from_iterable(iter_rows(conn, sql, params, fetch_size)) for sql, params in queries]
+    # Same order as SQLite's ORDER BY time, id: NULL times sort first.
+    merged = heapq.merge(*streams, key=lambda row: (row[time_col] is not None, str(row[time_col] or ''), row['id']))
+    if limit is not None:
+        merged = itertools.islice(merged, limit)
+    while True:
+        batch = list(itertools.islice(merged, fetch_size))
+        if not batch:
+            break
+        yield batch
+
+
+def to_ndjson(batches, columns):
+    for batch in batches:
+        yield ''.join(json.dumps(dict(zip(columns, row))) + '\n' for row in batch)
+
+
+def to_csv(batches, columns):
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    writer.writerow(columns)
+    yield buf.getvalue()
+    for batch in batches:
+        buf.seek(0)
+        buf.truncate()
+        writer.writerows(tuple(row) for row in batch)
+        yield buf.getvalue()
+
+
+FORMATS = {
+    'ndjson': (to_ndjson, 'application/x-ndjson'),
+    'csv': (to_csv, 'text/csv'),
+}
@@ -0,0 +1,342 @@
+"""Columnar in-memory copy of every field's current state.
+
+One NumPy column per attribute, aligned with a sorted ``ids`` array, so a
+field is found with a binary search and aggregations are vector operations.
+Names live in a single UTF-8 blob with an offsets array and health status /
+crop are one-byte category codes, which keeps a million fields under
+~90 MB instead of a million ``sqlite3.Row``/dict objects. Running sums for
+the dashboard are maintained on every write, so the dashboard aggregate is
+O(1).
+
+The store is loaded at startup and kept current by the write routes: small
+writes are applied directly, bulk or SQL-computed writes re-read just the
+touched rows. ``resync_seconds`` (pre-fork workers only) bounds how stale a
+worker can be about writes handled by its siblings.
+"""
+import os
+import threading
+import time
+
+import numpy as np
+
+from forecast import latest_npk
+
+HEALTHY_STATUSES = ('Healthy', 'Excellent', 'Optimal')
+NUMERIC = ('area', 'moisture', 'temperature', 'nitrogen', 'phosphorus', 'potassium')
+NPK = ('nitrogen', 'phosphorus', 'potassium')
+
+
+class Categories:
+    """Small string vocabulary stored as uint8 codes; code 0 is NULL."""
+
+    def __init__(self):
+        self.values = [None]
+        self.codes = {None: 0}
+
+    def code(self, value):
+        code = self.codes.get(value)
+        if code is None:
+            if len(self.values) >= 256:
+                raise ValueError(f'Too many distinct categories (adding {value!r})')
+            code = self.codes[value] = len(self.values)
+            self.values.append(value)
+        return code
+
+    def encode(self, values):
+        for value in set(values):
+            self.code(value)
+        codes = self.codes
+        return np.array([codes[v] for v in values], dtype=np.uint8)
+
+
+def _floats(values):
+    return np.array([np.nan if v is None else v for v in values], dtype=np.float64)
+
+
+def _value(x):
+    return None if x != x else float(x)
+
+
+class _Columns:
+    def __init__(self, ids, names, crop, health, numeric):
+        self.ids = ids
+        encoded = [(n or '').encode() for n in names]
+        self.name_offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(n) for n in encoded], out=self.name_offsets[1:])
+        self.names = b''.join(encoded)
+        self.crop = crop
+        self.health = health
+        self.numeric = numeric
+
+    def name(self, i):
+        return self.names[self.name_offsets[i]:self.name_offsets[i + 1]].decode() or None
+
+
+class NameView:
+    """``names[i]`` over a window of the columns without decoding them all."""
+
+    def __init__(self, cols, offset=0):
+        self.cols = cols
+        self.offset = offset
+
+    def __getitem__(self, i):
+        return self.cols.name(self.offset + i)
+
+
+class FieldState:
+    def __init__(self, resync_seconds=0):
+        self.resync_seconds = resync_seconds
+        self.crops = Categories()
+        self.statuses = Categories()
+        self._healthy_codes = np.array([self.statuses.code(s) for s in HEALTHY_STATUSES], dtype=np.uint8)
+        self._cols = _Columns(np.empty(0, np.int64), [], np.empty(0, np.uint8), np.empty(0, np.uint8),
+                              {name: np.empty(0) for name in NUMERIC})
+        self._latest_npk = None
+        self._lock = threading.Lock()
+        self._resync_lock = threading.Lock()
+        self.loaded_at = None
+        self._new_lineage()
+        os.register_at_fork(after_in_child=self._new_lineage)
+        self._recount()
+
+    def _new_lineage(self):
+        # Versions are only comparable within one lineage of this process's
+        # columns; forked workers and full reloads start a new one.
+        self._lineage = os.urandom(4).hex()
+        self.version = 0
+
+    # -- loading -----------------------------------------------------------
+
+    def _read(self, conn, where='', params=()):
+        rows = conn.execute(f'''SELECT id, name, crop, area_hectares, soil_moisture, temperature, health_status
+                                FROM fields {where} ORDER BY id''', params).fetchall()
+        ids = np.array([r[0] for r in rows], dtype=np.int64)
+        if where:
+            npk = latest_npk(conn, ids, 'WHERE field_id IN (%s)' % ','.join('?' * len(ids)), tuple(ids.tolist()))
+        else:
+            npk = latest_npk(conn, ids)
+        numeric = {
+            'area': _floats([r[3] for r in rows]),
+            'moisture': _floats([r[4] for r in rows]),
+            'temperature': _floats([r[5] for r in rows]),
+        }
+        for j, name in enumerate(NPK):
+            numeric[name] = np.ascontiguousarray(npk[:, j]) if len(ids) else np.empty(0)
+        return ids, [r[1] for r in rows], [r[2] for r in rows], [r[6] for r in rows], numeric
+
+    def load(self, conn):
+        ids, names, crops, statuses, numeric = self._read(conn)
+        cols = _Columns(ids, names, self.crops.encode(crops), self.statuses.encode(statuses), numeric)
+        latest = conn.execute('''SELECT nitrogen, phosphorus, potassium, recorded_at FROM npk_latest
+                                 ORDER BY recorded_at DESC LIMIT 1''').fetchone()
+        with self._lock:
+            self._cols = cols
+            self._latest_npk = tuple(latest) if latest else None
+            self._recount()
+            self._new_lineage()
+            self.loaded_at = time.monotonic()
+        return len(ids)
+
+    def maybe_resync(self, connect):
+        if not self.resync_seconds or time.monotonic() - (self.loaded_at or 0) < self.resync_seconds:
+            return
+        # One thread reloads; the rest keep serving the current columns.
+        if not self._resync_lock.acquire(blocking=False):
+            return
+        try:
+            conn = connect()
+            try:
+                self.load(conn)
+            finally:
+                conn.close()
+        finally:
+            self._resync_lock.release()
+
+    def reload_rows(self, conn, field_ids):
+        """Re-read the given fields (and the global latest NPK) after a bulk write."""
+        field_ids = sorted(set(int(f) for f in field_ids if f is not None))
+        for start in range(0, len(field_ids), 500):
+            chunk = field_ids[start:start + 500]
+            ids, names, crops, statuses, numeric = self._read(
+                conn, 'WHERE id IN (%s)' % ','.join('?' * len(chunk)), tuple(chunk))
+            with self._lock:
+                for k, field_id in enumerate(ids.tolist()):
+                    i = self._index(field_id)
+                    if i is None:
+                        self._insert(field_id, names[k], crops[k], statuses[k], {n: numeric[n][k] for n in NUMERIC})
+                    else:
+                        self._set(i, {n: numeric[n][k] for n in NUMERIC}, statuses[k])
+        latest = conn.execute('''SELECT nitrogen, phosphorus, potassium, recorded_at FROM npk_latest
+                                 ORDER BY recorded_at DESC LIMIT 1''').fetchone()
+        with self._lock:
+            self._latest_npk = tuple(latest) if latest else None
+
+    # -- writes --------------------------------------------------------------
+
+    def _index(self, field_id):
+        try:
+            field_id = int(field_id)
+        except (TypeError, ValueError):
+            return None
+        ids = self._cols.ids
+        i = int(np.searchsorted(ids, field_id))
+        return i if i < len(ids) and ids[i] == field_id else None
+
+    def _insert(self, field_id, name, crop, status, values):
+        cols = self._cols
+        i = int(np.searchsorted(cols.ids, field_id))
+        names = [cols.name(k) for k in range(len(cols.ids))]
+        names.insert(i, name)
+        self._cols = _Columns(np.insert(cols.ids, i, field_id), names,
+                              np.insert(cols.crop, i, self.crops.code(crop)),
+                              np.insert(cols.health, i, self.statuses.code(status)),
+                              {n: np.insert(cols.numeric[n], i, values.get(n, np.nan)) for n in NUMERIC})
+        self._recount()
+        self.version += 1
+
+    def _set(self, i, values, status=None):
+        cols, sums = self._cols, self._sums
+        self.version += 1
+        for name, new in values.items():
+            new = np.nan if new is None else float(new)
+            if name in ('moisture', 'temperature'):
+                old = cols.numeric[name][i]
+                if old == old:
+                    sums[name] -= old
+                    sums[name + '_count'] -= 1
+                if new == new:
+                    sums[name] += new
+                    sums[name + '_count'] += 1
+            cols.numeric[name][i] = new
+        if status is not None:
+            code = self.statuses.code(status)
+            sums['healthy'] += int(code in self._healthy_codes) - int(cols.health[i] in self._healthy_codes)
+            cols.health[i] = code
+
+    def _recount(self):
+        cols = self._cols
+        sums = {'total': len(cols.ids), 'healthy': int(np.isin(cols.health, self._healthy_codes).sum())}
+        for name in ('moisture', 'temperature'):
+            values = cols.numeric[name]
+            present = ~np.isnan(values)
+            sums[name] = float(values[present].sum())
+            sums[name + '_count'] = int(present.sum())
+        self._sums = sums
+
+    def update(self, field_id, soil_moisture=None, temperature=None, health_status=None):
+        """Apply a committed /api/field-update (None leaves a value unchanged)."""
+        values = {}
+        if soil_moisture is not None:
+            values['moisture'] = soil_moisture
+        if temperature is not None:
+            values['temperature'] = temperature
+        with self._lock:
+            i = self._index(field_id)
+            if i is not None:
+                self._set(i, values, health_status)
+
+    def record_npk(self, field_id, nitrogen, phosphorus, potassium, recorded_at):
+        with self._lock:
+            i = self._index(field_id)
+            if i is not None:
+                self._set(i, {'nitrogen': nitrogen, 'phosphorus': phosphorus, 'potassium': potassium})
+            self.version += 1
+            if self._latest_npk is None or str(recorded_at) >= str(self._latest_npk[3]):
+                self._latest_npk = tuple(None if v is None else float(v) for v in (nitrogen, phosphorus, potassium)) + (recorded_at,)
+
+    # -- reads ---------------------------------------------------------------
+
+    def __len__(self):
+        return len(self._cols.ids)
+
+    @property
+    def etag(self):
+        return f'W/"{self._lineage}.{self.version}"'
+
+    @property
+    def nbytes(self):
+        cols = self._cols
+        return (cols.ids.nbytes + cols.name_offsets.nbytes + len(cols.names) + cols.crop.nbytes
+                + cols.health.nbytes + sum(a.nbytes for a in cols.numeric.values()))
+
+    def summary(self):
+        """Dashboard aggregates: averages, health counts and the newest NPK reading."""
+        sums = self._sums
+        return {
+            'avg_moisture': sums['moisture'] / sums['moisture_count'] if sums['moisture_count'] else None,
+            'avg_temperature': sums['temperature'] / sums['temperature_count'] if sums['temperature_count'] else None,
+            'healthy': sums['healthy'],
+            'total': sums['total'],
+            'latest_npk': self._latest_npk,
+        }
+
+    def has(self, field_id):
+        return self._index(field_id) is not None
+
+    def get(self, field_id):
+        cols = self._cols
+        i = self._index(field_id)
+        if i is None:
+            return None
+        npk = [_value(cols.numeric[n][i]) for n in NPK]
+        return {
+            'id': int(cols.ids[i]),
+            'name': cols.name(i),
+            'crop': self.crops.values[cols.crop[i]],
+            'area': _value(cols.numeric['area'][i]),
+            'moisture': _value(cols.numeric['moisture'][i]),
+            'temperature': _value(cols.numeric['temperature'][i]),
+            'status': self.statuses.values[cols.health[i]],
+            'npk': dict(zip(NPK, npk)) if npk[0] is not None else None,
+        }
+
+    def _row(self, cols, i):
+        return {
+            'id': int(cols.ids[i]),
+            'name': cols.name(i),
+            'area': _value(cols.numeric['area'][i]),
+            'moisture': _value(cols.numeric['moisture'][i]),
+            'temperature': _value(cols.numeric['temperature'][i]),
+            'status': self.statuses.values[cols.health[i]],
+        }
+
+    def page(self, after=None, limit=100, crop=None, status=None, chunk=65536):
+        """Up to ``limit`` /api/fields rows with id > ``after`` matching the filters.
+
+        Returns ``(rows, more)``. The start is a binary search and filters are
+        evaluated a chunk of the columns at a time, so cost depends on the
+        page size and filter selectivity, not on where the page starts.
+        """
+        cols = self._cols
+        masks = []
+        for column, categories, value in ((cols.crop, self.crops, crop), (cols.health, self.statuses, status)):
+            if value is not None:
+                code = categories.codes.get(value)
+                if code is None:
+                    return [], False
+                masks.append((column, code))
+        n = len(cols.ids)
+        i = int(np.searchsorted(cols.ids, after, 'right')) if after is not None else 0
+        picked = []
+        while i < n and len(picked) <= limit:
+            stop = min(i + chunk, n)
+            if masks:
+                match = np.ones(stop - i, dtype=bool)
+                for column, code in masks:
+                    match &= column[i:stop] == code
+                found = i + np.flatnonzero(match)
+            else:
+                found = np.arange(i, stop)
+            picked.extend(found[:limit + 1 - len(picked)].tolist())
+            i = stop
+        return [self._row(cols, k) for k in picked[:limit]], len(picked) > limit
+
+    def scan(self, metric, op, threshold):
+        """Ids of fields whose ``metric`` is below ('<') or above ('>') threshold; NaN never matches."""
+        cols = self._cols
+        values = cols.numeric[metric]
+        return cols.ids[values < threshold if op == '<' else values > threshold]
+
+    def snapshot(self):
+        """The current columns, for batch consumers such as the alert engine."""
+        return self._cols
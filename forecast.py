@@ -0,0 +1,234 @@
+"""Vectorised crop-yield forecasting.
+
+Features for every field are loaded into NumPy arrays once (fields, latest
+NPK reading per field, upcoming weather) and the whole farm is forecast in
+one batched computation of shape (fields, days). The model is a simple
+agronomic heuristic: a per-crop base yield scaled by Liebig-style nutrient
+sufficiency, a soil-moisture response around the optimal band and a daily
+temperature response from the weather forecast.
+
+``ForecastRefresher`` keeps the stored forecast current: writes to fields,
+NPK or weather mark it dirty, and a background thread recomputes at most
+once per ``FORECAST_REFRESH_INTERVAL`` ms, or when the date rolls over.
+"""
+import logging
+import threading
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+BASE_YIELD = {'Wheat': 600.0, 'Corn': 700.0, 'Soybeans': 550.0, 'Rice': 650.0}
+DEFAULT_BASE_YIELD = 600.0
+
+# Moisture gained per mm of rain and lost per day to evapotranspiration (%).
+RAIN_MOISTURE_GAIN = 0.5
+DAILY_MOISTURE_LOSS = 1.5
+DAILY_GROWTH = 0.01
+
+
+class FieldFeatures:
+    def __init__(self, field_ids, crops, moisture, temperature, npk, weather):
+        self.field_ids = field_ids
+        self.crops = crops
+        self.moisture = moisture
+        self.temperature = temperature
+        self.npk = npk
+        # (days, 2): precipitation mm, mean air temperature
+        self.weather = weather
+
+    def __len__(self):
+        return len(self.field_ids)
+
+    def subset(self, index):
+        """The fields selected by ``index`` (a slice), with the same weather."""
+        return FieldFeatures(self.field_ids[index], self.crops[index], self.moisture[index],
+                             self.temperature[index], self.npk[index], self.weather)
+
+
+def latest_npk(conn, field_ids, where='', params=()):
+    """(len(field_ids), 3) array of each field's latest N/P/K, NaN where none.
+
+    ``field_ids`` must be sorted; ``where`` narrows the npk_latest scan.
+    """
+    npk = np.full((len(field_ids), 3), np.nan)
+    if not len(field_ids):
+        return npk
+    # One trigger-maintained row per field (history.SCHEMA): no scan of the
+    # telemetry, and readings already moved to monthly partitions still count.
+    latest = conn.execute(f'SELECT field_id, nitrogen, phosphorus, potassium FROM npk_latest {where}',
+                          params).fetchall()
+    if latest:
+        ids = np.array([r[0] for r in latest], dtype=np.int64)
+        values = np.array([r[1:4] for r in latest], dtype=np.float64)
+        pos = np.clip(np.searchsorted(field_ids, ids), 0, len(field_ids) - 1)
+        hit = field_ids[pos] == ids
+        npk[pos[hit]] = values[hit]
+    return npk
+
+
+def load_features(conn, days, npk_defaults):
+    rows = conn.execute('SELECT id, crop, soil_moisture, temperature FROM fields ORDER BY id').fetchall()
+    field_ids = np.fromiter((r[0] for r in rows), dtype=np.int64, count=len(rows))
+    crops = [r[1] for r in rows]
+    moisture = np.array([r[2] if r[2] is not None else np.nan for r in rows], dtype=np.float64)
+    temperature = np.array([r[3] if r[3] is not None else np.nan for r in rows], dtype=np.float64)
+
+    npk = latest_npk(conn, field_ids)
+    npk = np.where(np.isnan(npk), np.asarray(npk_defaults, dtype=np.float64), npk)
+
+    today = datetime.now().date()
+    # Farm-wide weather: the mean over every station reporting that day.
+    weather_rows = conn.execute('''SELECT forecast_date, AVG(COALESCE(precipitation, 0)),
+                                          AVG((COALESCE(min_temp, 0) + COALESCE(max_temp, 0)) / 2.0)
+                                   FROM weather WHERE forecast_date >= ? AND forecast_date < ?
+                                   GROUP BY forecast_date''', (today, today + timedelta(days=days))).fetchall()
+    by_date = {str(r[0]): (r[1], r[2]) for r in weather_rows}
+    weather = np.full((days, 2), np.nan)
+    for i in range(days):
+        day = by_date.get(str(today + timedelta(days=i)))
+        if day is not None:
+            weather[i] = day
+    # Days beyond the weather horizon assume no rain and the last known temperature.
+    weather[:, 0] = np.nan_to_num(weather[:, 0], nan=0.0)
+    known = ~np.isnan(weather[:, 1])
+    if known.any():
+        last = np.maximum.accumulate(np.where(known, np.arange(days), 0))
+        weather[:, 1] = np.where(known, weather[:, 1], weather[last, 1])
+        weather[:, 1] = np.where(np.isnan(weather[:, 1]), weather[known, 1][0], weather[:, 1])
+
+    return FieldFeatures(field_ids, crops, moisture, temperature, npk, weather)
+
+
+def yield_model(features, weather, cfg):
+    """Unrounded yields for ``weather`` of shape (..., days, 2).
+
+    Leading weather axes broadcast: the stored (days, 2) forecast gives
+    (fields, days), a (scenarios, days, 2) batch gives (scenarios, fields, days).
+    """
+    days = weather.shape[-2]
+    base = np.array([BASE_YIELD.get(c, DEFAULT_BASE_YIELD) for c in features.crops], dtype=np.float64)
+
+    npk_min = np.array([cfg['NPK_NITROGEN_MIN'], cfg['NPK_PHOSPHORUS_MIN'], cfg['NPK_POTASSIUM_MIN']], dtype=np.float64)
+    nutrient = np.clip(features.npk / npk_min, 0.0, 1.2).min(axis=1)
+
+    opt_min = cfg['SOIL_MOISTURE_THRESHOLD_OPTIMAL_MIN']
+    opt_max = cfg['SOIL_MOISTURE_THRESHOLD_OPTIMAL_MAX']
+    moisture0 = np.nan_to_num(features.moisture, nan=(opt_min + opt_max) / 2)
+    rain = np.cumsum(weather[..., 0], axis=-1) * RAIN_MOISTURE_GAIN
+    dry = np.arange(days) * DAILY_MOISTURE_LOSS
+    moisture = np.clip(moisture0[:, None] + (rain - dry)[..., None, :], 0, 100)
+    deficit = np.maximum(opt_min - moisture, 0) + np.maximum(moisture - opt_max, 0)
+    moisture_factor = np.clip(1.0 - deficit / 50.0, 0.2, 1.0)
+
+    t_min, t_max = cfg['TEMPERATURE_MIN'], cfg['TEMPERATURE_MAX']
+    t_opt = (t_min + t_max) / 2
+    air = weather[..., 1]
+    soil = np.nan_to_num(features.temperature, nan=t_opt)
+    temp = np.where(np.isnan(air)[..., None, :], soil[:, None], (soil[:, None] + air[..., None, :]) / 2)
+    temp_factor = np.clip(1.0 - (np.abs(temp - t_opt) / (t_max - t_min)) ** 2, 0.2, 1.0)
+
+    growth = 1.0 + DAILY_GROWTH * np.arange(days)
+    return (base * nutrient)[:, None] * moisture_factor * temp_factor * growth
+
+
+def predict(features, cfg):
+    """Return a (fields, days) array of predicted yields."""
+    return np.round(yield_model(features, features.weather, cfg), 1)
+
+
+def precompute_forecasts(conn, cfg):
+    """Recompute the forecast window for every field and store it in one bulk write."""
+    days = cfg['CROP_YIELD_FORECAST_DAYS']
+    features = load_features(conn, days, (68, 45, 72))
+    yields = predict(features, cfg)
+
+    today = datetime.now().date()
+    dates = [today + timedelta(days=i) for i in range(days)]
+    now = datetime.now()
+    rows = [(int(field_id), dates[d], float(y), now)
+            for field_id, field_yields in zip(features.field_ids.tolist(), yields.tolist())
+            for d, y in enumerate(field_yields)]
+
+    with conn:
+        conn.execute('DELETE FROM crop_yield_forecast WHERE forecast_date >= ?', (today,))
+        conn.executemany('INSERT INTO crop_yield_forecast (field_id, forecast_date, predicted_yield, created_at) VALUES (?, ?, ?, ?)',
+                         rows)
+    return len(rows)
+
+
+class ForecastRefresher:
+    # Tables load_features reads.
+    INPUTS = frozenset({'fields', 'npk_levels', 'weather'})
+
+    def __init__(self, refresh, cfg):
+        self.refresh = refresh
+        self.interval = cfg['FORECAST_REFRESH_INTERVAL'] / 1000
+        self._dirty = False
+        # The forecast is computed at startup, so the first cycle has
+        # nothing to do until an input changes or the day turns.
+        self._day = datetime.now().date()
+        self._stop = threading.Event()
+        self._thread = None
+        self._cycle_lock = threading.Lock()
+        self.stats = {
+            'running': False,
+            'refreshes': 0,
+            'dirty': False,
+            'last_run_at': None,
+            'last_rows': 0,
+            'last_refresh_seconds': None,
+            'last_error': None,
+        }
+
+    def tables_changed(self, tables):
+        if self.INPUTS.intersection(tables):
+            self._dirty = self.stats['dirty'] = True
+
+    def run_cycle(self, force=False):
+        """Recompute if an input changed or the date rolled over (always with ``force``); returns rows written."""
+        with self._cycle_lock:
+            today = datetime.now().date()
+            if not (force or self._dirty or today != self._day):
+                return 0
+            # Cleared first: a write during the recompute marks it dirty again.
+            self._dirty = self.stats['dirty'] = False
+            start = time.perf_counter()
+            try:
+                rows = self.refresh()
+            except Exception:
+                self._dirty = self.stats['dirty'] = True
+                raise
+            self._day = today
+            self.stats.update({
+                'refreshes': self.stats['refreshes'] + 1,
+                'last_run_at': datetime.now().isoformat(),
+                'last_rows': rows,
+                'last_refresh_seconds': round(time.perf_counter() - start, 4),
+            })
+            return rows
+
+    def _loop(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.run_cycle()
+                self.stats['last_error'] = None
+            except Exception as e:
+                logger.exception('Forecast refresh failed')
+                self.stats['last_error'] = str(e)
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name='forecast-refresher', daemon=True)
+        self._thread.start()
+        self.stats['running'] = True
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        self.stats['running'] = False
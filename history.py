@@ -0,0 +1,345 @@
+"""Time-partitioned sensor history with downsampling and retention.
+
+Writers keep inserting into ``npk_levels`` and ``irrigation_records``, the
+hot tables. ``HistoryCompactor`` runs in the background and:
+
+* moves rows from months older than ``HISTORY_HOT_MONTHS`` into one
+  partition table per month (``npk_levels_2025_01``), in short batches;
+* downsamples NPK months older than ``NPK_RAW_RETENTION_MONTHS`` into
+  hourly sums (``npk_levels_hourly_2025_01``) and drops the raw month;
+* drops hourly NPK months after ``NPK_HOURLY_RETENTION_MONTHS`` and
+  irrigation months after ``IRRIGATION_RETENTION_MONTHS``. The daily
+  rollups in ``field_daily_rollups`` keep the long-term trend.
+
+Dropped tables free their pages for reuse, so once retention is reached the
+database file stops growing. The hot tables and their indexes stay about
+one month deep, however long the farm has been reporting.
+``history_partitions`` records every month's state, and readers go through
+``partitions()`` / ``latest_rows()`` to reach the right tables.
+
+Partitions live in the main database file rather than in ATTACHed files:
+a WAL commit is only atomic within one file (a moved batch must vanish from
+the hot table in the same commit), and every pooled connection would have
+to attach them.
+"""
+import logging
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+
+class Series:
+    def __init__(self, table, time_col, archivable='1', hourly_select=None):
+        self.table = table
+        self.time_col = time_col
+        # Rows still in flight (e.g. scheduled irrigations) stay hot.
+        self.archivable = archivable
+        # Raw-shaped view of an hourly partition, or None if never downsampled.
+        self.hourly_select = hourly_select
+        self.indexes = (('field_id', time_col), (time_col,))
+
+    def source(self, table, kind):
+        if kind == 'hourly':
+            return f'({self.hourly_select.format(table=table)})'
+        return table
+
+
+SERIES = {
+    'npk_levels': Series('npk_levels', 'recorded_at', hourly_select=(
+        'SELECT NULL AS id, field_id, nitrogen_sum / samples AS nitrogen, phosphorus_sum / samples AS phosphorus, '
+        'potassium_sum / samples AS potassium, hour AS recorded_at FROM {table}')),
+    'irrigation_records': Series('irrigation_records', 'created_at',
+                                 archivable="COALESCE(status, '') NOT IN ('Scheduled', 'Running')"),
+}
+
+SCHEMA = [
+    '''CREATE TABLE IF NOT EXISTS history_partitions
+       (series TEXT NOT NULL, month TEXT NOT NULL, kind TEXT NOT NULL,
+        row_count INTEGER NOT NULL DEFAULT 0, PRIMARY KEY (series, month))''',
+    # Latest reading per field, so "latest NPK" is O(fields) rather than a
+    # GROUP BY over all telemetry, and survives its rows being archived.
+    '''CREATE TABLE IF NOT EXISTS npk_latest
+       (field_id INTEGER PRIMARY KEY, nitrogen REAL, phosphorus REAL, potassium REAL, recorded_at TIMESTAMP)''',
+    'CREATE INDEX IF NOT EXISTS idx_npk_latest_recorded ON npk_latest (recorded_at)',
+    '''CREATE TRIGGER IF NOT EXISTS trg_npk_insert_latest AFTER INSERT ON npk_levels
+       WHEN NEW.field_id IS NOT NULL BEGIN
+         INSERT INTO npk_latest (field_id, nitrogen, phosphorus, potassium, recorded_at)
+         VALUES (NEW.field_id, NEW.nitrogen, NEW.phosphorus, NEW.potassium, NEW.recorded_at)
+         ON CONFLICT (field_id) DO UPDATE SET
+           nitrogen = excluded.nitrogen, phosphorus = excluded.phosphorus,
+           potassium = excluded.potassium, recorded_at = excluded.recorded_at
+         WHERE npk_latest.recorded_at IS NULL OR excluded.recorded_at >= npk_latest.recorded_at;
+       END''',
+    '''INSERT OR REPLACE INTO npk_latest (field_id, nitrogen, phosphorus, potassium, recorded_at)
+       SELECT field_id, nitrogen, phosphorus, potassium, MAX(recorded_at)
+       FROM npk_levels WHERE field_id IS NOT NULL GROUP BY field_id''',
+]
+
+HOURLY_TABLE = '''CREATE TABLE IF NOT EXISTS {table}
+    (field_id INTEGER NOT NULL, hour TEXT NOT NULL, nitrogen_sum REAL NOT NULL, phosphorus_sum REAL NOT NULL,
+     potassium_sum REAL NOT NULL, samples INTEGER NOT NULL, PRIMARY KEY (field_id, hour)) WITHOUT ROWID'''
+
+
+def month_key(value):
+    return str(value)[:7]
+
+
+def shift_month(month, months):
+    index = int(month[:4]) * 12 + int(month[5:7]) - 1 + months
+    return f'{index // 12:04d}-{index % 12 + 1:02d}'
+
+
+def month_start(month):
+    return month + '-01'
+
+
+def partition_table(series, month, kind):
+    return f"{series}_{'hourly_' if kind == 'hourly' else ''}{month.replace('-', '_')}"
+
+
+def partitions(conn, series, start=None, end=None, kinds=('raw', 'hourly')):
+    """``(month, kind, table)`` of partitions overlapping [start, end), oldest first."""
+    try:
+        rows = conn.execute(f'''SELECT month, kind FROM history_partitions
+                                WHERE series = ? AND kind IN ({",".join("?" * len(kinds))}) ORDER BY month''',
+                            (series,) + tuple(kinds)).fetchall()
+    except sqlite3.OperationalError:  # before the migration that adds the registry
+        return []
+    result = []
+    for month, kind in rows:
+        if start is not None and month_start(shift_month(month, 1)) <= str(start):
+            continue
+        if end is not None and month_start(month) >= str(end):
+            continue
+        result.append((month, kind, partition_table(series, month, kind)))
+    return result
+
+
+def retained_since(conn, series):
+    """First day whose history still exists (raw or hourly), or None if nothing was dropped."""
+    try:
+        row = conn.execute("SELECT MAX(month) FROM history_partitions WHERE series = ? AND kind = 'dropped'",
+                           (series,)).fetchone()
+    except sqlite3.OperationalError:
+        return None
+    return month_start(shift_month(row[0], 1)) if row and row[0] else None
+
+
+def union_sources(conn, series, columns, hourly_columns=None):
+    """SQL of every retained row of ``series`` (hot, raw and hourly) as one UNION ALL.
+
+    Hourly partitions are read through their raw-shaped view unless
+    ``hourly_columns`` selects from the sums table directly.
+    """
+    spec = SERIES[series]
+    selects = [f'SELECT {columns} FROM {spec.table}']
+    for _, kind, table in partitions(conn, series):
+        if kind == 'hourly' and hourly_columns:
+            selects.append(f'SELECT {hourly_columns} FROM {table}')
+        else:
+            selects.append(f'SELECT {columns} FROM {spec.source(table, kind)}')
+    return ' UNION ALL '.join(selects)
+
+
+def latest_rows(conn, series, columns, field_id, limit):
+    """A field's newest ``limit`` rows across the hot table and its partitions.
+
+    Partitions are visited newest first and only until the rows found so far
+    are all newer than the next partition's month.
+    """
+    spec = SERIES[series]
+    sql = f'SELECT {columns} FROM {{source}} WHERE field_id = ? ORDER BY {spec.time_col} DESC LIMIT ?'
+    rows = conn.execute(sql.format(source=spec.table), (field_id, limit)).fetchall()
+    for month, kind, table in reversed(partitions(conn, series)):
+        if len(rows) >= limit and str(rows[limit - 1][spec.time_col]) >= month_start(shift_month(month, 1)):
+            break
+        rows += conn.execute(sql.format(source=spec.source(table, kind)), (field_id, limit)).fetchall()
+        rows.sort(key=lambda r: str(r[spec.time_col] or ''), reverse=True)
+    return rows[:limit]
+
+
+class HistoryCompactor:
+    """Background job that archives, downsamples and expires sensor history."""
+
+    def __init__(self, connect, cfg):
+        self.connect = connect
+        self.interval = cfg['HISTORY_COMPACT_INTERVAL'] / 1000
+        self.batch_size = cfg['HISTORY_COMPACT_BATCH']
+        self.hot_months = cfg['HISTORY_HOT_MONTHS']
+        self.npk_raw_months = cfg['NPK_RAW_RETENTION_MONTHS']
+        self.npk_hourly_months = cfg['NPK_HOURLY_RETENTION_MONTHS']
+        self.irrigation_months = cfg['IRRIGATION_RETENTION_MONTHS']
+        self._stop = threading.Event()
+        self._thread = None
+        self._cycle_lock = threading.Lock()
+        self.stats = {
+            'running': False,
+            'cycles': 0,
+            'last_run_at': None,
+            'last_cycle_seconds': None,
+            'rows_archived': 0,
+            'months_downsampled': 0,
+            'months_dropped': 0,
+            'last_error': None,
+        }
+
+    def run_cycle(self, now=None):
+        with self._cycle_lock:
+            start = time.perf_counter()
+            current = month_key(now or datetime.now())
+            archived = downsampled = dropped = 0
+            conn = self.connect()
+            try:
+                for spec in SERIES.values():
+                    archived += self._archive(conn, spec, month_start(shift_month(current, -self.hot_months)))
+                if self.npk_raw_months is not None:
+                    downsampled = self._downsample(conn, SERIES['npk_levels'], shift_month(current, -self.npk_raw_months))
+                if self.npk_hourly_months is not None:
+                    dropped += self._expire(conn, 'npk_levels', shift_month(current, -self.npk_hourly_months))
+                if self.irrigation_months is not None:
+                    dropped += self._expire(conn, 'irrigation_records', shift_month(current, -self.irrigation_months))
+            finally:
+                conn.close()
+
+            self.stats.update({
+                'cycles': self.stats['cycles'] + 1,
+                'last_run_at': datetime.now().isoformat(),
+                'last_cycle_seconds': round(time.perf_counter() - start, 4),
+                'rows_archived': self.stats['rows_archived'] + archived,
+                'months_downsampled': self.stats['months_downsampled'] + downsampled,
+                'months_dropped': self.stats['months_dropped'] + dropped,
+            })
+            return {'archived': archived, 'downsampled': downsampled, 'dropped': dropped}
+
+    def _partition_kind(self, conn, spec, month):
+        row = conn.execute('SELECT kind FROM history_partitions WHERE series = ? AND month = ?',
+                           (spec.table, month)).fetchone()
+        if row:
+            return row[0]
+        table = partition_table(spec.table, month, 'raw')
+        ddl = conn.execute("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = ?", (spec.table,)).fetchone()[0]
+        conn.execute(ddl.replace(spec.table, table, 1))
+        for columns in spec.indexes:
+            conn.execute(f'CREATE INDEX idx_{table}_{"_".join(columns)} ON {table} ({", ".join(columns)})')
+        conn.execute("INSERT INTO history_partitions (series, month, kind) VALUES (?, ?, 'raw')", (spec.table, month))
+        return 'raw'
+
+    def _archive(self, conn, spec, cutoff):
+        """Move rows older than ``cutoff`` into their month's partition, one short transaction per batch."""
+        moved = 0
+        while True:
+            # The highest id always stays hot so rowids are never reused.
+            rows = conn.execute(f'''SELECT * FROM {spec.table} WHERE {spec.time_col} < ? AND {spec.archivable}
+                                      AND id < (SELECT MAX(id) FROM {spec.table})
+                                    ORDER BY {spec.time_col} LIMIT ?''', (cutoff, self.batch_size)).fetchall()
+            if not rows:
+                break
+            columns = rows[0].keys()
+            by_month = {}
+            for row in rows:
+                by_month.setdefault(month_key(row[spec.time_col]), []).append(tuple(row))
+            with conn:
+                for month, batch in by_month.items():
+                    kind = self._partition_kind(conn, spec, month)
+                    if kind == 'raw':
+                        conn.executemany(f'''INSERT INTO {partition_table(spec.table, month, kind)} ({", ".join(columns)})
+                                             VALUES ({", ".join("?" * len(columns))})''', batch)
+                    elif kind == 'hourly':
+                        # Late readings for an already downsampled month.
+                        self._add_hourly(conn, partition_table(spec.table, month, kind),
+                                         [dict(zip(columns, row)) for row in batch])
+                    # kind == 'dropped': past retention, just delete.
+                    conn.execute('UPDATE history_partitions SET row_count = row_count + ? WHERE series = ? AND month = ?',
+                                 (len(batch) if kind == 'raw' else 0, spec.table, month))
+                conn.executemany(f'DELETE FROM {spec.table} WHERE id = ?', [(row['id'],) for row in rows])
+            moved += len(rows)
+        return moved
+
+    def _add_hourly(self, conn, table, rows):
+        sums = {}
+        for row in rows:
+            if row['field_id'] is None:
+                continue
+            key = (row['field_id'], datetime.fromisoformat(str(row['recorded_at'])).strftime('%Y-%m-%d %H:00:00'))
+            n, p, k, samples = sums.get(key, (0.0, 0.0, 0.0, 0))
+            sums[key] = (n + (row['nitrogen'] or 0), p + (row['phosphorus'] or 0), k + (row['potassium'] or 0), samples + 1)
+        conn.executemany(f'''INSERT INTO {table} (field_id, hour, nitrogen_sum, phosphorus_sum, potassium_sum, samples)
+                             VALUES (?, ?, ?, ?, ?, ?)
+                             ON CONFLICT (field_id, hour) DO UPDATE SET
+                               nitrogen_sum = nitrogen_sum + excluded.nitrogen_sum,
+                               phosphorus_sum = phosphorus_sum + excluded.phosphorus_sum,
+                               potassium_sum = potassium_sum + excluded.potassium_sum,
+                               samples = samples + excluded.samples''',
+                         [key + values for key, values in sums.items()])
+
+    def _downsample(self, conn, spec, before_month):
+        """Replace raw months older than ``before_month`` with hourly sums."""
+        done = 0
+        for month, _, raw in partitions(conn, spec.table, kinds=('raw',)):
+            if month >= before_month:
+                break
+            hourly = partition_table(spec.table, month, 'hourly')
+            with conn:
+                conn.execute(f'DROP TABLE IF EXISTS {hourly}')  # leftover of an interrupted run
+                conn.execute(HOURLY_TABLE.format(table=hourly))
+            # Aggregate a slice of fields per transaction so writers are never
+            # locked out for the whole month; readers keep using the raw table.
+            last_id = -1
+            while True:
+                bounds = conn.execute(f'''SELECT MIN(field_id), MAX(field_id) FROM
+                                          (SELECT DISTINCT field_id FROM {raw} WHERE field_id > ? ORDER BY field_id LIMIT 1000)''',
+                                      (last_id,)).fetchone()
+                if bounds[0] is None:
+                    break
+                with conn:
+                    conn.execute(f'''INSERT INTO {hourly} (field_id, hour, nitrogen_sum, phosphorus_sum, potassium_sum, samples)
+                                     SELECT field_id, strftime('%Y-%m-%d %H:00:00', {spec.time_col}), SUM(COALESCE(nitrogen, 0)),
+                                            SUM(COALESCE(phosphorus, 0)), SUM(COALESCE(potassium, 0)), COUNT(*)
+                                     FROM {raw} WHERE field_id BETWEEN ? AND ? AND {spec.time_col} IS NOT NULL
+                                     GROUP BY 1, 2''', bounds)
+                last_id = bounds[1]
+            with conn:
+                conn.execute(f'DROP TABLE {raw}')
+                conn.execute(f'''UPDATE history_partitions SET kind = 'hourly', row_count = (SELECT COUNT(*) FROM {hourly})
+                                 WHERE series = ? AND month = ?''', (spec.table, month))
+            done += 1
+        return done
+
+    def _expire(self, conn, series, before_month):
+        dropped = 0
+        for month, kind, table in partitions(conn, series):
+            if month >= before_month:
+                break
+            with conn:
+                conn.execute(f'DROP TABLE IF EXISTS {table}')
+                conn.execute("UPDATE history_partitions SET kind = 'dropped', row_count = 0 WHERE series = ? AND month = ?",
+                             (series, month))
+            dropped += 1
+        return dropped
+
+    def _loop(self):
+        while not self._stop.is_set():
+            try:
+                self.run_cycle()
+                self.stats['last_error'] = None
+            except Exception as e:
+                logger.exception('History compaction cycle failed')
+                self.stats['last_error'] = str(e)
+            self._stop.wait(self.interval)
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name='history-compactor', daemon=True)
+        self._thread.start()
+        self.stats['running'] = True
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        self.stats['running'] = False
@@ -0,0 +1,221 @@
+import json
+from datetime import datetime
+
+NPK_KEYS = ('nitrogen', 'phosphorus', 'potassium')
+FIELD_KEYS = ('soil_moisture', 'temperature', 'health_status')
+
+# Plausible sensor ranges; anything outside is a bad probe, not a reading.
+RANGES = {
+    'nitrogen': (0, 1000),
+    'phosphorus': (0, 1000),
+    'potassium': (0, 1000),
+    'soil_moisture': (0, 100),
+    'temperature': (-50, 70),
+}
+
+# Manual irrigation: duration in minutes (a day at most), volume in litres.
+IRRIGATION_LIMITS = {
+    'duration': (0, 1440),
+    'water_volume': (0, 1000000),
+}
+
+
+class IngestError(ValueError):
+    pass
+
+
+def parse_readings(body, content_type):
+    """Decode a request body into a list of reading dicts.
+
+    Accepts a JSON array, a JSON object with a ``readings`` array, or
+    NDJSON (one object per line) when sent as application/x-ndjson.
+    """
+    try:
+        text = body.decode('utf-8') if isinstance(body, bytes) else body
+    except UnicodeDecodeError as e:
+        raise IngestError(f'Body is not valid UTF-8: {e}')
+    if 'ndjson' in (content_type or '') or 'jsonlines' in (content_type or ''):
+        readings = []
+        for lineno, line in enumerate(text.splitlines(), 1):
+            if not line.strip():
+                continue
+            try:
+                readings.append(json.loads(line))
+            except ValueError as e:
+                readings.append(IngestError(f'line {lineno}: {e}'))
+        return readings
+
+    try:
+        data = json.loads(text)
+    except ValueError as e:
+        raise IngestError(f'Invalid JSON: {e}')
+    if isinstance(data, dict):
+        data = data.get('readings')
+    if not isinstance(data, list):
+        raise IngestError('Expected a JSON array of readings')
+    return data
+
+
+def validate_reading(reading, known_fields):
+    if isinstance(reading, IngestError):
+        raise reading
+    if not isinstance(reading, dict):
+        raise IngestError('reading must be an object')
+
+    field_id = reading.get('field_id')
+    if not isinstance(field_id, int) or isinstance(field_id, bool):
+        raise IngestError('field_id must be an integer')
+    if field_id not in known_fields:
+        raise IngestError(f'unknown field_id {field_id}')
+
+    for key, (low, high) in RANGES.items():
+        value = reading.get(key)
+        if value is None:
+            continue
+        if not isinstance(value, (int, float)) or isinstance(value, bool):
+            raise IngestError(f'{key} must be a number')
+        if not low <= value <= high:
+            raise IngestError(f'{key} out of range [{low}, {high}]')
+
+    health_status = reading.get('health_status')
+    if health_status is not None and not isinstance(health_status, str):
+        raise IngestError('health_status must be a string')
+
+    has_npk = any(reading.get(k) is not None for k in NPK_KEYS)
+    if has_npk and not all(reading.get(k) is not None for k in NPK_KEYS):
+        raise IngestError('nitrogen, phosphorus and potassium must be sent together')
+    if not has_npk and all(reading.get(k) is None for k in FIELD_KEYS):
+        raise IngestError('reading has no values')
+
+    recorded_at = reading.get('recorded_at')
+    if recorded_at is None:
+        return None
+    try:
+        return datetime.fromisoformat(str(recorded_at).replace('Z', '+00:00')).replace(tzinfo=None)
+    except ValueError:
+        raise IngestError('recorded_at must be an ISO-8601 timestamp')
+
+
+def parse_field_update(data):
+    """Validate a POST /api/field-update body.
+
+    Numeric strings are coerced, as SQLite's column affinity would.
+    Returns (field_id, soil_moisture, temperature, health_status) with
+    field_id an int and unsent metrics None.
+    """
+    if not isinstance(data, dict):
+        raise IngestError('body must be a JSON object')
+
+    field_id = data.get('field_id')
+    if isinstance(field_id, str) and field_id.strip().isdigit():
+        field_id = int(field_id)
+    if not isinstance(field_id, int) or isinstance(field_id, bool):
+        raise IngestError('field_id must be an integer')
+
+    values = []
+    for key in ('soil_moisture', 'temperature'):
+        value = data.get(key)
+        if value is not None:
+            if isinstance(value, bool):
+                raise IngestError(f'{key} must be a number')
+            try:
+                value = float(value)
+            except (TypeError, ValueError):
+                raise IngestError(f'{key} must be a number')
+            low, high = RANGES[key]
+            if not low <= value <= high:
+                raise IngestError(f'{key} out of range [{low}, {high}]')
+        values.append(value)
+
+    health_status = data.get('health_status')
+    if health_status is not None and not isinstance(health_status, str):
+        raise IngestError('health_status must be a string')
+    return (field_id, *values, health_status)
+
+
+def parse_irrigation_start(data):
+    """Validate a POST /api/irrigation/start body.
+
+    Returns (field_id, duration, water_volume); numeric strings are coerced
+    and unsent or null values take the defaults.
+    """
+    if not isinstance(data, dict):
+        raise IngestError('body must be a JSON object')
+
+    values = []
+    for key, default in (('duration', 30), ('water_volume', 500)):
+        value = data.get(key)
+        if value is None:
+            value = default
+        elif isinstance(value, bool):
+            raise IngestError(f'{key} must be a number')
+        try:
+            value = float(value)
+        except (TypeError, ValueError):
+            raise IngestError(f'{key} must be a number')
+        low, high = IRRIGATION_LIMITS[key]
+        if not low <= value <= high:
+            raise IngestError(f'{key} out of range [{low}, {high}]')
+        values.append(int(value) if value.is_integer() else value)
+    return (data.get('field_id'), *values)
+
+
+def load_known_fields(conn, readings):
+    ids = {r.get('field_id') for r in readings
+           if isinstance(r, dict) and isinstance(r.get('field_id'), int)}
+    ids = list(ids)
+    known = set()
+    # Stay under SQLite's bound-parameter limit.
+    for i in range(0, len(ids), 500):
+        chunk = ids[i:i + 500]
+        rows = conn.execute(f'SELECT id FROM fields WHERE id IN ({",".join("?" * len(chunk))})', chunk)
+        known.update(row[0] for row in rows)
+    return known
+
+
+def ingest_readings(conn, readings):
+    """Validate readings and write the accepted ones in a single transaction.
+
+    NPK readings are appended to npk_levels with one executemany; field
+    telemetry is coalesced per field (last reading wins, like sequential
+    POST /api/field-update calls) and applied with one executemany.
+    Returns the per-row results and the set of tables written.
+    """
+    known_fields = load_known_fields(conn, readings)
+    now = datetime.now()
+    results = []
+    npk_rows = []
+    field_updates = {}
+
+    for index, reading in enumerate(readings):
+        try:
+            recorded_at = validate_reading(reading, known_fields)
+        except IngestError as e:
+            results.append({'index': index, 'status': 'rejected', 'error': str(e)})
+            continue
+
+        field_id = reading['field_id']
+        if reading.get('nitrogen') is not None:
+            npk_rows.append((field_id, reading['nitrogen'], reading['phosphorus'], reading['potassium'],
+                             recorded_at or now))
+        if any(reading.get(k) is not None for k in FIELD_KEYS):
+            update = field_updates.setdefault(field_id, {})
+            update.update({k: reading[k] for k in FIELD_KEYS if reading.get(k) is not None})
+        results.append({'index': index, 'status': 'accepted'})
+
+    tables = set()
+    with conn:
+        if npk_rows:
+            conn.executemany('INSERT INTO npk_levels (field_id, nitrogen, phosphorus, potassium, recorded_at) VALUES (?, ?, ?, ?, ?)',
+                             npk_rows)
+            tables.add('npk_levels')
+        if field_updates:
+            conn.executemany('''UPDATE fields SET soil_moisture = COALESCE(?, soil_moisture),
+                                                  temperature = COALESCE(?, temperature),
+                                                  health_status = COALESCE(?, health_status)
+                                WHERE id = ?''',
+                             [(u.get('soil_moisture'), u.get('temperature'), u.get('health_status'), field_id)
+                              for field_id, u in field_updates.items()])
+            tables.add('fields')
+
+    return results, tables
@@ -0,0 +1,200 @@
+"""Executes scheduled irrigations: Scheduled -> Running -> Completed.
+
+Pending transitions live in a single min-heap keyed by due time, served by
+one dispatcher thread that sleeps until the earliest job is due (or a new
+job is pushed), so tens of thousands of schedules cost O(log n) each and
+no per-job threads. The heap is rebuilt from irrigation_records at startup
+and re-synced every ``IRRIGATION_UPDATE_INTERVAL`` ms, so jobs survive
+restarts and jobs created by other processes are picked up.
+"""
+import heapq
+import itertools
+import logging
+import threading
+import time
+from datetime import datetime, timedelta
+
+logger = logging.getLogger(__name__)
+
+START, COMPLETE = 'start', 'complete'
+
+
+def moisture_gain(water_volume):
+    volume = float(water_volume or 0)
+    if not volume >= 0:
+        raise ValueError(f'water volume must be a non-negative number, not {water_volume!r}')
+    return min(volume / 100, 15)
+
+
+def parse_time(value):
+    if isinstance(value, datetime):
+        return value
+    return datetime.fromisoformat(str(value))
+
+
+class IrrigationScheduler:
+    def __init__(self, connect, cfg, on_change=None):
+        self.connect = connect
+        self.on_change = on_change
+        self.resync_interval = cfg['IRRIGATION_UPDATE_INTERVAL'] / 1000
+        self.batch_size = cfg['IRRIGATION_DISPATCH_BATCH']
+        self._heap = []
+        self._queued = set()
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._stop = False
+        self._thread = None
+        self._last_sync = 0.0
+        self.stats = {'pending': 0, 'started': 0, 'completed': 0, 'last_dispatch_at': None, 'last_error': None}
+
+    def schedule(self, record_id, scheduled_time, duration_minutes):
+        """Queue a freshly created Scheduled record."""
+        # Only the process running the dispatcher keeps a heap; others rely
+        # on its periodic resync from irrigation_records.
+        if self._thread is None:
+            return
+        start = parse_time(scheduled_time)
+        end = start + timedelta(minutes=float(duration_minutes or 0))
+        with self._cond:
+            self._push(start.timestamp(), record_id, START, end)
+            self._cond.notify()
+
+    def _push(self, due, record_id, kind, end=None):
+        if (record_id, kind) in self._queued:
+            return
+        self._queued.add((record_id, kind))
+        heapq.heappush(self._heap, (due, next(self._seq), record_id, kind, end))
+        self.stats['pending'] = len(self._heap)
+
+    def sync(self):
+        """Pick up records written elsewhere in this process, e.g. a bulk plan."""
+        # As in schedule(): without a dispatcher the heap is never drained.
+        if self._thread is None:
+            return 0
+        return self._sync()
+
+    def _sync(self):
+        """Load every unfinished record into the heap (recovery + cross-process pickup)."""
+        conn = self.connect()
+        try:
+            rows = conn.execute('''SELECT id, scheduled_time, duration_minutes, status FROM irrigation_records
+                                   WHERE status IN ('Scheduled', 'Running')''').fetchall()
+        finally:
+            conn.close()
+        with self._cond:
+            for record_id, scheduled_time, duration, status in rows:
+                try:
+                    start = parse_time(scheduled_time)
+                    end = start + timedelta(minutes=float(duration or 0))
+                except (TypeError, ValueError, OverflowError):
+                    logger.warning('irrigation record %s has an unreadable scheduled_time %r or duration %r',
+                                   record_id, scheduled_time, duration)
+                    continue
+                if status == 'Scheduled':
+                    self._push(start.timestamp(), record_id, START, end)
+                else:
+                    self._push(end.timestamp(), record_id, COMPLETE)
+            self._last_sync = time.monotonic()
+            self._cond.notify()
+        return len(rows)
+
+    def _pop_due(self, now):
+        due = []
+        while self._heap and self._heap[0][0] <= now and len(due) < self.batch_size:
+            job = heapq.heappop(self._heap)
+            self._queued.discard((job[2], job[3]))
+            due.append(job)
+        self.stats['pending'] = len(self._heap)
+        return due
+
+    def dispatch(self, jobs):
+        """Apply one batch of due transitions in a single transaction."""
+        started, completed = [], []
+        conn = self.connect()
+        try:
+            with conn:
+                for _, _, record_id, kind, end in jobs:
+                    if kind == START:
+                        cur = conn.execute("UPDATE irrigation_records SET status = 'Running' WHERE id = ? AND status = 'Scheduled'",
+                                           (record_id,))
+                        if cur.rowcount:
+                            started.append((record_id, end))
+                    else:
+                        cur = conn.execute("UPDATE irrigation_records SET status = 'Completed' WHERE id = ? AND status = 'Running'",
+                                           (record_id,))
+                        if cur.rowcount:
+                            completed.append(record_id)
+                if completed:
+                    rows = conn.execute(f'''SELECT field_id, water_volume_liters FROM irrigation_records
+                                            WHERE id IN ({",".join("?" * len(completed))})''', completed).fetchall()
+                    gains = []
+                    for field_id, volume in rows:
+                        # One bad stored volume only loses its own moisture
+                        # gain; the record still completes with the batch.
+                        try:
+                            gains.append((moisture_gain(volume), field_id))
+                        except (TypeError, ValueError):
+                            logger.warning('irrigation on field %s has an unreadable water volume %r', field_id, volume)
+                    conn.executemany('UPDATE fields SET soil_moisture = MIN(100, COALESCE(soil_moisture, 0) + ?) WHERE id = ?',
+                                     gains)
+        finally:
+            conn.close()
+
+        with self._cond:
+            for record_id, end in started:
+                self._push(end.timestamp(), record_id, COMPLETE)
+        self.stats['started'] += len(started)
+        self.stats['completed'] += len(completed)
+        self.stats['last_dispatch_at'] = datetime.now().isoformat()
+        if self.on_change and (started or completed):
+            self.on_change([r for r, _ in started], completed)
+        return started, completed
+
+    def _loop(self):
+        while True:
+            with self._cond:
+                if self._stop:
+                    return
+                now = time.time()
+                jobs = self._pop_due(now)
+                if not jobs:
+                    next_due = self._heap[0][0] - now if self._heap else self.resync_interval
+                    resync_in = self.resync_interval - (time.monotonic() - self._last_sync)
+                    if resync_in > 0:
+                        self._cond.wait(max(0.0, min(next_due, resync_in)))
+                        continue
+            try:
+                if jobs:
+                    self.dispatch(jobs)
+                else:
+                    self._sync()
+                self.stats['last_error'] = None
+            except Exception as e:
+                logger.exception('Irrigation dispatch failed')
+                self.stats['last_error'] = str(e)
+                # Put the jobs back so a transient lock error does not lose them.
+                with self._cond:
+                    for due, _, record_id, kind, end in jobs:
+                        self._push(due, record_id, kind, end)
+                    self._cond.wait(1.0)
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop = False
+        # A failed first load must not stop the app from starting; the
+        # dispatcher retries it on its next resync.
+        try:
+            self._sync()
+        except Exception as e:
+            logger.exception('Irrigation scheduler sync failed')
+            self.stats['last_error'] = str(e)
+        self._thread = threading.Thread(target=self._loop, name='irrigation-scheduler', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=None):
+        with self._cond:
+            self._stop = True
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join(timeout)
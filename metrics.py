@@ -0,0 +1,218 @@
+"""Request and SQL instrumentation exported in Prometheus text format.
+
+Two modes, selected by ``METRICS_MODE``:
+
+* ``basic``  - per-route latency histogram and response sizes only; cheap
+  enough to leave on in production.
+* ``full``   - additionally wraps the connection returned by ``get_db()`` to
+  count SQL statements, time them, count rows fetched and write a
+  slow-query log above ``SLOW_QUERY_THRESHOLD_MS``.
+"""
+import logging
+import threading
+import time
+from bisect import bisect_left
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+slow_query_log = logging.getLogger('agri.slow_query')
+
+_local = threading.local()
+
+
+class RequestStats:
+    __slots__ = ('sql_count', 'sql_seconds', 'rows')
+
+    def __init__(self):
+        self.sql_count = 0
+        self.sql_seconds = 0.0
+        self.rows = 0
+
+
+def begin_request():
+    _local.stats = RequestStats()
+
+
+def end_request():
+    stats = getattr(_local, 'stats', None)
+    _local.stats = None
+    return stats
+
+
+class RouteMetrics:
+    __slots__ = ('buckets', 'count', 'seconds', 'response_bytes', 'sql_count', 'sql_seconds', 'rows', 'errors')
+
+    def __init__(self):
+        self.buckets = [0] * len(LATENCY_BUCKETS)
+        self.count = 0
+        self.seconds = 0.0
+        self.response_bytes = 0
+        self.sql_count = 0
+        self.sql_seconds = 0.0
+        self.rows = 0
+        self.errors = 0
+
+
+class MetricsRegistry:
+    def __init__(self, mode='basic', slow_query_ms=None):
+        self.mode = mode
+        self.slow_query_seconds = slow_query_ms / 1000 if slow_query_ms else None
+        self.routes = {}
+        self.slow_queries = 0
+        self.background = RequestStats()
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self.mode in ('basic', 'full')
+
+    @property
+    def sql_enabled(self):
+        return self.mode == 'full'
+
+    def observe_request(self, route, method, status, seconds, response_bytes, stats):
+        with self._lock:
+            m = self.routes.get((route, method))
+            if m is None:
+                m = self.routes[(route, method)] = RouteMetrics()
+            i = bisect_left(LATENCY_BUCKETS, seconds)
+            if i < len(LATENCY_BUCKETS):
+                m.buckets[i] += 1
+            m.count += 1
+            m.seconds += seconds
+            m.response_bytes += response_bytes or 0
+            if status >= 500:
+                m.errors += 1
+            if stats is not None:
+                m.sql_count += stats.sql_count
+                m.sql_seconds += stats.sql_seconds
+                m.rows += stats.rows
+
+    def observe_sql(self, sql, seconds, rows=0):
+        stats = getattr(_local, 'stats', None) or self.background
+        stats.sql_count += 1
+        stats.sql_seconds += seconds
+        stats.rows += rows
+        if self.slow_query_seconds is not None and seconds >= self.slow_query_seconds:
+            self.slow_queries += 1
+            slow_query_log.warning('slow query (%.1f ms): %s', seconds * 1000, ' '.join(sql.split()))
+
+    def observe_rows(self, rows, seconds):
+        stats = getattr(_local, 'stats', None) or self.background
+        stats.rows += rows
+        stats.sql_seconds += seconds
+
+    def render(self):
+        """Prometheus text exposition (format 0.0.4)."""
+        lines = []
+
+        def family(name, kind, help_text):
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {kind}')
+
+        with self._lock:
+            routes = sorted(self.routes.items())
+            family('agri_http_request_duration_seconds', 'histogram', 'Request latency by route.')
+            for (route, method), m in routes:
+                labels = f'route="{route}",method="{method}"'
+                cumulative = 0
+                for bound, n in zip(LATENCY_BUCKETS, m.buckets):
+                    cumulative += n
+                    lines.append(f'agri_http_request_duration_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+                lines.append(f'agri_http_request_duration_seconds_bucket{{{labels},le="+Inf"}} {m.count}')
+                lines.append(f'agri_http_request_duration_seconds_sum{{{labels}}} {m.seconds:.6f}')
+                lines.append(f'agri_http_request_duration_seconds_count{{{labels}}} {m.count}')
+
+            simple = [
+                ('agri_http_response_size_bytes_total', 'Response body bytes by route.', 'response_bytes'),
+                ('agri_http_server_errors_total', 'Responses with status >= 500 by route.', 'errors'),
+            ]
+            if self.sql_enabled:
+                simple += [
+                    ('agri_sql_statements_total', 'SQL statements executed by route.', 'sql_count'),
+                    ('agri_sql_duration_seconds_total', 'Time spent in SQLite by route.', 'sql_seconds'),
+                    ('agri_sql_rows_total', 'Rows fetched from SQLite by route.', 'rows'),
+                ]
+            for name, help_text, attr in simple:
+                family(name, 'counter', help_text)
+                for (route, method), m in routes:
+                    lines.append(f'{name}{{route="{route}",method="{method}"}} {getattr(m, attr)}')
+
+            if self.sql_enabled:
+                family('agri_background_sql_statements_total', 'counter', 'SQL statements run outside requests.')
+                lines.append(f'agri_background_sql_statements_total {self.background.sql_count}')
+                family('agri_slow_queries_total', 'counter', 'Statements slower than SLOW_QUERY_THRESHOLD_MS.')
+                lines.append(f'agri_slow_queries_total {self.slow_queries}')
+
+        return '\n'.join(lines) + '\n'
+
+
+class InstrumentedCursor:
+    def __init__(self, cursor, registry):
+        self._cursor = cursor
+        self._registry = registry
+
+    def execute(self, sql, params=()):
+        start = time.perf_counter()
+        self._cursor.execute(sql, params)
+        self._registry.observe_sql(sql, time.perf_counter() - start)
+        return self
+
+    def executemany(self, sql, seq):
+        start = time.perf_counter()
+        self._cursor.executemany(sql, seq)
+        self._registry.observe_sql(sql, time.perf_counter() - start)
+        return self
+
+    def _fetch(self, method, *args):
+        start = time.perf_counter()
+        result = method(*args)
+        n = len(result) if isinstance(result, list) else int(result is not None)
+        self._registry.observe_rows(n, time.perf_counter() - start)
+        return result
+
+    def fetchone(self):
+        return self._fetch(self._cursor.fetchone)
+
+    def fetchall(self):
+        return self._fetch(self._cursor.fetchall)
+
+    def fetchmany(self, size=None):
+        return self._fetch(self._cursor.fetchmany, size if size is not None else self._cursor.arraysize)
+
+    def __iter__(self):
+        while True:
+            row = self.fetchone()
+            if row is None:
+                return
+            yield row
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+
+class InstrumentedConnection:
+    """Wraps a (pooled) connection so every statement is counted and timed."""
+
+    def __init__(self, conn, registry):
+        self._conn = conn
+        self._registry = registry
+
+    def cursor(self):
+        return InstrumentedCursor(self._conn.cursor(), self._registry)
+
+    def execute(self, sql, params=()):
+        return self.cursor().execute(sql, params)
+
+    def executemany(self, sql, seq):
+        return self.cursor().executemany(sql, seq)
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def __enter__(self):
+        self._conn.__enter__()
+        return self
+
+    def __exit__(self, *exc):
+        return self._conn.__exit__(*exc)
@@ -0,0 +1,62 @@
+"""Keyset (cursor) pagination helpers for the list routes.
+
+A cursor is the sort key of the last row on the previous page, encoded
+as opaque URL-safe base64 JSON. The next page is the rows strictly after
+that key in sort order, so every page is one index range seek, however
+deep the client pages. There is no OFFSET to scan past.
+"""
+import base64
+import json
+
+import export
+
+
+class PaginationError(ValueError):
+    pass
+
+
+def encode_cursor(key):
+    return base64.urlsafe_b64encode(json.dumps(key, separators=(',', ':')).encode()).decode().rstrip('=')
+
+
+def decode_cursor(token, size):
+    """The ``size``-item key list encoded in ``token``; PaginationError if malformed."""
+    try:
+        key = json.loads(base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)))
+    except (ValueError, TypeError):
+        raise PaginationError('Invalid cursor')
+    if not isinstance(key, list) or len(key) != size:
+        raise PaginationError('Invalid cursor')
+    return key
+
+
+def page_limit(args, default, maximum):
+    try:
+        limit = int(args.get('limit', default))
+    except (TypeError, ValueError):
+        raise PaginationError('limit must be an integer')
+    if limit < 1:
+        raise PaginationError('limit must be positive')
+    return min(limit, maximum)
+
+
+def int_arg(args, name):
+    value = args.get(name)
+    if value in (None, ''):
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        raise PaginationError(f'{name} must be an integer')
+
+
+def timestamp_arg(args, name):
+    """ISO timestamp argument, parsed like the export routes' start/end."""
+    try:
+        return export.parse_timestamp(args.get(name) or None, name)
+    except export.ExportError as e:
+        raise PaginationError(str(e))
+
+
+def page(items, next_key):
+    return {'items': items, 'next_cursor': encode_cursor(next_key) if next_key is not None else None}
@@ -0,0 +1,218 @@
+"""Incrementally maintained summary tables.
+
+``farm_summary`` (a single row) and ``alert_type_counts`` back
+/api/analytics, and ``field_daily_rollups`` keeps per-field, per-day
+moisture/temperature/NPK/water aggregates for trend charts. SQLite
+triggers keep them current on every write path (routes, bulk ingestion,
+the alert engine), so reads are O(1) instead of full-table aggregates.
+"""
+import history
+
+SCHEMA = [
+    '''CREATE TABLE IF NOT EXISTS farm_summary
+       (id INTEGER PRIMARY KEY CHECK (id = 1), total_fields INTEGER NOT NULL DEFAULT 0,
+        moisture_sum REAL NOT NULL DEFAULT 0, moisture_count INTEGER NOT NULL DEFAULT 0,
+        total_area REAL NOT NULL DEFAULT 0, scheduled_irrigations INTEGER NOT NULL DEFAULT 0,
+        active_alerts INTEGER NOT NULL DEFAULT 0)''',
+    'INSERT OR IGNORE INTO farm_summary (id) VALUES (1)',
+    '''CREATE TABLE IF NOT EXISTS alert_type_counts
+       (alert_type TEXT PRIMARY KEY, alerts INTEGER NOT NULL DEFAULT 0)''',
+    '''CREATE TABLE IF NOT EXISTS field_daily_rollups
+       (field_id INTEGER NOT NULL, day DATE NOT NULL,
+        moisture_sum REAL NOT NULL DEFAULT 0, moisture_count INTEGER NOT NULL DEFAULT 0,
+        moisture_min REAL, moisture_max REAL,
+        temperature_sum REAL NOT NULL DEFAULT 0, temperature_count INTEGER NOT NULL DEFAULT 0,
+        nitrogen_sum REAL NOT NULL DEFAULT 0, phosphorus_sum REAL NOT NULL DEFAULT 0,
+        potassium_sum REAL NOT NULL DEFAULT 0, npk_count INTEGER NOT NULL DEFAULT 0,
+        water_liters REAL NOT NULL DEFAULT 0, irrigations INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (field_id, day))''',
+
+    # farm_summary
+    '''CREATE TRIGGER IF NOT EXISTS trg_fields_insert_summary AFTER INSERT ON fields BEGIN
+         UPDATE farm_summary SET total_fields = total_fields + 1,
+           moisture_sum = moisture_sum + COALESCE(NEW.soil_moisture, 0),
+           moisture_count = moisture_count + (NEW.soil_moisture IS NOT NULL),
+           total_area = total_area + COALESCE(NEW.area_hectares, 0) WHERE id = 1;
+       END''',
+    '''CREATE TRIGGER IF NOT EXISTS trg_fields_delete_summary AFTER DELETE ON fields BEGIN
+         UPDATE farm_summary SET total_fields = total_fields - 1,
+           moisture_sum = moisture_sum - COALESCE(OLD.soil_moisture, 0),
+           moisture_count = moisture_count - (OLD.soil_moisture IS NOT NULL),
+           total_area = total_area - COALESCE(OLD.area_hectares, 0) WHERE id = 1;
+       END''',
+    '''CREATE TRIGGER IF NOT EXISTS trg_fields_update_summary AFTER UPDATE OF soil_moisture, area_hectares ON fields BEGIN
+         UPDATE farm_summary SET
+           moisture_sum = moisture_sum + COALESCE(NEW.soil_moisture, 0) - COALESCE(OLD.soil_moisture, 0),
+           moisture_count = moisture_count + (NEW.soil_moisture IS NOT NULL) - (OLD.soil_moisture IS NOT NULL),
+           total_area = total_area + COALESCE(NEW.area_hectares, 0) - COALESCE(OLD.area_hectares, 0) WHERE id = 1;
+       END''',
+    '''CREATE TRIGGER IF NOT EXISTS trg_irrigation_insert_summary AFTER INSERT ON irrigation_records
+       WHEN NEW.status = 'Scheduled' BEGIN
+         UPDATE farm_summary SET scheduled_irrigations = scheduled_irrigations + 1 WHERE id = 1;
+       END''',
+    '''CREATE TRIGGER IF NOT EXISTS trg_irrigation_update_summary AFTER UPDATE OF status ON irrigation_records BEGIN
+         UPDATE farm_summary SET scheduled_irrigations = scheduled_irrigations
+           + (NEW.status IS 'Scheduled') - (OLD.status IS 'Scheduled') WHERE id = 1;
+       END''',
+    '''CREATE TRIGGER IF NOT EXISTS trg_irrigation_delete_summary AFTER DELETE ON irrigation_records
+       WHEN OLD.status = 'Scheduled' BEGIN
+         UPDATE farm_summary SET scheduled_irrigations = scheduled_irrigations - 1 WHERE id = 1;
+       END''',
+    '''CREATE TRIGGER IF NOT EXISTS trg_alerts_insert_summary AFTER INSERT ON alerts BEGIN
+         UPDATE farm_summary SET active_alerts = active_alerts + (NEW.resolved = 0) WHERE id = 1;
+         INSERT INTO alert_type_counts (alert_type, alerts) VALUES (NEW.alert_type, 1)
+           ON CONFLICT (alert_type) DO UPDATE SET alerts = alerts + 1;
+       END''',
+    '''CREATE TRIGGER IF NOT EXISTS trg_alerts_update_summary AFTER UPDATE OF resolved, alert_type ON alerts BEGIN
+         UPDATE farm_summary SET active_alerts = active_alerts + (NEW.resolved = 0) - (OLD.resolved = 0) WHERE id = 1;
+         UPDATE alert_type_counts SET alerts = alerts - 1 WHERE alert_type IS OLD.alert_type;
+         INSERT INTO alert_type_counts (alert_type, alerts) VALUES (NEW.alert_type, 1)
+           ON CONFLICT (alert_type) DO UPDATE SET alerts = alerts + 1;
+       END''',
+    '''CREATE TRIGGER IF NOT EXISTS trg_alerts_delete_summary AFTER DELETE ON alerts BEGIN
+         UPDATE farm_summary SET active_alerts = active_alerts - (OLD.resolved = 0) WHERE id = 1;
+         UPDATE alert_type_counts SET alerts = alerts - 1 WHERE alert_type IS OLD.alert_type;
+       END''',
+
+    # field_daily_rollups
+    '''CREATE TRIGGER IF NOT EXISTS trg_fields_readings_daily AFTER UPDATE OF soil_moisture, temperature ON fields BEGIN
+         INSERT INTO field_daily_rollups (field_id, day, moisture_sum, moisture_count, moisture_min, moisture_max,
+                                          temperature_sum, temperature_count)
+         VALUES (NEW.id, date('now', 'localtime'),
+                 COALESCE(NEW.soil_moisture, 0), NEW.soil_moisture IS NOT NULL, NEW.soil_moisture, NEW.soil_moisture,
+                 COALESCE(NEW.temperature, 0), NEW.temperature IS NOT NULL)
+         ON CONFLICT (field_id, day) DO UPDATE SET
+           moisture_sum = moisture_sum + excluded.moisture_sum,
+           moisture_count = moisture_count + excluded.moisture_count,
+           moisture_min = MIN(COALESCE(moisture_min, excluded.moisture_min), COALESCE(excluded.moisture_min, moisture_min)),
+           moisture_max = MAX(COALESCE(moisture_max, excluded.moisture_max), COALESCE(excluded.moisture_max, moisture_max)),
+           temperature_sum = temperature_sum + excluded.temperature_sum,
+           temperature_count = temperature_count + excluded.temperature_count;
+       END''',
+    '''CREATE TRIGGER IF NOT EXISTS trg_npk_insert_daily AFTER INSERT ON npk_levels
+       WHEN NEW.field_id IS NOT NULL BEGIN
+         INSERT INTO field_daily_rollups (field_id, day, nitrogen_sum, phosphorus_sum, potassium_sum, npk_count)
+         VALUES (NEW.field_id, COALESCE(date(NEW.recorded_at), date('now', 'localtime')), COALESCE(NEW.nitrogen, 0), COALESCE(NEW.phosphorus, 0),
+                 COALESCE(NEW.potassium, 0), 1)
+         ON CONFLICT (field_id, day) DO UPDATE SET
+           nitrogen_sum = nitrogen_sum + excluded.nitrogen_sum,
+           phosphorus_sum = phosphorus_sum + excluded.phosphorus_sum,
+           potassium_sum = potassium_sum + excluded.potassium_sum,
+           npk_count = npk_count + 1;
+       END''',
+    '''CREATE TRIGGER IF NOT EXISTS trg_irrigation_insert_daily AFTER INSERT ON irrigation_records
+       WHEN NEW.field_id IS NOT NULL BEGIN
+         INSERT INTO field_daily_rollups (field_id, day, water_liters, irrigations)
+         VALUES (NEW.field_id, COALESCE(date(COALESCE(NEW.scheduled_time, NEW.created_at)), date('now', 'localtime')), COALESCE(NEW.water_volume_liters, 0), 1)
+         ON CONFLICT (field_id, day) DO UPDATE SET
+           water_liters = water_liters + excluded.water_liters,
+           irrigations = irrigations + 1;
+       END''',
+]
+
+
+def rebuild_rollups(conn):
+    """Recompute every rollup from the raw tables.
+
+    Moisture/temperature samples in field_daily_rollups come from field
+    updates, which are not stored anywhere else, so they are kept as they
+    are; NPK and water columns are rebuilt from npk_levels and
+    irrigation_records, including their history partitions.
+    """
+    conn.execute('''UPDATE farm_summary SET
+                      total_fields = (SELECT COUNT(*) FROM fields),
+                      moisture_sum = (SELECT COALESCE(SUM(soil_moisture), 0) FROM fields),
+                      moisture_count = (SELECT COUNT(soil_moisture) FROM fields),
+                      total_area = (SELECT COALESCE(SUM(area_hectares), 0) FROM fields),
+                      scheduled_irrigations = (SELECT COUNT(*) FROM irrigation_records WHERE status = 'Scheduled'),
+                      active_alerts = (SELECT COUNT(*) FROM alerts WHERE resolved = 0)
+                    WHERE id = 1''')
+    conn.execute('DELETE FROM alert_type_counts')
+    conn.execute('''INSERT INTO alert_type_counts (alert_type, alerts)
+                    SELECT alert_type, COUNT(*) FROM alerts GROUP BY alert_type''')
+
+    # Days whose readings were dropped by history retention keep their rollups.
+    npk_since = history.retained_since(conn, 'npk_levels')
+    water_since = history.retained_since(conn, 'irrigation_records')
+    conn.execute('''UPDATE field_daily_rollups SET nitrogen_sum = 0, phosphorus_sum = 0, potassium_sum = 0, npk_count = 0
+                    WHERE day >= COALESCE(?, day)''', (npk_since,))
+    conn.execute('UPDATE field_daily_rollups SET water_liters = 0, irrigations = 0 WHERE day >= COALESCE(?, day)',
+                 (water_since,))
+    npk = history.union_sources(conn, 'npk_levels', 'field_id, recorded_at, nitrogen, phosphorus, potassium, 1 AS samples',
+                                'field_id, hour, nitrogen_sum, phosphorus_sum, potassium_sum, samples')
+    conn.execute(f'''INSERT INTO field_daily_rollups (field_id, day, nitrogen_sum, phosphorus_sum, potassium_sum, npk_count)
+                     SELECT field_id, date(recorded_at), SUM(COALESCE(nitrogen, 0)), SUM(COALESCE(phosphorus, 0)),
+                            SUM(COALESCE(potassium, 0)), SUM(samples)
+                     FROM ({npk}) WHERE field_id IS NOT NULL AND recorded_at IS NOT NULL GROUP BY field_id, date(recorded_at)
+                     ON CONFLICT (field_id, day) DO UPDATE SET
+                       nitrogen_sum = excluded.nitrogen_sum, phosphorus_sum = excluded.phosphorus_sum,
+                       potassium_sum = excluded.potassium_sum, npk_count = excluded.npk_count''')
+    water = history.union_sources(conn, 'irrigation_records', 'field_id, scheduled_time, created_at, water_volume_liters')
+    conn.execute(f'''INSERT INTO field_daily_rollups (field_id, day, water_liters, irrigations)
+                     SELECT field_id, date(COALESCE(scheduled_time, created_at)), SUM(COALESCE(water_volume_liters, 0)), COUNT(*)
+                     FROM ({water}) WHERE field_id IS NOT NULL AND COALESCE(scheduled_time, created_at) IS NOT NULL GROUP BY field_id, date(COALESCE(scheduled_time, created_at))
+                     ON CONFLICT (field_id, day) DO UPDATE SET
+                       water_liters = excluded.water_liters, irrigations = excluded.irrigations''')
+    conn.execute('''DELETE FROM field_daily_rollups
+                    WHERE moisture_count = 0 AND temperature_count = 0 AND npk_count = 0 AND irrigations = 0''')
+
+
+def read_summary(conn):
+    """Raw farm_summary totals plus the alert types in use; mergeable across farms."""
+    row = conn.execute('''SELECT total_fields, moisture_sum, moisture_count, total_area,
+                                 scheduled_irrigations, active_alerts FROM farm_summary WHERE id = 1''').fetchone()
+    summary = dict(row)
+    summary['alert_types'] = [r[0] for r in conn.execute(
+        'SELECT alert_type FROM alert_type_counts WHERE alerts > 0 AND alert_type IS NOT NULL')]
+    return summary
+
+
+def merge_summaries(summaries):
+    merged = {'total_fields': 0, 'moisture_sum': 0, 'moisture_count': 0, 'total_area': 0,
+              'scheduled_irrigations': 0, 'active_alerts': 0, 'alert_types': set()}
+    for summary in summaries:
+        for key, value in summary.items():
+            if key == 'alert_types':
+                merged[key].update(value)
+            else:
+                merged[key] += value
+    return merged
+
+
+def format_analytics(summary):
+    return {
+        'total_fields': summary['total_fields'],
+        'average_moisture': round(summary['moisture_sum'] / summary['moisture_count'], 2) if summary['moisture_count'] else 0,
+        'scheduled_irrigations': summary['scheduled_irrigations'],
+        'active_alerts': summary['active_alerts'],
+        'total_area_hectares': round(summary['total_area'], 2),
+        'alert_types': len(set(summary['alert_types']))
+    }
+
+
+def read_analytics(conn):
+    return format_analytics(read_summary(conn))
+
+
+def read_field_trends(conn, field_id, since):
+    rows = conn.execute('''SELECT day, moisture_sum, moisture_count, moisture_min, moisture_max,
+                                  temperature_sum, temperature_count, nitrogen_sum, phosphorus_sum,
+                                  potassium_sum, npk_count, water_liters, irrigations
+                           FROM field_daily_rollups WHERE field_id = ? AND day >= ? ORDER BY day''',
+                        (field_id, since)).fetchall()
+
+    def avg(total, count):
+        return round(total / count, 2) if count else None
+
+    return [{
+        'date': r['day'],
+        'moisture': avg(r['moisture_sum'], r['moisture_count']),
+        'moisture_min': r['moisture_min'],
+        'moisture_max': r['moisture_max'],
+        'temperature': avg(r['temperature_sum'], r['temperature_count']),
+        'nitrogen': avg(r['nitrogen_sum'], r['npk_count']),
+        'phosphorus': avg(r['phosphorus_sum'], r['npk_count']),
+        'potassium': avg(r['potassium_sum'], r['npk_count']),
+        'water_liters': round(r['water_liters'], 1),
+        'irrigations': r['irrigations']
+    } for r in rows]
@@ -0,0 +1,140 @@
+"""Monte Carlo what-if simulation of crop yield under weather scenarios.
+
+The weather table holds one deterministic forecast. ``sample_weather`` draws
+trajectories around it:
+
+* daily mean temperature is the forecast plus a random walk, so the spread
+  grows with lead time;
+* forecast rain is scaled by a mean-one log-normal factor;
+* dry days get an occasional surprise shower.
+
+Each trajectory goes through the same vectorised model as the stored
+forecast (``forecast.yield_model``). The result is p10/p50/p90 over the
+scenarios for every field and day, plus the same bands for the farm-average
+yield.
+
+Large runs are split into contiguous field ranges, one per worker of a
+process pool. Every worker re-draws the identical trajectories from the
+seed, so only the field features cross the process boundary. Each worker
+evaluates its range in sub-batches of at most ``SCENARIO_BATCH_CELLS``
+(scenario x field x day) cells, which bounds its memory.
+"""
+import hashlib
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import numpy as np
+
+from forecast import yield_model
+
+PERCENTILES = (10, 50, 90)
+# Mean size (mm) of an unforecast shower.
+SURPRISE_RAIN_MM = 5.0
+
+# Settings the model and the sampler read; workers get only these.
+CONFIG_KEYS = ('NPK_NITROGEN_MIN', 'NPK_PHOSPHORUS_MIN', 'NPK_POTASSIUM_MIN',
+               'SOIL_MOISTURE_THRESHOLD_OPTIMAL_MIN', 'SOIL_MOISTURE_THRESHOLD_OPTIMAL_MAX',
+               'TEMPERATURE_MIN', 'TEMPERATURE_MAX',
+               'SCENARIO_TEMP_SIGMA', 'SCENARIO_RAIN_SIGMA', 'SCENARIO_RAIN_CHANCE', 'SCENARIO_BATCH_CELLS')
+
+
+def sample_weather(weather, scenarios, seed, cfg):
+    """(scenarios, days, 2) precipitation/temperature trajectories around ``weather`` (days, 2)."""
+    rng = np.random.default_rng(seed)
+    shape = (scenarios, weather.shape[0])
+    sigma = cfg['SCENARIO_RAIN_SIGMA']
+    rain = weather[:, 0] * rng.lognormal(-sigma ** 2 / 2, sigma, shape)
+    showers = (rng.random(shape) < cfg['SCENARIO_RAIN_CHANCE']) & (weather[:, 0] == 0)
+    rain += np.where(showers, rng.exponential(SURPRISE_RAIN_MM, shape), 0.0)
+    temp = weather[:, 1] + np.cumsum(rng.normal(0.0, cfg['SCENARIO_TEMP_SIGMA'], shape), axis=1)
+    return np.stack([rain, temp], axis=-1)
+
+
+def simulate_fields(features, scenarios, seed, cfg):
+    """Bands (percentile, field, day) for ``features``, and the (scenario, day) sum of their yields."""
+    weather = sample_weather(features.weather, scenarios, seed, cfg)
+    days = weather.shape[1]
+    step = max(1, cfg['SCENARIO_BATCH_CELLS'] // (scenarios * days))
+    bands = np.empty((len(PERCENTILES), len(features), days))
+    total = np.zeros((scenarios, days))
+    for start in range(0, len(features), step):
+        yields = yield_model(features.subset(slice(start, start + step)), weather, cfg)
+        bands[:, start:start + step] = np.percentile(yields, PERCENTILES, axis=0)
+        total += yields.sum(axis=1)
+    return bands, total
+
+
+def inputs_key(features, start, seed, cfg):
+    """Digest of everything a simulation depends on except the scenario count."""
+    digest = hashlib.blake2b(digest_size=16)
+    for array in (features.field_ids, features.moisture, features.temperature, features.npk, features.weather):
+        digest.update(np.ascontiguousarray(array).tobytes())
+    digest.update(repr((features.crops, str(start), seed, sorted(cfg.items()))).encode())
+    return digest.hexdigest()
+
+
+class ScenarioSimulator:
+    def __init__(self, cfg):
+        self.cfg = {key: cfg[key] for key in CONFIG_KEYS}
+        # Workers are forked: a spawned worker would re-run the importing
+        # script (app.py with its startup work) as __main__.
+        self.workers = cfg['SCENARIO_WORKERS'] if 'fork' in multiprocessing.get_all_start_methods() else 1
+        self.parallel_min_cells = cfg['SCENARIO_PARALLEL_MIN_CELLS']
+        self.stats = {
+            'runs': 0,
+            'parallel_runs': 0,
+            'workers': self.workers,
+            'last_cells': 0,
+            'last_seconds': None,
+        }
+        self._reset()
+        # A forked web worker must not share its parent's pool.
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self._reset)
+
+    def _reset(self):
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def _pool(self):
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context('fork'))
+        return self._executor
+
+    def run(self, features, scenarios, seed):
+        """Field bands (percentile, field, day) and farm-average bands (percentile, day), rounded like predict()."""
+        start = time.perf_counter()
+        cells = scenarios * len(features) * features.weather.shape[0]
+        parallel = self.workers > 1 and len(features) > 1 and cells >= self.parallel_min_cells
+        if parallel:
+            bounds = np.linspace(0, len(features), min(self.workers, len(features)) + 1).astype(int)
+            try:
+                futures = [self._pool().submit(simulate_fields, features.subset(slice(a, b)), scenarios, seed, self.cfg)
+                           for a, b in zip(bounds[:-1], bounds[1:])]
+                parts = [future.result() for future in futures]
+            except BrokenProcessPool:
+                self._executor = None
+                raise
+            bands = np.concatenate([part[0] for part in parts], axis=1)
+            total = sum(part[1] for part in parts)
+        else:
+            bands, total = simulate_fields(features, scenarios, seed, self.cfg)
+        farm = np.percentile(total / max(len(features), 1), PERCENTILES, axis=0)
+        self.stats.update({
+            'runs': self.stats['runs'] + 1,
+            'parallel_runs': self.stats['parallel_runs'] + parallel,
+            'last_cells': cells,
+            'last_seconds': round(time.perf_counter() - start, 3),
+        })
+        return np.round(bands, 1), np.round(farm, 1)
+
+    def stop(self, timeout=None):
+        executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True, cancel_futures=True)
@@ -0,0 +1,210 @@
+"""Pre-fork production launcher.
+
+    python serve.py [--bind 0.0.0.0:5000] [--workers N] [--access-log]
+
+The master imports app.py exactly once, so migrations, seeding and the
+forecast precompute run once rather than in every worker. It also warms the
+response cache, closes its database connections and freezes the heap
+(``gc.freeze``) so forked workers share all of that copy-on-write. It then
+forks ``WORKERS`` processes that serve one shared listening socket with
+werkzeug's threaded server. A worker is ready as soon as fork() returns.
+Background jobs (alert engine, irrigation scheduler) run in worker 0 only.
+
+Signals to the master:
+
+* ``SIGHUP``          - graceful reload: re-warm, fork a fresh generation,
+  then let the old workers finish in-flight requests and exit;
+* ``SIGTERM/SIGINT``  - graceful shutdown;
+* a worker that dies unexpectedly is replaced.
+
+Caches and SSE subscribers are per worker: a write invalidates the cache of
+the worker that handled it, and other workers catch up within
+``RESPONSE_CACHE_TTL`` (``FIELD_STATE_RESYNC_SECONDS`` for the field state). Unix only (needs os.fork).
+"""
+import argparse
+import gc
+import logging
+import os
+import signal
+import socket
+import sys
+import threading
+import time
+
+from werkzeug.serving import WSGIRequestHandler, make_server
+
+os.environ.setdefault('FLASK_CONFIG', 'production')
+os.environ['AGRI_PREFORK'] = '1'
+
+logger = logging.getLogger('agri.serve')
+
+WATCHED = {signal.SIGHUP, signal.SIGTERM, signal.SIGINT, signal.SIGCHLD}
+
+
+def warm(app_module):
+    app_module.each_farm(app_module.dashboard_snapshot)
+    for pool in app_module.db_pool.farm_instances():
+        pool.close_all()
+    gc.collect()
+    gc.freeze()
+
+
+def serve_worker(app_module, listener, index, forked_at, access_log):
+    signal.pthread_sigmask(signal.SIG_UNBLOCK, WATCHED)
+    signal.signal(signal.SIGHUP, signal.SIG_IGN)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    class RequestHandler(WSGIRequestHandler):
+        def log_request(self, *args, **kwargs):
+            if access_log:
+                super().log_request(*args, **kwargs)
+
+    host, port = listener.getsockname()[:2]
+    server = make_server(host, port, app_module.app, threaded=True,
+                         request_handler=RequestHandler, fd=listener.fileno())
+    # Non-daemon request threads so server_close() waits for in-flight requests.
+    server.daemon_threads = False
+
+    def stop(signum, frame):
+        threading.Thread(target=server.shutdown, daemon=True).start()
+
+    signal.signal(signal.SIGTERM, stop)
+    if index == 0:
+        app_module.start_background_jobs()
+    logger.info('worker %d (pid %d) ready in %.1f ms', index, os.getpid(), (time.monotonic() - forked_at) * 1000)
+
+    server.serve_forever()
+    for broker in app_module.broker.farm_instances():
+        broker.disconnect_all()
+    app_module.stop_background_jobs(timeout=5)
+    server.server_close()
+
+
+class Master:
+    def __init__(self, app_module, listener, workers, graceful_timeout, access_log):
+        self.app_module = app_module
+        self.listener = listener
+        self.num_workers = workers
+        self.graceful_timeout = graceful_timeout
+        self.access_log = access_log
+        self.generation = 0
+        self.workers = {}    # pid -> (index, generation, started_at)
+        self.draining = {}   # pid -> kill deadline
+        self.stopping = False
+
+    def spawn(self, index):
+        forked_at = time.monotonic()
+        pid = os.fork()
+        if pid == 0:
+            status = 0
+            try:
+                serve_worker(self.app_module, self.listener, index, forked_at, self.access_log)
+            except BaseException:
+                logger.exception('worker %d crashed', index)
+                status = 1
+            finally:
+                logging.shutdown()
+                os._exit(status)
+        self.workers[pid] = (index, self.generation, forked_at)
+
+    def drain(self, pids):
+        deadline = time.monotonic() + self.graceful_timeout
+        for pid in pids:
+            self.draining[pid] = deadline
+            self._kill(pid, signal.SIGTERM)
+
+    def _kill(self, pid, sig):
+        try:
+            os.kill(pid, sig)
+        except ProcessLookupError:
+            pass
+
+    def reload(self):
+        old = list(self.workers)
+        self.generation += 1
+        self.app_module.reload_state()
+        warm(self.app_module)
+        for index in range(self.num_workers):
+            self.spawn(index)
+        self.drain(old)
+        logger.info('reloaded: generation %d, draining %d old workers', self.generation, len(old))
+
+    def reap(self):
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+            self.draining.pop(pid, None)
+            index, generation, started_at = self.workers.pop(pid, (None, None, None))
+            if index is None or generation != self.generation or self.stopping:
+                continue
+            logger.warning('worker %d (pid %d) exited with status %d; restarting',
+                           index, pid, os.waitstatus_to_exitcode(status))
+            # Do not fork-loop on a worker that dies during startup.
+            if time.monotonic() - started_at < 1.0:
+                time.sleep(1.0)
+            self.spawn(index)
+
+    def enforce_deadlines(self):
+        now = time.monotonic()
+        for pid, deadline in list(self.draining.items()):
+            if now >= deadline:
+                logger.warning('worker pid %d did not drain in %ss; killing', pid, self.graceful_timeout)
+                self._kill(pid, signal.SIGKILL)
+                del self.draining[pid]
+
+    def shutdown(self):
+        self.stopping = True
+        self.drain(list(self.workers))
+        while self.workers:
+            self.reap()
+            self.enforce_deadlines()
+            time.sleep(0.05)
+        self.listener.close()
+
+    def run(self):
+        signal.pthread_sigmask(signal.SIG_BLOCK, WATCHED)
+        for index in range(self.num_workers):
+            self.spawn(index)
+        logger.info('master pid %d serving %s:%d with %d workers', os.getpid(),
+                    *self.listener.getsockname()[:2], self.num_workers)
+        while True:
+            info = signal.sigtimedwait(WATCHED, 1.0)
+            sig = info.si_signo if info else None
+            if sig in (signal.SIGTERM, signal.SIGINT):
+                logger.info('shutting down')
+                self.shutdown()
+                return
+            if sig == signal.SIGHUP:
+                self.reload()
+            self.reap()
+            self.enforce_deadlines()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--bind', default=os.environ.get('BIND', '0.0.0.0:5000'))
+    parser.add_argument('--workers', type=int, help='defaults to WORKERS from the config')
+    parser.add_argument('--access-log', action='store_true')
+    args = parser.parse_args()
+
+    if not hasattr(os, 'fork'):
+        sys.exit('serve.py needs os.fork(); use `python app.py` or `uvicorn asgi:app` on this platform')
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s [%(process)d] %(levelname)s %(name)s: %(message)s')
+
+    import app as app_module
+
+    host, _, port = args.bind.rpartition(':')
+    listener = socket.create_server((host or '0.0.0.0', int(port)), backlog=2048)
+    listener.set_inheritable(True)
+
+    warm(app_module)
+    workers = args.workers or app_module.app.config['WORKERS']
+    Master(app_module, listener, workers, app_module.app.config['WORKER_GRACEFUL_TIMEOUT'], args.access_log).run()
+
+
+if __name__ == '__main__':
+    main()
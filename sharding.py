@@ -0,0 +1,131 @@
+"""Multi-farm sharding: one SQLite database file per farm.
+
+Each farm gets its own file, so it also gets its own write lock, WAL and
+page cache. A burst of writes on one farm never waits behind another's.
+The shard map is built at startup from:
+
+* ``'default'``, which is ``SQLALCHEMY_DATABASE_URI``;
+* every ``<farm>.db`` in ``FARM_SHARD_DIR``;
+* the explicit ``FARM_SHARDS`` entries.
+
+Requests name their farm with the ``X-Farm`` header or ``?farm=``. The farm
+lives in a ContextVar, and per-process state built from one database is
+wrapped in ``FarmLocal``. As a result ``db_pool.acquire()``,
+``field_state.summary()`` and the other existing call sites reach the
+current farm's instance without being changed. Background threads and
+fan-out tasks run their work under ``use_farm``.
+"""
+import contextvars
+import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from functools import wraps
+
+DEFAULT_FARM = 'default'
+ALL_FARMS = '*'
+FARM_KEY = re.compile(r'^[A-Za-z0-9][A-Za-z0-9_-]{0,63}$')
+
+current_farm = contextvars.ContextVar('farm', default=DEFAULT_FARM)
+
+
+class UnknownFarm(ValueError):
+    pass
+
+
+@contextmanager
+def use_farm(farm):
+    token = current_farm.set(farm)
+    try:
+        yield farm
+    finally:
+        current_farm.reset(token)
+
+
+def in_farm(farm, fn):
+    """``fn`` wrapped to always run with ``farm`` current (for callbacks on other threads)."""
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        with use_farm(farm):
+            return fn(*args, **kwargs)
+    return wrapper
+
+
+class ShardMap:
+    def __init__(self, default_path, shards=None, shard_dir=None, fanout_workers=8):
+        self.paths = {DEFAULT_FARM: default_path}
+        if shard_dir and os.path.isdir(shard_dir):
+            for name in sorted(os.listdir(shard_dir)):
+                farm, ext = os.path.splitext(name)
+                if ext == '.db' and FARM_KEY.match(farm):
+                    self.paths[farm] = os.path.join(shard_dir, name)
+        for farm, path in (shards or {}).items():
+            if not FARM_KEY.match(farm):
+                raise ValueError(f'Invalid farm key {farm!r}')
+            self.paths[farm] = path
+        by_file = {}
+        for farm, path in self.paths.items():
+            if path != ':memory:' and by_file.setdefault(os.path.abspath(path), farm) != farm:
+                raise ValueError(f'Farms {by_file[os.path.abspath(path)]!r} and {farm!r} share {path}')
+        self.fanout_workers = fanout_workers
+        self._reset()
+        # Executor threads do not survive a fork; a forked worker starts its own.
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self._reset)
+
+    def _reset(self):
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def farms(self):
+        return list(self.paths)
+
+    def path(self, farm):
+        try:
+            return self.paths[farm]
+        except KeyError:
+            raise UnknownFarm(f'Unknown farm {farm!r}')
+
+    def resolve(self, requested):
+        """Farm key named by a request (header or query value); UnknownFarm if not mapped."""
+        farm = requested or DEFAULT_FARM
+        self.path(farm)
+        return farm
+
+    def fan_out(self, fn, *args):
+        """``{farm: fn(*args)}`` over every shard, run in parallel with each farm current."""
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(self.fanout_workers, thread_name_prefix='farm-fanout')
+        futures = {farm: self._executor.submit(in_farm(farm, fn), *args) for farm in self.paths}
+        return {farm: future.result() for farm, future in futures.items()}
+
+
+class FarmLocal:
+    """One ``factory(farm)`` instance per farm, created on first use.
+
+    Attribute access is forwarded to the current farm's instance.
+    """
+
+    def __init__(self, factory):
+        self._factory = factory
+        self._instances = {}
+        self._lock = threading.Lock()
+
+    def farm_instance(self, farm=None):
+        farm = farm or current_farm.get()
+        instance = self._instances.get(farm)
+        if instance is None:
+            with self._lock:
+                instance = self._instances.get(farm)
+                if instance is None:
+                    instance = self._instances[farm] = self._factory(farm)
+        return instance
+
+    def farm_instances(self):
+        return list(self._instances.values())
+
+    def __getattr__(self, name):
+        return getattr(self.farm_instance(), name)
@@ -39,4 +39,8 @@ echo ""
 echo "Press Ctrl+C to stop the server"
 echo ""
 
+# ./start.sh --production runs the pre-fork launcher (kill -HUP <pid> reloads)
+if [ "$1" = "--production" ]; then
+    exec python3 serve.py
+fi
 python3 app.py
@@ -0,0 +1,36 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# app.py opens its databases, migrates and seeds at import time, so the
+# throwaway database has to be chosen before anything imports it. The
+# development config keeps the background jobs off.
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(prefix='agri-tests-'), 'test.db')
+os.environ['FLASK_CONFIG'] = 'development'
+os.environ['METRICS_MODE'] = 'off'
+os.environ.pop('FARM_SHARDS', None)
+os.environ.pop('FARM_SHARD_DIR', None)
+sys.path.insert(0, ROOT)
+
+
+@pytest.fixture(scope='session')
+def app_module():
+    import app as app_module
+    yield app_module
+    app_module.stop_background_jobs()
+
+
+@pytest.fixture
+def client(app_module):
+    return app_module.app.test_client()
+
+
+@pytest.fixture
+def conn(app_module):
+    conn = app_module.get_db()
+    yield conn
+    conn.close()
@@ -0,0 +1,155 @@
+import sqlite3
+from functools import partial
+
+import numpy as np
+import pytest
+
+from anomaly import METRICS, SCHEMA, AnomalyDetector, reading_values
+from config import Config
+
+CFG = {k: getattr(Config, k) for k in dir(Config) if k.startswith('ANOMALY_')}
+MOISTURE = METRICS.index('moisture')
+
+
+@pytest.fixture
+def detector(tmp_path):
+    path = str(tmp_path / 'anomaly.db')
+    conn = sqlite3.connect(path)
+    for statement in SCHEMA:
+        conn.execute(statement)
+    conn.execute('CREATE TABLE fields (id INTEGER PRIMARY KEY, name TEXT)')
+    conn.execute('''CREATE TABLE alerts (id INTEGER PRIMARY KEY, field_id INTEGER, alert_type TEXT, message TEXT,
+                    recommendation TEXT, priority TEXT, created_at TIMESTAMP, resolved INTEGER DEFAULT 0)''')
+    conn.execute("INSERT INTO fields (id, name) VALUES (1, 'East Block')")
+    conn.commit()
+    conn.close()
+    detector = AnomalyDetector(partial(sqlite3.connect, path), CFG)
+    yield detector
+    detector.stop(timeout=5)
+
+
+def moisture(*values):
+    return reading_values([{'soil_moisture': v} for v in values])
+
+
+def warm_up(detector, field_id=1, readings=CFG['ANOMALY_WARMUP'] + 5):
+    """A steady sensor alternating between 50 and 51."""
+    for k in range(readings):
+        flags, _ = detector.observe([field_id], moisture(50 + k % 2))
+        assert flags == []
+
+
+def test_reading_values_keeps_only_numbers():
+    values = reading_values([{'soil_moisture': 40, 'temperature': '20', 'nitrogen': True, 'potassium': 7.5}])
+    assert values.shape == (1, len(METRICS))
+    assert np.isnan(values[0]).tolist() == [False, True, True, True, False]
+
+
+def test_nothing_is_flagged_during_warm_up(detector):
+    for value in (50, 90, 10, 50):
+        assert detector.observe([1], moisture(value)) == ([], [])
+
+
+def test_spike_is_flagged_against_the_baseline(detector):
+    warm_up(detector)
+    flags, sustained = detector.observe([1], moisture(80))
+
+    [(position, metric, value, z, expected)] = flags
+    assert (position, metric, value) == (0, MOISTURE, 80.0)
+    assert z > CFG['ANOMALY_Z_THRESHOLD'] and expected == pytest.approx(50.5, abs=0.5)
+    assert sustained == []
+    # The clipped update barely moves the baseline.
+    assert detector.baseline(1)['moisture']['mean'] < 51
+
+
+def test_sustained_run_is_reported_once(detector):
+    warm_up(detector)
+    sustain = CFG['ANOMALY_SUSTAIN']
+    reported = [detector.observe([1], moisture(80))[1] for _ in range(sustain + 2)]
+    assert [len(s) for s in reported] == [0] * (sustain - 1) + [1, 0, 0]
+    assert detector.baseline(1)['moisture']['streak'] == sustain + 2
+
+    # A normal reading ends the run.
+    detector.observe([1], moisture(50))
+    assert detector.baseline(1)['moisture']['streak'] == 0
+
+
+def test_repeated_field_in_one_batch_matches_one_at_a_time(tmp_path, detector):
+    values = [50, 51, 50, 52, 49, 51]
+    detector.observe([1, 2, 1, 1, 2, 1], moisture(*values))
+
+    other = AnomalyDetector(partial(sqlite3.connect, str(tmp_path / 'anomaly.db')), CFG)
+    for field_id, value in zip([1, 2, 1, 1, 2, 1], values):
+        other.observe([field_id], moisture(value))
+    other.stop(timeout=5)
+    assert detector.baseline(1) == other.baseline(1) and detector.baseline(2) == other.baseline(2)
+
+
+@pytest.mark.parametrize('bad', ['7', None, True, 2.0])
+def test_bad_field_id_leaves_state_untouched(detector, bad):
+    detector.observe([1], moisture(50))
+    with pytest.raises(TypeError):
+        detector.observe([3, bad], moisture(50, 50))
+    assert detector.stats['fields'] == 1 and detector.baseline(3) is None
+
+    detector.observe([3], moisture(50))
+    assert all(detector._ids[row] == field_id for field_id, row in detector._index.items())
+
+
+def test_arrays_grow_by_doubling(detector):
+    for field_id in range(1, 201):
+        detector.observe([field_id], moisture(50))
+    assert detector.stats['fields'] == 200
+    assert len(detector._ids) == 256
+    assert all(detector._ids[row] == field_id for field_id, row in detector._index.items())
+
+
+def test_checkpoint_restores_the_baseline(tmp_path, detector):
+    warm_up(detector)
+    detector.observe([2], reading_values([{'temperature': 21, 'nitrogen': 40}]))
+    assert detector.checkpoint() == 3
+    assert detector.checkpoint() == 0  # nothing changed since
+
+    restored = AnomalyDetector(partial(sqlite3.connect, str(tmp_path / 'anomaly.db')), CFG)
+    assert restored.baseline(1) == detector.baseline(1)
+    assert set(restored.baseline(2)) == {'temperature', 'nitrogen'}
+    flags, _ = restored.observe([1], moisture(80))
+    restored.stop(timeout=5)
+    assert len(flags) == 1
+
+
+def test_sustained_flag_raises_one_open_alert(detector):
+    warm_up(detector)
+    sustained = []
+    for _ in range(CFG['ANOMALY_SUSTAIN']):
+        sustained += detector.observe([1], moisture(80))[1]
+
+    conn = detector.connect()
+    try:
+        assert detector.record_alerts(conn, [1], sustained) == 1
+        assert detector.record_alerts(conn, [1], sustained) == 0
+        [(message,)] = conn.execute("SELECT message FROM alerts WHERE alert_type = 'Sensor Anomaly'").fetchall()
+    finally:
+        conn.close()
+    assert message == 'Anomalous soil moisture readings in East Block'
+
+
+def test_routes_return_flags_inline(app_module, client):
+    seen = (app_module.anomaly_detector.baseline(4) or {}).get('temperature', {}).get('n', 0)
+    readings = [{'field_id': 4, 'temperature': 20 + k % 2} for k in range(CFG['ANOMALY_WARMUP'] + 40)]
+    assert client.post('/api/ingest', json=readings).status_code == 201
+
+    response = client.post('/api/field-update', json={'field_id': 4, 'temperature': 45})
+    assert response.status_code in (200, 202)
+    [flag] = response.get_json()['anomalies']
+    assert flag['metric'] == 'temperature' and flag['value'] == 45
+    assert client.get('/api/field/4/baseline').get_json()['temperature']['n'] == seen + len(readings) + 1
+
+
+def test_unknown_fields_get_no_baseline(app_module, client):
+    fields = app_module.anomaly_detector.stats['fields']
+    for field_id in range(900000, 900005):
+        response = client.post(f'/api/npk-levels/{field_id}', json={'nitrogen': 40, 'phosphorus': 30, 'potassium': 50})
+        assert response.get_json()['anomalies'] == []
+    assert app_module.anomaly_detector.stats['fields'] == fields
+    assert client.get('/api/field/900000/baseline').status_code == 404
@@ -0,0 +1,81 @@
+import json
+
+import pytest
+
+from ingest import IngestError, parse_readings, validate_reading
+
+KNOWN = {1, 2}
+
+
+@pytest.mark.parametrize('reading, error', [
+    ({'field_id': '1', 'soil_moisture': 50}, 'field_id must be an integer'),
+    ({'field_id': True, 'soil_moisture': 50}, 'field_id must be an integer'),
+    ({'field_id': 99, 'soil_moisture': 50}, 'unknown field_id 99'),
+    ({'field_id': 1, 'soil_moisture': 'wet'}, 'soil_moisture must be a number'),
+    ({'field_id': 1, 'temperature': 90}, 'temperature out of range'),
+    ({'field_id': 1, 'nitrogen': 40, 'phosphorus': 30}, 'must be sent together'),
+    ({'field_id': 1}, 'reading has no values'),
+    ({'field_id': 1, 'soil_moisture': 50, 'recorded_at': 'yesterday'}, 'recorded_at must be an ISO-8601 timestamp'),
+    ([1, 2], 'reading must be an object'),
+])
+def test_validate_reading_rejects(reading, error):
+    with pytest.raises(IngestError, match=error):
+        validate_reading(reading, KNOWN)
+
+
+def test_validate_reading_returns_naive_timestamp():
+    recorded_at = validate_reading({'field_id': 2, 'nitrogen': 40, 'phosphorus': 30, 'potassium': 50,
+                                    'recorded_at': '2026-03-01T10:00:00Z'}, KNOWN)
+    assert recorded_at.isoformat() == '2026-03-01T10:00:00'
+
+
+def test_parse_readings_shapes():
+    readings = [{'field_id': 1, 'soil_moisture': 50}]
+    assert parse_readings(json.dumps(readings).encode(), 'application/json') == readings
+    assert parse_readings(json.dumps({'readings': readings}), 'application/json') == readings
+
+    parsed = parse_readings(b'{"field_id": 1, "temperature": 20}\n\n{oops\n', 'application/x-ndjson')
+    assert parsed[0] == {'field_id': 1, 'temperature': 20}
+    assert isinstance(parsed[1], IngestError) and str(parsed[1]).startswith('line 3')
+
+
+@pytest.mark.parametrize('body', [b'{"readings": 5}', b'not json', b'\xff\xfe[]'])
+def test_parse_readings_rejects_malformed_bodies(body):
+    with pytest.raises(IngestError):
+        parse_readings(body, 'application/json')
+
+
+def test_ingest_accepts_valid_rows_and_reports_the_rest(client, conn):
+    before = conn.execute('SELECT COUNT(*) FROM npk_levels WHERE field_id = 2').fetchone()[0]
+    body = '\n'.join(json.dumps(r) for r in [
+        {'field_id': 2, 'nitrogen': 61, 'phosphorus': 41, 'potassium': 66},
+        {'field_id': 2, 'soil_moisture': 140},
+        {'field_id': 424242, 'temperature': 20},
+        {'field_id': 2, 'soil_moisture': 63.5, 'health_status': 'Good'},
+    ])
+    response = client.post('/api/ingest', data=body, content_type='application/x-ndjson')
+
+    assert response.status_code == 207
+    result = response.get_json()
+    assert (result['status'], result['accepted'], result['rejected']) == ('partial', 2, 2)
+    assert [r['status'] for r in result['results']] == ['accepted', 'rejected', 'rejected', 'accepted']
+    assert 'unknown field_id' in result['results'][2]['error']
+
+    after = conn.execute('SELECT COUNT(*) FROM npk_levels WHERE field_id = 2').fetchone()[0]
+    assert after == before + 1
+    assert tuple(conn.execute('SELECT soil_moisture, health_status FROM fields WHERE id = 2').fetchone()) == (63.5, 'Good')
+
+
+def test_ingest_all_accepted_is_201(client):
+    response = client.post('/api/ingest', json=[{'field_id': 1, 'temperature': 22.5}])
+    assert response.status_code == 201
+    assert response.get_json()['status'] == 'success'
+
+
+def test_ingest_rejects_bad_payloads_and_oversized_batches(app_module, client, monkeypatch):
+    assert client.post('/api/ingest', data=b'\xff', content_type='application/json').status_code == 400
+    assert client.post('/api/ingest', json={'readings': 'nope'}).status_code == 400
+
+    monkeypatch.setitem(app_module.app.config, 'INGEST_MAX_BATCH', 2)
+    response = client.post('/api/ingest', json=[{'field_id': 1, 'temperature': 20}] * 3)
+    assert response.status_code == 413
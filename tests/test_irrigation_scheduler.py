@@ -0,0 +1,174 @@
+import sqlite3
+import time
+from contextlib import closing
+from datetime import datetime, timedelta
+
+import pytest
+
+from irrigation_scheduler import COMPLETE, START, IrrigationScheduler, moisture_gain
+
+CFG = {'IRRIGATION_UPDATE_INTERVAL': 60000, 'IRRIGATION_DISPATCH_BATCH': 100}
+
+
+@pytest.fixture
+def connect(tmp_path):
+    path = str(tmp_path / 'irrigation.db')
+    with closing(sqlite3.connect(path)) as conn, conn:
+        conn.execute('CREATE TABLE fields (id INTEGER PRIMARY KEY, soil_moisture REAL)')
+        conn.execute('''CREATE TABLE irrigation_records (id INTEGER PRIMARY KEY, field_id INTEGER, duration_minutes INTEGER,
+                        water_volume_liters REAL, scheduled_time TIMESTAMP, status TEXT)''')
+        conn.executemany('INSERT INTO fields (id, soil_moisture) VALUES (?, ?)', [(1, 50.0), (2, 95.0)])
+    return lambda: sqlite3.connect(path)
+
+
+def add_record(connect, field_id, start, duration, volume=500, status='Scheduled'):
+    with closing(connect()) as conn, conn:
+        return conn.execute('''INSERT INTO irrigation_records (field_id, duration_minutes, water_volume_liters, scheduled_time, status)
+                               VALUES (?, ?, ?, ?, ?)''', (field_id, duration, volume, start.isoformat(), status)).lastrowid
+
+
+def status(connect, record_id):
+    with closing(connect()) as conn, conn:
+        return conn.execute('SELECT status FROM irrigation_records WHERE id = ?', (record_id,)).fetchone()[0]
+
+
+def moisture(connect, field_id):
+    with closing(connect()) as conn, conn:
+        return conn.execute('SELECT soil_moisture FROM fields WHERE id = ?', (field_id,)).fetchone()[0]
+
+
+def test_due_record_runs_then_completes_and_waters_the_field(connect):
+    changes = []
+    scheduler = IrrigationScheduler(connect, CFG, on_change=lambda started, completed: changes.append((started, completed)))
+    now = datetime.now()
+    record = add_record(connect, 1, now - timedelta(minutes=10), duration=5, volume=800)
+    later = add_record(connect, 1, now + timedelta(hours=1), duration=5)
+
+    assert scheduler._sync() == 2
+    started, completed = scheduler.dispatch(scheduler._pop_due(time.time()))
+    assert [r for r, _ in started] == [record] and completed == []
+    assert status(connect, record) == 'Running'
+
+    # The completion was queued at start + duration, already in the past.
+    started, completed = scheduler.dispatch(scheduler._pop_due(time.time()))
+    assert started == [] and completed == [record]
+    assert status(connect, record) == 'Completed'
+    assert moisture(connect, 1) == 50.0 + moisture_gain(800)
+
+    assert status(connect, later) == 'Scheduled'
+    assert scheduler.stats['pending'] == 1
+    assert changes == [([record], []), ([], [record])]
+
+
+def test_running_record_is_recovered_as_a_completion(connect):
+    record = add_record(connect, 2, datetime.now() - timedelta(minutes=30), duration=10, volume=5000, status='Running')
+    scheduler = IrrigationScheduler(connect, CFG)
+    scheduler._sync()
+    assert [(job[2], job[3]) for job in scheduler._heap] == [(record, COMPLETE)]
+
+    scheduler.dispatch(scheduler._pop_due(time.time()))
+    assert status(connect, record) == 'Completed'
+    assert moisture(connect, 2) == 100  # capped
+
+
+def test_transitions_apply_once(connect):
+    record = add_record(connect, 1, datetime.now() - timedelta(minutes=1), duration=0)
+    scheduler = IrrigationScheduler(connect, CFG)
+    scheduler._sync()
+    scheduler._sync()  # already queued: not pushed twice
+    assert len(scheduler._heap) == 1
+
+    stale = [(0, 0, record, START, datetime.now())]
+    scheduler.dispatch(scheduler._pop_due(time.time()))
+    assert scheduler.dispatch(stale) == ([], [])
+    assert scheduler.stats['started'] == 1
+
+
+def test_bad_volume_does_not_hold_up_the_batch(connect):
+    past = datetime.now() - timedelta(minutes=10)
+    bad = add_record(connect, 1, past, duration=1, volume='lots', status='Running')
+    good = add_record(connect, 2, past, duration=1, volume=300, status='Running')
+    scheduler = IrrigationScheduler(connect, CFG)
+    scheduler._sync()
+
+    _, completed = scheduler.dispatch(scheduler._pop_due(time.time()))
+    assert sorted(completed) == [bad, good]
+    assert (status(connect, bad), status(connect, good)) == ('Completed', 'Completed')
+    assert (moisture(connect, 1), moisture(connect, 2)) == (50.0, 98.0)
+
+
+def test_unreadable_records_are_skipped_on_sync(connect):
+    now = datetime.now() - timedelta(minutes=1)
+    add_record(connect, 1, now, duration='twenty', status='Running')
+    good = add_record(connect, 1, now, duration=5)
+    scheduler = IrrigationScheduler(connect, CFG)
+    assert scheduler._sync() == 2
+    assert [job[2] for job in scheduler._heap] == [good]
+
+
+def test_sync_is_a_no_op_without_a_dispatcher(connect):
+    add_record(connect, 1, datetime.now() + timedelta(hours=1), duration=5)
+    scheduler = IrrigationScheduler(connect, CFG)
+    assert scheduler.sync() == 0 and scheduler._heap == []
+
+    scheduler.start()
+    try:
+        add_record(connect, 2, datetime.now() + timedelta(hours=1), duration=5)
+        assert scheduler.sync() == 2 and scheduler.stats['pending'] == 2
+    finally:
+        scheduler.stop(timeout=5)
+
+
+def test_start_survives_a_failing_first_sync():
+    def broken():
+        raise sqlite3.OperationalError('unable to open database file')
+
+    scheduler = IrrigationScheduler(broken, CFG)
+    scheduler.start()
+    try:
+        assert scheduler._thread.is_alive()
+        assert 'unable to open' in scheduler.stats['last_error']
+    finally:
+        scheduler.stop(timeout=5)
+
+
+def test_dispatcher_thread_completes_a_scheduled_run(connect):
+    scheduler = IrrigationScheduler(connect, CFG)
+    scheduler.start()
+    try:
+        start = datetime.now() + timedelta(seconds=0.2)
+        record = add_record(connect, 1, start, duration=0)
+        scheduler.schedule(record, start, 0)
+        deadline = time.monotonic() + 5
+        while status(connect, record) != 'Completed' and time.monotonic() < deadline:
+            time.sleep(0.05)
+    finally:
+        scheduler.stop(timeout=5)
+    assert status(connect, record) == 'Completed'
+    assert scheduler.stats['completed'] == 1 and scheduler.stats['last_error'] is None
+
+
+@pytest.mark.parametrize('body, message', [
+    ({'field_id': 1, 'duration': 'twenty'}, 'duration must be a number'),
+    ({'field_id': 1, 'duration': -5}, 'duration out of range'),
+    ({'field_id': 1, 'duration': True}, 'duration must be a number'),
+    ({'field_id': 1, 'water_volume': 'lots'}, 'water_volume must be a number'),
+    ({'field_id': 1, 'water_volume': 'nan'}, 'water_volume out of range'),
+])
+def test_start_route_rejects_bad_values_before_writing(client, conn, body, message):
+    before = conn.execute('SELECT COUNT(*) FROM irrigation_records').fetchone()[0]
+    response = client.post('/api/irrigation/start', json=body)
+    assert response.status_code == 400 and message in response.get_json()['message']
+    assert conn.execute('SELECT COUNT(*) FROM irrigation_records').fetchone()[0] == before
+
+
+def test_start_route_coerces_numeric_strings(client, conn):
+    response = client.post('/api/irrigation/start', json={'field_id': 1, 'duration': '20', 'water_volume': '750.5'})
+    assert response.status_code == 200
+    assert (response.get_json()['duration'], response.get_json()['water_volume']) == (20, 750.5)
+
+    record_id, duration, volume = conn.execute('SELECT id, duration_minutes, water_volume_liters FROM irrigation_records '
+                                               'ORDER BY id DESC LIMIT 1').fetchone()
+    conn.execute('DELETE FROM irrigation_records WHERE id = ?', (record_id,))
+    conn.commit()
+    assert (duration, volume) == (20, 750.5)
@@ -0,0 +1,100 @@
+import pytest
+
+from pagination import PaginationError, decode_cursor, encode_cursor
+
+RANK = {'Critical': 4, 'High': 3, 'Medium': 2, 'Low': 1}
+
+
+def walk(client, path, **params):
+    """Every item of a paged route, following next_cursor; also the number of pages."""
+    items, pages, cursor = [], 0, None
+    while True:
+        query = dict(params, **({'cursor': cursor} if cursor else {}))
+        response = client.get(path, query_string=query)
+        assert response.status_code == 200, response.get_json()
+        body = response.get_json()
+        items.extend(body['items'])
+        pages += 1
+        cursor = body['next_cursor']
+        if cursor is None:
+            return items, pages
+
+
+@pytest.fixture(scope='module')
+def field_alerts(app_module):
+    client = app_module.app.test_client()
+    for i, priority in enumerate(['Low', 'High', 'Medium', 'Critical', 'High', 'Low', 'Medium']):
+        client.post('/api/alerts', json={'field_id': 4, 'alert_type': 'Paging', 'message': f'paging {i}',
+                                         'recommendation': '-', 'priority': priority})
+    return 7
+
+
+def test_cursor_round_trip():
+    key = [3, '2026-01-01 10:00:00.5', 42]
+    token = encode_cursor(key)
+    assert '=' not in token
+    assert decode_cursor(token, 3) == key
+    with pytest.raises(PaginationError):
+        decode_cursor(token, 2)
+
+
+def test_fields_pages_cover_every_field_once(client):
+    everything = client.get('/api/fields', query_string={'limit': 1000}).get_json()
+    assert everything['next_cursor'] is None and everything['farm'] == 'default'
+
+    items, pages = walk(client, '/api/fields', limit=1)
+    assert items == everything['items']
+    assert pages == len(items)
+    assert [f['id'] for f in items] == sorted(f['id'] for f in items)
+
+
+def test_fields_filter_by_crop(client, conn):
+    items, _ = walk(client, '/api/fields', crop='Corn', limit=1)
+    corn = [r[0] for r in conn.execute("SELECT id FROM fields WHERE crop = 'Corn' ORDER BY id")]
+    assert corn and [f['id'] for f in items] == corn
+
+
+def test_alert_pages_match_one_big_page(client, field_alerts):
+    full = client.get('/api/alerts', query_string={'field_id': 4, 'limit': 1000}).get_json()['items']
+    assert len(full) >= field_alerts
+
+    items, pages = walk(client, '/api/alerts', field_id=4, limit=3)
+    assert items == full
+    assert pages == -(-len(full) // 3)
+    ranks = [RANK[a['priority']] for a in items]
+    assert ranks == sorted(ranks, reverse=True)
+
+
+def test_alert_cursor_is_stable_when_earlier_rows_go_away(client, field_alerts):
+    first = client.get('/api/alerts', query_string={'field_id': 4, 'limit': 2}).get_json()
+    rest, _ = walk(client, '/api/alerts', field_id=4, limit=1000)
+    expected = rest[2:]
+
+    # Resolving a row already shown must not shift the next page (no OFFSET).
+    assert client.put(f"/api/alerts/{first['items'][0]['id']}/resolve").status_code == 200
+    second = client.get('/api/alerts', query_string={'field_id': 4, 'limit': 1000,
+                                                     'cursor': first['next_cursor']}).get_json()
+    assert second['items'] == expected
+
+
+def test_alert_priority_filter(client, field_alerts):
+    items, _ = walk(client, '/api/alerts', field_id=4, priority='high', limit=1)
+    assert items and {a['priority'] for a in items} == {'High'}
+
+
+@pytest.mark.parametrize('path, params', [
+    ('/api/fields', {'cursor': 'not-a-cursor!'}),
+    ('/api/fields', {'cursor': encode_cursor(['abc'])}),
+    ('/api/fields', {'cursor': encode_cursor([1, 2])}),
+    ('/api/fields', {'limit': 0}),
+    ('/api/fields', {'limit': 'ten'}),
+    ('/api/alerts', {'cursor': encode_cursor([3, '2026-01-01', 'x'])}),
+    ('/api/alerts', {'cursor': encode_cursor({'id': 1})}),
+    ('/api/alerts', {'priority': 'urgent'}),
+    ('/api/alerts', {'field_id': 'abc'}),
+    ('/api/alerts', {'start': 'last week'}),
+])
+def test_bad_paging_arguments_are_400(client, path, params):
+    response = client.get(path, query_string=params)
+    assert response.status_code == 400
+    assert 'error' in response.get_json()
@@ -0,0 +1,87 @@
+"""The hot read routes must be served from indexes.
+
+Each route is driven through the test client while every pooled
+connection traces its SQL; EXPLAIN QUERY PLAN of each SELECT that touches a
+time-series table must seek an index (SEARCH ... USING [COVERING] INDEX or
+the primary key), never SCAN it or sort it in a temp b-tree.
+"""
+import re
+
+import pytest
+
+HOT_ROUTES = [
+    '/api/dashboard',
+    '/api/field/1',
+    '/api/npk-levels/1',
+    '/api/irrigation/history/1',
+    '/api/crop-yield-forecast',
+    '/api/alerts',
+    '/api/alerts?priority=high',
+    '/api/alerts?field_id=1',
+    '/api/alerts?start=2024-01-01&end=2030-01-01',
+    '/api/weather',
+]
+
+INDEXED_TABLES = ('npk_levels', 'irrigation_records', 'crop_yield_forecast', 'alerts', 'weather')
+
+TABLE_REF = re.compile(r'\b(?:FROM|JOIN)\s+(\w+)(?:\s+(?:AS\s+)?(?!WHERE|JOIN|ON|ORDER|GROUP|LIMIT|LEFT|INNER)(\w+))?',
+                       re.IGNORECASE)
+
+
+def indexed_names(sql):
+    """Names (tables and aliases) the plan may use for time-series tables, partitions included."""
+    names = set()
+    for table, alias in TABLE_REF.findall(sql):
+        if table.startswith(INDEXED_TABLES):
+            names.update(filter(None, (table, alias)))
+    return names
+
+
+def plan_problems(conn, sql):
+    names = indexed_names(sql)
+    problems = []
+    for row in conn.execute('EXPLAIN QUERY PLAN ' + sql):
+        detail = row[3]
+        if 'USE TEMP B-TREE' in detail:
+            problems.append(detail)
+            continue
+        words = detail.split()
+        if len(words) < 2 or words[0] not in ('SCAN', 'SEARCH') or words[1] not in names:
+            continue
+        if words[0] == 'SCAN' or not re.search(r'USING (COVERING INDEX|INDEX|INTEGER PRIMARY KEY|PRIMARY KEY)', detail):
+            problems.append(detail)
+    return problems
+
+
+@pytest.fixture(scope='module')
+def traced(app_module):
+    pool = app_module.db_pool.farm_instance('default')
+    statements = []
+    conns = [pool.acquire() for _ in range(pool.size)]
+    for conn in conns:
+        conn.set_trace_callback(statements.append)
+        conn.close()
+    yield statements
+    conns = [pool.acquire() for _ in range(pool.size)]
+    for conn in conns:
+        conn.set_trace_callback(None)
+        conn.close()
+
+
+def test_plan_checker_rejects_a_full_scan(conn):
+    assert plan_problems(conn, 'SELECT * FROM alerts WHERE message = 1')
+    assert plan_problems(conn, 'SELECT * FROM npk_levels n ORDER BY potassium')
+    assert not plan_problems(conn, 'SELECT * FROM npk_levels WHERE id = 1')
+
+
+@pytest.mark.parametrize('route', HOT_ROUTES)
+def test_hot_route_queries_use_indexes(app_module, client, traced, route):
+    del traced[:]
+    assert client.get(route).status_code == 200
+    selects = [s for s in traced if s.lstrip().upper().startswith('SELECT') and indexed_names(s)]
+    check = app_module.get_db()
+    try:
+        problems = {' '.join(sql.split()): plan_problems(check, sql) for sql in selects}
+    finally:
+        check.close()
+    assert not {sql: p for sql, p in problems.items() if p}
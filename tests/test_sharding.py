@@ -0,0 +1,102 @@
+from datetime import datetime
+
+import pytest
+
+from sharding import DEFAULT_FARM, FarmLocal, ShardMap, UnknownFarm, current_farm, use_farm
+
+
+def test_shard_map_sources(tmp_path):
+    for name in ('north.db', 'south.db', 'bad name.db', 'notes.txt'):
+        (tmp_path / name).touch()
+    shards = ShardMap('main.db', {'east': str(tmp_path / 'e.db')}, str(tmp_path))
+
+    assert shards.farms() == [DEFAULT_FARM, 'north', 'south', 'east']
+    assert shards.path('north') == str(tmp_path / 'north.db')
+    assert shards.resolve(None) == DEFAULT_FARM
+    with pytest.raises(UnknownFarm):
+        shards.resolve('west')
+
+
+@pytest.mark.parametrize('shards', [{'no/slashes': 'x.db'}, {'twin': 'main.db'}])
+def test_shard_map_rejects_bad_keys_and_shared_files(shards):
+    with pytest.raises(ValueError):
+        ShardMap('main.db', shards)
+
+
+def test_fan_out_runs_each_call_in_its_farm():
+    shards = ShardMap('a.db', {'b': 'b.db', 'c': 'c.db'}, fanout_workers=2)
+    assert shards.fan_out(current_farm.get) == {'default': 'default', 'b': 'b', 'c': 'c'}
+    assert current_farm.get() == DEFAULT_FARM
+
+
+def test_farm_local_keeps_one_instance_per_farm():
+    local = FarmLocal(lambda farm: {'farm': farm})
+    with use_farm('b'):
+        b = local.farm_instance()
+        assert local.get('farm') == 'b'
+    assert local.get('farm') == DEFAULT_FARM
+    assert local.farm_instance('b') is b
+
+
+@pytest.fixture(scope='module')
+def north(app_module, tmp_path_factory):
+    """A second farm, added to the running app's shard map with one field."""
+    app_module.shards.paths['north'] = str(tmp_path_factory.mktemp('shards') / 'north.db')
+    with use_farm('north'):
+        app_module.init_db()
+        conn = app_module.get_db()
+        with conn:
+            conn.execute('''INSERT INTO fields (name, crop, area_hectares, soil_moisture, temperature, health_status, created_at, farm)
+                            VALUES ('North Paddy', 'Rice', 40, 70, 24, 'Healthy', ?, 'north')''', (datetime.now(),))
+        conn.close()
+        app_module.refresh_field_state()
+    yield 'north'
+    del app_module.shards.paths['north']
+
+
+def field_names(response):
+    assert response.status_code == 200
+    return [f['name'] for f in response.get_json()['items']]
+
+
+def test_reads_are_routed_by_header_or_query(client, north):
+    assert field_names(client.get('/api/fields', headers={'X-Farm': north})) == ['North Paddy']
+    assert field_names(client.get('/api/fields', query_string={'farm': north})) == ['North Paddy']
+    assert 'North Paddy' not in field_names(client.get('/api/fields'))
+    assert client.get('/api/fields', headers={'X-Farm': north}).get_json()['farm'] == north
+
+
+def test_writes_land_only_in_their_shard(app_module, client, north):
+    with use_farm(DEFAULT_FARM):
+        conn = app_module.get_db()
+        default_moisture = conn.execute('SELECT soil_moisture FROM fields WHERE id = 1').fetchone()[0]
+        conn.close()
+
+    response = client.post('/api/field-update', headers={'X-Farm': north}, json={'field_id': 1, 'soil_moisture': 66.6})
+    assert response.status_code == 200
+
+    with use_farm(north):
+        conn = app_module.get_db()
+        assert conn.execute('SELECT soil_moisture FROM fields WHERE id = 1').fetchone()[0] == 66.6
+        conn.close()
+    with use_farm(DEFAULT_FARM):
+        conn = app_module.get_db()
+        assert conn.execute('SELECT soil_moisture FROM fields WHERE id = 1').fetchone()[0] == default_moisture
+        conn.close()
+
+
+def test_unknown_farm_is_404(client, north):
+    assert client.get('/api/fields', headers={'X-Farm': 'atlantis'}).status_code == 404
+    # farm=* is only for the endpoints that fan out themselves.
+    assert client.get('/api/fields', query_string={'farm': '*'}).status_code == 404
+
+
+def test_all_farms_analytics_sums_every_shard(client, north):
+    per_farm = {f['farm']: f for f in client.get('/api/farms').get_json()}
+    assert set(per_farm) == {DEFAULT_FARM, north}
+    assert per_farm[north]['total_fields'] == 1
+
+    combined = client.get('/api/analytics', query_string={'farm': '*'}).get_json()
+    assert combined['farms'] == 2
+    assert combined['total_fields'] == sum(f['total_fields'] for f in per_farm.values())
+    assert combined['total_area_hectares'] == sum(f['total_area_hectares'] for f in per_farm.values())
@@ -0,0 +1,81 @@
+import numpy as np
+import pytest
+
+from water_budget import LITERS_PER_POINT, MAX_LITERS_PER_JOB, solve
+
+TARGET, LOW = 67.5, 40
+
+
+def test_greedy_fills_highest_benefit_per_litre_first():
+    moisture = np.array([30.0, 55.0, 58.0, 80.0])
+    area = np.array([1.0, 5.0, 2.0, 3.0])
+    allocation, need = solve(moisture, area, 3000, TARGET, LOW, rain_mm=0)
+
+    # Field 0 is below the low threshold (benefit doubled to 2/L), field 1
+    # is largest (5/L); field 3 is already wet and needs nothing.
+    assert need.tolist() == [MAX_LITERS_PER_JOB, 1250, 950, 0]
+    assert allocation.tolist() == [1500, 1250, 250, 0]
+
+
+def test_expected_rain_is_credited_before_allocating():
+    moisture = np.array([60.0, np.nan])
+    allocation, need = solve(moisture, np.array([1.0, 1.0]), 10_000, TARGET, LOW, rain_mm=6)
+    # 6 mm of rain is worth 3 moisture points; a field with no reading is taken as on target.
+    assert need.tolist() == [(TARGET - 63) * LITERS_PER_POINT, 0]
+    assert allocation.tolist() == need.tolist()
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_allocation_respects_cap_and_need(seed):
+    rng = np.random.default_rng(seed)
+    moisture = rng.uniform(20, 90, 200)
+    area = rng.uniform(1, 50, 200)
+    cap = rng.uniform(0, 150_000)
+    allocation, need = solve(moisture, area, cap, TARGET, LOW, rain_mm=rng.uniform(0, 5))
+
+    assert (allocation >= 0).all() and (allocation <= need + 1e-9).all()
+    assert allocation.sum() == pytest.approx(min(cap, need.sum()))
+    # At most one field is partially watered.
+    assert ((allocation > 0) & (allocation < need)).sum() <= 1
+
+
+@pytest.mark.parametrize('body, message', [
+    ({}, 'water_cap_liters'),
+    ({'water_cap_liters': -5}, 'water_cap_liters'),
+    ({'water_cap_liters': 1000, 'target_moisture': 95}, 'optimal band'),
+    ({'water_cap_liters': 1000, 'apply': True, 'start_in_minutes': 'soon'}, 'start_in_minutes'),
+    ({'water_cap_liters': 1000, 'apply': True, 'start_in_minutes': -1}, 'start_in_minutes'),
+    ({'water_cap_liters': 1000, 'horizon_days': 0}, 'horizon_days'),
+    ({'water_cap_liters': 1000, 'horizon_days': 10 ** 12}, 'horizon_days'),
+    ({'water_cap_liters': 1000, 'horizon_days': 2.5}, 'horizon_days'),
+])
+def test_optimize_rejects_bad_input(client, body, message):
+    response = client.post('/api/irrigation/optimize', json=body)
+    assert response.status_code == 400
+    assert message in response.get_json()['message']
+
+
+@pytest.fixture
+def dry_field(conn):
+    """Field 3 below target for one test; its moisture and any records the test schedules are undone after."""
+    moisture = conn.execute('SELECT soil_moisture FROM fields WHERE id = 3').fetchone()[0]
+    last_record = conn.execute('SELECT COALESCE(MAX(id), 0) FROM irrigation_records').fetchone()[0]
+    conn.execute('UPDATE fields SET soil_moisture = 35 WHERE id = 3')
+    conn.commit()
+    yield last_record
+    conn.execute('DELETE FROM irrigation_records WHERE id > ?', (last_record,))
+    conn.execute('UPDATE fields SET soil_moisture = ? WHERE id = 3', (moisture,))
+    conn.commit()
+
+
+def test_optimize_apply_schedules_the_plan(client, conn, dry_field):
+    result = client.post('/api/irrigation/optimize', json={'water_cap_liters': 2000, 'apply': True,
+                                                            'start_in_minutes': 30}).get_json()
+
+    assert result['water_allocated_liters'] <= 2000
+    assert result['scheduled'] == result['fields_planned'] > 0
+    assert 3 in {p['field_id'] for p in result['plan']}
+    rows = conn.execute('SELECT field_id, water_volume_liters, status FROM irrigation_records WHERE id > ? ORDER BY id',
+                        (dry_field,)).fetchall()
+    assert [(r[0], r[1]) for r in rows] == [(p['field_id'], p['water_volume']) for p in result['plan']]
+    assert {r[2] for r in rows} == {'Scheduled'}
@@ -0,0 +1,126 @@
+import sqlite3
+from datetime import date, datetime, timedelta
+
+import pytest
+
+import weather
+from database import MIGRATIONS, migrate
+from weather import ForecastError, forecast_row, parse_forecast, read_forecast, upsert_forecast, validate_forecast
+
+TODAY = date.today()
+NOW = datetime(2026, 1, 1, 6, 0)
+WEATHER_MIGRATION = [m for m in MIGRATIONS if m[2] is weather.SCHEMA]
+
+
+def day(offset, station='test-station', **values):
+    return dict({'station': station, 'forecast_date': (TODAY + timedelta(days=offset)).isoformat(),
+                 'condition': 'Sunny', 'min_temp': 12, 'max_temp': 24, 'humidity': 50, 'precipitation': 0}, **values)
+
+
+@pytest.fixture
+def db():
+    """An in-memory weather table as init_db created it before migration 8."""
+    db = sqlite3.connect(':memory:')
+    db.execute('''CREATE TABLE weather
+                  (id INTEGER PRIMARY KEY, forecast_date DATE, condition TEXT, min_temp REAL, max_temp REAL,
+                   humidity REAL, precipitation REAL, created_at TIMESTAMP)''')
+    yield db
+    db.close()
+
+
+def test_parse_forecast_shapes():
+    assert parse_forecast(b'[{"date": "2026-05-01"}]', 'application/json') == [{'date': '2026-05-01'}]
+    assert parse_forecast('{"station": "hill", "forecast": [{"date": "2026-05-01"}, {"station": "vale"}]}', None) == [
+        {'station': 'hill', 'date': '2026-05-01'}, {'station': 'vale'}]
+
+    csv_body = b'station,forecast_date,condition,min_temp,max_temp,humidity,precipitation\nhill,2026-05-01,Rain,8,14,,12\n'
+    [row] = parse_forecast(csv_body, 'text/csv')
+    assert row == {'station': 'hill', 'forecast_date': '2026-05-01', 'condition': 'Rain', 'min_temp': '8',
+                   'max_temp': '14', 'humidity': None, 'precipitation': '12'}
+    assert forecast_row(row, NOW) == ('hill', '2026-05-01', 'Rain', 8.0, 14.0, None, 12.0, NOW)
+
+
+@pytest.mark.parametrize('body', [b'\xff\xfe', b'{oops', b'{"forecast": 3}', b'"sunny"'])
+def test_parse_forecast_rejects_malformed_bodies(body):
+    with pytest.raises(ForecastError):
+        parse_forecast(body, 'application/json')
+
+
+@pytest.mark.parametrize('values, error', [
+    ({'forecast_date': '01/05/2026'}, 'ISO date'),
+    ({'station': 7}, 'station must be a string'),
+    ({'humidity': 140}, 'humidity out of range'),
+    ({'min_temp': 'cold'}, 'min_temp must be a number'),
+    ({'max_temp': True}, 'max_temp must be a number'),
+    ({'min_temp': 30, 'max_temp': 20}, 'min_temp is above max_temp'),
+    ({'condition': ['Sunny']}, 'condition must be a string'),
+])
+def test_forecast_row_rejects(values, error):
+    with pytest.raises(ForecastError, match=error):
+        forecast_row(day(0, **values), NOW)
+
+
+def test_missing_station_and_precipitation_default():
+    row = forecast_row({'date': '2026-05-01', 'min_temp': 5, 'max_temp': 9}, NOW)
+    assert row[0] == weather.DEFAULT_STATION and row[6] == 0
+
+
+def test_validate_forecast_names_every_bad_row():
+    with pytest.raises(ForecastError) as e:
+        validate_forecast([day(0), day(1, humidity=-1), 'rain', day(3)])
+    assert str(e.value) == 'row 1: humidity out of range [0, 100]; row 2: forecast day must be an object'
+
+
+def test_migration_keeps_the_newest_row_per_day(db):
+    db.executemany('INSERT INTO weather (forecast_date, condition, min_temp, max_temp, humidity, precipitation) '
+                   'VALUES (?, ?, 10, 20, 50, 0)',
+                   [('2026-05-01', 'Old'), ('2026-05-02', 'Only'), ('2026-05-01', 'Older?'), ('2026-05-01', 'Newest')])
+    migrate(db, WEATHER_MIGRATION)
+
+    rows = db.execute('SELECT station, forecast_date, condition FROM weather ORDER BY forecast_date').fetchall()
+    assert rows == [('default', '2026-05-01', 'Newest'), ('default', '2026-05-02', 'Only')]
+    with pytest.raises(sqlite3.IntegrityError):
+        db.execute("INSERT INTO weather (station, forecast_date) VALUES ('default', '2026-05-02')")
+
+
+def test_upsert_replaces_days_and_prunes_the_past(db):
+    migrate(db, WEATHER_MIGRATION)
+    assert upsert_forecast(db, validate_forecast([day(-2), day(0), day(1)])) == (3, 0)
+
+    rows = validate_forecast([day(-1), day(1, condition='Storm', precipitation=40), day(2, station='other')])
+    assert upsert_forecast(db, rows, prune_before=TODAY) == (2, 1)
+
+    assert db.execute('SELECT COUNT(*) FROM weather').fetchone()[0] == 3
+    assert [r[1] for r in read_forecast(db, 'test-station', 5)] == ['Sunny', 'Storm']
+    assert read_forecast(db, 'test-station', 1, start=TODAY + timedelta(days=1))[0][5] == 40
+    assert read_forecast(db, 'nowhere', 5) == []
+
+
+def test_app_database_has_one_row_per_station_day(conn):
+    assert conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'idx_weather_station_date'").fetchone()
+    assert conn.execute('SELECT COUNT(*) FROM (SELECT 1 FROM weather GROUP BY station, forecast_date HAVING COUNT(*) > 1)'
+                        ).fetchone()[0] == 0
+
+
+def test_import_route_upserts_and_reads_back_by_station(client):
+    days = [{k: v for k, v in day(offset).items() if k != 'station'} for offset in range(-1, 7)]
+    result = client.post('/api/weather/import', json={'station': 'import-station', 'forecast': days}).get_json()
+    assert result == {'status': 'success', 'stations': 1, 'upserted': 7, 'skipped_past_days': 1, 'pruned': 0}
+
+    header = 'station,forecast_date,condition,min_temp,max_temp,humidity,precipitation\n'
+    body = header + f'import-station,{TODAY.isoformat()},Fog,3,9,95,\n'
+    assert client.post('/api/weather/import', data=body, content_type='text/csv').get_json()['upserted'] == 1
+
+    forecast = client.get('/api/weather', query_string={'station': 'import-station'}).get_json()
+    assert [f['date'] for f in forecast] == [(TODAY + timedelta(days=k)).isoformat() for k in range(5)]
+    assert (forecast[0]['condition'], forecast[0]['precipitation']) == ('Fog', 0)
+    assert client.get('/api/weather', query_string={'station': 'nowhere'}).get_json() == []
+
+
+def test_import_route_rejects_bad_forecasts(app_module, client, monkeypatch):
+    response = client.post('/api/weather/import', json=[day(0), day(1, max_temp=99)])
+    assert response.status_code == 400 and response.get_json()['message'].startswith('row 1: max_temp')
+    assert client.post('/api/weather/import', data=b'\xff', content_type='application/json').status_code == 400
+
+    monkeypatch.setitem(app_module.app.config, 'WEATHER_IMPORT_MAX_ROWS', 2)
+    assert client.post('/api/weather/import', json=[day(k) for k in range(3)]).status_code == 413
@@ -0,0 +1,109 @@
+"""Farm-wide irrigation planning under a water cap.
+
+Every field's moisture deficit against the target band is computed at
+once, after crediting the rain expected over the planning horizon. Water is
+then allocated with a vectorised greedy fractional knapsack. Water is
+divisible, so ranking fields by benefit per litre and filling in that order
+is optimal for the linear benefit used here (moisture points restored x
+hectares, doubled for fields below the low-moisture threshold).
+"""
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from forecast import RAIN_MOISTURE_GAIN
+
+# Inverse of irrigation_scheduler.moisture_gain: 100 L per moisture point,
+# capped at 15 points per irrigation job.
+LITERS_PER_POINT = 100.0
+MAX_LITERS_PER_JOB = 15 * LITERS_PER_POINT
+
+
+class PlanError(ValueError):
+    pass
+
+
+def expected_rain(conn, days):
+    today = datetime.now().date()
+    rows = conn.execute('''SELECT forecast_date, MAX(precipitation) FROM weather
+                           WHERE forecast_date >= ? AND forecast_date < ? GROUP BY forecast_date''',
+                        (today, today + timedelta(days=days))).fetchall()
+    return float(sum(r[1] or 0 for r in rows))
+
+
+def solve(moisture, area, water_cap, target, low_threshold, rain_mm):
+    """Return (allocated, needed) litres per field, in input order."""
+    effective = np.nan_to_num(moisture, nan=target) + rain_mm * RAIN_MOISTURE_GAIN
+    need = np.clip((target - effective) * LITERS_PER_POINT, 0, MAX_LITERS_PER_JOB)
+
+    urgency = np.where(effective < low_threshold, 2.0, 1.0)
+    value_per_liter = np.nan_to_num(area, nan=1.0) * urgency
+
+    order = np.argsort(-value_per_liter, kind='stable')
+    order = order[need[order] > 0]
+    cumulative = np.cumsum(need[order])
+
+    allocation = np.zeros_like(need)
+    full = cumulative <= water_cap
+    allocation[order[full]] = need[order[full]]
+    # The first field that no longer fits gets whatever water is left.
+    if not full.all():
+        boundary = np.argmin(full)
+        used = cumulative[boundary - 1] if boundary > 0 else 0.0
+        allocation[order[boundary]] = max(0.0, water_cap - used)
+    return allocation, need
+
+
+def plan_irrigation(conn, cfg, water_cap, target=None, horizon_days=None):
+    if water_cap is None or water_cap < 0:
+        raise PlanError('water_cap_liters must be a non-negative number')
+    opt_min = cfg['SOIL_MOISTURE_THRESHOLD_OPTIMAL_MIN']
+    opt_max = cfg['SOIL_MOISTURE_THRESHOLD_OPTIMAL_MAX']
+    target = (opt_min + opt_max) / 2 if target is None else target
+    if not opt_min <= target <= opt_max:
+        raise PlanError(f'target_moisture must be within the optimal band [{opt_min}, {opt_max}]')
+    max_days = cfg['WEATHER_FORECAST_DAYS']
+    if horizon_days is None:
+        horizon_days = max_days
+    elif not isinstance(horizon_days, int) or isinstance(horizon_days, bool) or not 1 <= horizon_days <= max_days:
+        raise PlanError(f'horizon_days must be an integer in [1, {max_days}]')
+
+    rows = conn.execute('SELECT id, soil_moisture, area_hectares FROM fields ORDER BY id').fetchall()
+    ids = np.array([r[0] for r in rows], dtype=np.int64)
+    moisture = np.array([r[1] for r in rows], dtype=np.float64)
+    area = np.array([r[2] for r in rows], dtype=np.float64)
+    rain_mm = expected_rain(conn, horizon_days)
+
+    liters, need = solve(moisture, area, water_cap, target, cfg['SOIL_MOISTURE_THRESHOLD_LOW'], rain_mm)
+    flow = cfg['IRRIGATION_FLOW_RATE_LPM']
+    duration = np.clip(np.ceil(liters / flow), 1, None).astype(np.int64)
+
+    planned = np.flatnonzero(liters > 0)
+    plan = [{
+        'field_id': int(ids[i]),
+        'water_volume': round(float(liters[i]), 1),
+        'duration': int(duration[i]),
+        'current_moisture': None if np.isnan(moisture[i]) else float(moisture[i]),
+        'expected_moisture': round(float(np.nan_to_num(moisture[i], nan=target) + rain_mm * RAIN_MOISTURE_GAIN
+                                         + liters[i] / LITERS_PER_POINT), 1),
+    } for i in planned.tolist()]
+
+    return {
+        'fields_considered': len(rows),
+        'fields_planned': len(plan),
+        'water_cap_liters': water_cap,
+        'water_allocated_liters': round(float(liters.sum()), 1),
+        'water_requested_liters': round(float(need.sum()), 1),
+        'target_moisture': target,
+        'expected_rain_mm': rain_mm,
+        'plan': plan,
+    }
+
+
+def write_plan(conn, plan, start_time):
+    """Bulk-insert planned irrigations as Scheduled records."""
+    now = datetime.now()
+    with conn:
+        conn.executemany('INSERT INTO irrigation_records (field_id, duration_minutes, water_volume_liters, scheduled_time, status, created_at) VALUES (?, ?, ?, ?, ?, ?)',
+                         [(p['field_id'], p['duration'], p['water_volume'], start_time, 'Scheduled', now) for p in plan])
+    return len(plan)
@@ -0,0 +1,145 @@
+"""Weather forecasts: bulk import, upsert and horizon reads.
+
+The weather table holds one row per (station, forecast_date), kept unique
+by migration 8. A full multi-day, multi-station forecast is written with
+one ``executemany`` of ``INSERT ... ON CONFLICT DO UPDATE`` in a single
+transaction, which also prunes days before today. Reads take the next
+``days`` days for one station with a range seek on the unique index.
+"""
+import csv
+import io
+import json
+from datetime import date, datetime, timedelta
+
+DEFAULT_STATION = 'default'
+COLUMNS = ('condition', 'min_temp', 'max_temp', 'humidity', 'precipitation')
+
+# Plausible forecast ranges; anything outside is a bad feed.
+RANGES = {
+    'min_temp': (-80, 70),
+    'max_temp': (-80, 70),
+    'humidity': (0, 100),
+    'precipitation': (0, 2000),
+}
+
+SCHEMA = [
+    f"ALTER TABLE weather ADD COLUMN station TEXT NOT NULL DEFAULT '{DEFAULT_STATION}'",
+    # Keep the newest row of each day: seeding used to append a copy per start.
+    'DELETE FROM weather WHERE id NOT IN (SELECT MAX(id) FROM weather GROUP BY station, forecast_date)',
+    'CREATE UNIQUE INDEX IF NOT EXISTS idx_weather_station_date ON weather (station, forecast_date)',
+]
+
+UPSERT = f'''INSERT INTO weather (station, forecast_date, {", ".join(COLUMNS)}, created_at)
+             VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+             ON CONFLICT (station, forecast_date) DO UPDATE SET
+             {", ".join(f"{c} = excluded.{c}" for c in COLUMNS)}, created_at = excluded.created_at'''
+
+
+class ForecastError(ValueError):
+    pass
+
+
+def parse_forecast(body, content_type):
+    """Decode a request body into a list of forecast-day dicts.
+
+    Accepts CSV with a header row when sent as text/csv, a JSON array, or a
+    JSON object with a ``forecast`` array whose days default to the
+    object's ``station``.
+    """
+    try:
+        text = body.decode('utf-8') if isinstance(body, bytes) else body
+    except UnicodeDecodeError as e:
+        raise ForecastError(f'Body is not valid UTF-8: {e}')
+    if 'csv' in (content_type or ''):
+        return [{k: (v if v != '' else None) for k, v in row.items()} for row in csv.DictReader(io.StringIO(text))]
+
+    try:
+        data = json.loads(text)
+    except ValueError as e:
+        raise ForecastError(f'Invalid JSON: {e}')
+    if isinstance(data, dict):
+        station = data.get('station')
+        data = data.get('forecast')
+        if isinstance(data, list) and station is not None:
+            data = [{'station': station, **day} if isinstance(day, dict) else day for day in data]
+    if not isinstance(data, list):
+        raise ForecastError('Expected a JSON array of forecast days')
+    return data
+
+
+def forecast_row(day, now):
+    """Validate one forecast day and return its upsert parameters."""
+    if not isinstance(day, dict):
+        raise ForecastError('forecast day must be an object')
+    station = day.get('station') or DEFAULT_STATION
+    if not isinstance(station, str) or len(station) > 64:
+        raise ForecastError('station must be a string of at most 64 characters')
+    try:
+        forecast_date = date.fromisoformat(str(day.get('forecast_date') or day.get('date')))
+    except ValueError:
+        raise ForecastError('forecast_date must be an ISO date (YYYY-MM-DD)')
+
+    values = {}
+    for key, (low, high) in RANGES.items():
+        value = day.get(key)
+        if isinstance(value, str):
+            try:
+                value = float(value)
+            except ValueError:
+                raise ForecastError(f'{key} must be a number')
+        if value is None:
+            values[key] = 0 if key == 'precipitation' else None
+            continue
+        if not isinstance(value, (int, float)) or isinstance(value, bool):
+            raise ForecastError(f'{key} must be a number')
+        if not low <= value <= high:
+            raise ForecastError(f'{key} out of range [{low}, {high}]')
+        values[key] = value
+    if values['min_temp'] is not None and values['max_temp'] is not None and values['min_temp'] > values['max_temp']:
+        raise ForecastError('min_temp is above max_temp')
+    condition = day.get('condition')
+    if condition is not None and not isinstance(condition, str):
+        raise ForecastError('condition must be a string')
+
+    return (station, forecast_date.isoformat(), condition, values['min_temp'], values['max_temp'],
+            values['humidity'], values['precipitation'], now)
+
+
+def validate_forecast(days, max_errors=20):
+    """Upsert parameters for every day; ForecastError naming the bad rows if any is invalid."""
+    now = datetime.now()
+    rows, errors = [], []
+    for index, day in enumerate(days):
+        try:
+            rows.append(forecast_row(day, now))
+        except ForecastError as e:
+            errors.append(f'row {index}: {e}')
+            if len(errors) >= max_errors:
+                break
+    if errors:
+        raise ForecastError('; '.join(errors))
+    return rows
+
+
+def upsert_forecast(conn, rows, prune_before=None):
+    """Write ``rows`` in one transaction, dropping days before ``prune_before``.
+
+    Rows for pruned days are not written at all. Returns (rows written, rows pruned).
+    """
+    if prune_before is not None:
+        cutoff = prune_before.isoformat()
+        rows = [row for row in rows if row[1] >= cutoff]
+    with conn:
+        conn.executemany(UPSERT, rows)
+        if prune_before is None:
+            return len(rows), 0
+        return len(rows), conn.execute('DELETE FROM weather WHERE forecast_date < ?', (cutoff,)).rowcount
+
+
+def read_forecast(conn, station, days, start=None):
+    """The station's forecast for ``days`` days from ``start`` (today), oldest first."""
+    start = start or date.today()
+    return conn.execute('''SELECT forecast_date, condition, min_temp, max_temp, humidity, precipitation FROM weather
+                           WHERE station = ? AND forecast_date >= ? AND forecast_date < ?
+                           ORDER BY forecast_date''',
+                        (station, start.isoformat(), (start + timedelta(days=days)).isoformat())).fetchall()
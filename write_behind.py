@@ -0,0 +1,164 @@
+"""Write-behind buffer for high-frequency field updates.
+
+With ``FIELD_UPDATE_WRITE_BEHIND`` on, POST /api/field-update only records
+the update in memory and returns. Updates are coalesced per field (each
+column keeps its last non-null value, like bulk ingestion), and a
+background writer applies every pending field in one transaction every
+``FIELD_UPDATE_FLUSH_INTERVAL`` ms, or as soon as
+``FIELD_UPDATE_FLUSH_BATCH`` fields are waiting. A burst of N ticks from F
+sensors costs one commit instead of N, and the HTTP request no longer waits
+for SQLite's write lock.
+
+At most ``FIELD_UPDATE_MAX_PENDING`` fields are buffered. Beyond that,
+callers wait up to ``FIELD_UPDATE_BLOCK_TIMEOUT`` ms for the writer to
+drain, then get ``BufferFull`` (503). ``stop()`` flushes whatever is still
+pending.
+"""
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class BufferFull(Exception):
+    pass
+
+
+class FieldUpdateBuffer:
+    def __init__(self, connect, cfg, on_flush=None):
+        self.connect = connect
+        self.on_flush = on_flush
+        self.interval = cfg['FIELD_UPDATE_FLUSH_INTERVAL'] / 1000
+        self.flush_batch = cfg['FIELD_UPDATE_FLUSH_BATCH']
+        self.max_pending = cfg['FIELD_UPDATE_MAX_PENDING']
+        self.block_timeout = cfg['FIELD_UPDATE_BLOCK_TIMEOUT'] / 1000
+        self._pending = {}   # field_id -> [soil_moisture, temperature, health_status]
+        self._cond = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        self._stopping = False
+        self._thread = None
+        self.stats = {
+            'running': False,
+            'submitted': 0,
+            'coalesced': 0,
+            'rejected': 0,
+            'flushes': 0,
+            'rows_written': 0,
+            'pending': 0,
+            'last_flush_seconds': None,
+            'max_flush_seconds': 0.0,
+            'last_error': None,
+        }
+
+    def submit(self, field_id, soil_moisture=None, temperature=None, health_status=None):
+        """Queue one update; raises BufferFull if the buffer stays full past the block timeout."""
+        self._ensure_writer()
+        values = (soil_moisture, temperature, health_status)
+        with self._cond:
+            if field_id not in self._pending and len(self._pending) >= self.max_pending:
+                self._cond.notify_all()
+                deadline = time.monotonic() + self.block_timeout
+                while len(self._pending) >= self.max_pending and field_id not in self._pending:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self.stats['rejected'] += 1
+                        raise BufferFull()
+                    self._cond.wait(remaining)
+            current = self._pending.get(field_id)
+            if current is None:
+                self._pending[field_id] = list(values)
+            else:
+                self.stats['coalesced'] += 1
+                for i, value in enumerate(values):
+                    if value is not None:
+                        current[i] = value
+            self.stats['submitted'] += 1
+            self.stats['pending'] = len(self._pending)
+            if len(self._pending) >= self.flush_batch:
+                self._cond.notify_all()
+
+    def flush(self):
+        """Write everything pending in one transaction; returns the number of fields."""
+        with self._flush_lock:
+            with self._cond:
+                pending, self._pending = self._pending, {}
+                self.stats['pending'] = 0
+                self._cond.notify_all()
+            if not pending:
+                return 0
+            start = time.perf_counter()
+            conn = self.connect()
+            try:
+                with conn:
+                    conn.executemany('''UPDATE fields SET soil_moisture = COALESCE(?, soil_moisture),
+                                                          temperature = COALESCE(?, temperature),
+                                                          health_status = COALESCE(?, health_status)
+                                        WHERE id = ?''',
+                                     [(m, t, h, field_id) for field_id, (m, t, h) in pending.items()])
+            except Exception:
+                # Put the batch back under any newer values so nothing is lost.
+                with self._cond:
+                    for field_id, values in pending.items():
+                        newer = self._pending.get(field_id)
+                        if newer is not None:
+                            values = [n if n is not None else v for n, v in zip(newer, values)]
+                        self._pending[field_id] = values
+                    self.stats['pending'] = len(self._pending)
+                raise
+            finally:
+                conn.close()
+            elapsed = time.perf_counter() - start
+            self.stats.update({
+                'flushes': self.stats['flushes'] + 1,
+                'rows_written': self.stats['rows_written'] + len(pending),
+                'last_flush_seconds': round(elapsed, 4),
+                'max_flush_seconds': round(max(self.stats['max_flush_seconds'], elapsed), 4),
+            })
+        if self.on_flush:
+            self.on_flush(list(pending))
+        return len(pending)
+
+    def _loop(self):
+        while True:
+            with self._cond:
+                deadline = time.monotonic() + self.interval
+                while not self._stopping and len(self._pending) < self.flush_batch:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                stopping = self._stopping
+            try:
+                self.flush()
+                self.stats['last_error'] = None
+            except Exception as e:
+                logger.exception('Field update flush failed')
+                self.stats['last_error'] = str(e)
+                if not stopping:
+                    time.sleep(self.interval)
+            if stopping:
+                return
+
+    def _ensure_writer(self):
+        # Started on first use, so every pre-fork worker gets its own writer.
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._stopping = False
+                self._thread = threading.Thread(target=self._loop, name='field-update-writer', daemon=True)
+                self._thread.start()
+                self.stats['running'] = True
+
+    def stop(self, timeout=None):
+        """Stop the writer after a final flush of everything pending."""
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        if self._pending:
+            self.flush()
+        self.stats['running'] = False